@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# الاختبارات تعمل بدون شاشة، ومن جذر المستودع حتى تُستورد ui و utils كما في main.py
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def qapp():
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication(sys.argv)
+    yield app
+    from utils.thread_manager import thread_manager
+    thread_manager.cleanup_all()
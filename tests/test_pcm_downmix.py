@@ -0,0 +1,57 @@
+"""المسار السريع لملفات PCM يعطي نفس الصوت mono الذي يعطيه مسار av"""
+import wave
+
+import numpy as np
+import pytest
+
+from utils import media_analysis
+from utils.media_analysis import Analyzer, LoudnessAnalyzer, analyze_media
+
+SAMPLE_RATE = 48000
+
+
+class SamplesAnalyzer(Analyzer):
+    """يجمع العينات mono كما تصل إلى المحللات"""
+    name = 'samples'
+    media_type = 'audio'
+
+    def __init__(self):
+        self.blocks = []
+
+    def feed(self, samples, time):
+        self.blocks.append(np.array(samples))
+
+    def finish(self):
+        return np.concatenate(self.blocks) if self.blocks else np.zeros(0, np.float32)
+
+
+def write_wav(path, channels, seconds=0.5):
+    # قناة مختلفة التردد والسعة في كل قناة حتى يظهر أي فرق في أوزان الدمج
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    data = np.stack([(0.6 / (c + 1)) * np.sin(2 * np.pi * 220 * (c + 1) * t) for c in range(channels)], axis=1)
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes((data * 32767).astype('<i2').tobytes())
+
+
+def analyze(path):
+    results = analyze_media(str(path), [SamplesAnalyzer(), LoudnessAnalyzer()])
+    return results['samples'], results['loudness']
+
+
+@pytest.mark.parametrize('channels', [1, 2, 6])
+def test_pcm_path_matches_av_downmix(tmp_path, monkeypatch, channels):
+    path = tmp_path / f"tone_{channels}ch.wav"
+    write_wav(path, channels)
+    pcm_samples, pcm_loudness = analyze(path)
+    
+    # نفس الملف عبر فك الترميز في av
+    monkeypatch.setattr(media_analysis, 'open_pcm_source', lambda _path: None)
+    av_samples, av_loudness = analyze(path)
+    
+    assert len(pcm_samples) == len(av_samples)
+    np.testing.assert_allclose(pcm_samples, av_samples, atol=1e-4)
+    assert pcm_loudness['peak_db'] == pytest.approx(av_loudness['peak_db'], abs=0.01)
+    assert pcm_loudness['rms_db'] == pytest.approx(av_loudness['rms_db'], abs=0.01)
@@ -0,0 +1,153 @@
+"""عمليات القص في الخط الزمني عبر نقاط دخولها: الاختصارات والأزرار والمسطرة ومقابض الحواف"""
+import pytest
+from PyQt5.QtCore import Qt, QEvent, QPoint, QPointF
+from PyQt5.QtGui import QMouseEvent
+from PyQt5.QtWidgets import QApplication, QPushButton
+from PyQt5.QtTest import QTest
+
+SOURCE_DURATION = 20.0
+
+
+@pytest.fixture
+def panel(qapp):
+    from ui.timeline_panel import TimelinePanel
+    panel = TimelinePanel()
+    panel.resize(1200, 300)
+    panel.show()
+    qapp.processEvents()
+    yield panel
+    panel.cleanup()
+    panel.close()
+
+
+def add_clip(panel, track, start, duration, src_in=0.0, path="/nonexistent/clip.mp4"):
+    # مقاطع في النموذج مباشرة بدون قراءة ملفات
+    source = panel.store.source_id(path, SOURCE_DURATION)
+    return panel.store.add_clip(source, track, start, duration, src_in=src_in)
+
+
+def button(panel, text):
+    return next(b for b in panel.findChildren(QPushButton) if b.text() == text)
+
+
+def send_mouse(view, kind, scene_x, scene_y, buttons=Qt.LeftButton, button=Qt.LeftButton,
+               modifiers=Qt.NoModifier):
+    pos = view.mapFromScene(QPointF(scene_x, scene_y))
+    event = QMouseEvent(kind, QPointF(pos), QPointF(pos), QPointF(view.viewport().mapToGlobal(pos)),
+                        button, buttons, modifiers)
+    QApplication.sendEvent(view.viewport(), event)
+
+
+def drag(panel, from_x, to_x, y, modifiers=Qt.NoModifier):
+    """سحب بالفأرة داخل العرض بين موضعين في المشهد"""
+    send_mouse(panel.view, QEvent.MouseButtonPress, from_x, y, modifiers=modifiers)
+    send_mouse(panel.view, QEvent.MouseMove, (from_x + to_x) / 2, y, modifiers=modifiers)
+    send_mouse(panel.view, QEvent.MouseMove, to_x, y, modifiers=modifiers)
+    send_mouse(panel.view, QEvent.MouseButtonRelease, to_x, y, buttons=Qt.NoButton, modifiers=modifiers)
+
+
+def test_ruler_click_moves_playhead(panel):
+    header = panel.timeline_header
+    # المسطرة مزاحة بإطار العرض حتى تتطابق مع المشهد
+    x = 250 - header.offset
+    QTest.mouseClick(header, Qt.LeftButton, pos=QPoint(x, 10))
+    assert panel.playhead == pytest.approx(2.5)
+    assert panel.snap_engine.playhead == pytest.approx(2.5)
+    assert panel.view.playhead_x == pytest.approx(250)
+
+
+def test_split_shortcut_splits_selected_at_playhead(panel):
+    first = add_clip(panel, 0, 0.0, 4.0)
+    other = add_clip(panel, 0, 5.0, 4.0)
+    panel.store.select_only([first])
+    panel.set_playhead(1.5)
+    panel.view.setFocus()
+    QTest.keyClick(panel.view, Qt.Key_S)
+    
+    assert len(panel.store) == 3
+    assert panel.store.end_of(first) == pytest.approx(1.5)
+    tail = panel.store.at(0, 2.0)
+    assert tail not in (None, first, other)
+    assert panel.store.start_of(tail) == pytest.approx(1.5)
+    assert panel.store.clips['src_in'][tail] == pytest.approx(1.5)
+    # المقطع غير المحدد لا يتأثر
+    assert panel.store.start_of(other) == pytest.approx(5.0)
+    assert panel.store.end_of(other) == pytest.approx(9.0)
+
+
+def test_split_button_ignores_selection_outside_playhead(panel):
+    clip = add_clip(panel, 0, 0.0, 4.0)
+    panel.store.select_only([clip])
+    panel.set_playhead(6.0)
+    button(panel, "Split").click()
+    assert len(panel.store) == 1
+    assert panel.store.end_of(clip) == pytest.approx(4.0)
+
+
+def test_razor_cuts_every_track_at_playhead(panel):
+    panel.add_track()
+    add_clip(panel, 0, 0.0, 4.0)
+    add_clip(panel, 1, 1.0, 4.0)
+    panel.set_playhead(2.0)
+    panel.view.setFocus()
+    QTest.keyClick(panel.view, Qt.Key_K, Qt.ControlModifier)
+    assert len(panel.store) == 4
+    for track in range(2):
+        assert panel.store.at(track, 1.99) != panel.store.at(track, 2.01)
+    
+    button(panel, "Razor").click()  # نفس النقطة: لا شيء يُقص مرة أخرى
+    assert len(panel.store) == 4
+
+
+def test_left_edge_drag_trims_start(panel):
+    clip = add_clip(panel, 0, 2.0, 4.0)
+    y = panel.track_y(0) + 30
+    drag(panel, 201, 251, y)
+    assert panel.store.start_of(clip) == pytest.approx(2.5)
+    assert panel.store.end_of(clip) == pytest.approx(6.0)
+    assert panel.store.clips['src_in'][clip] == pytest.approx(0.5)
+    # العنصر الممسوك بقي مربوطاً بالمقطع بعد تغير سجله
+    item = panel.bound_items[clip]
+    assert item.clip_id == clip and item.duration == pytest.approx(3.5)
+    assert item.pos().x() == pytest.approx(250)
+
+
+def test_left_edge_drag_stops_at_previous_clip(panel):
+    add_clip(panel, 0, 0.0, 1.0)
+    clip = add_clip(panel, 0, 3.0, 4.0, src_in=3.0)  # مساحة في المصدر قبل نقطة الدخول
+    drag(panel, 301, 51, panel.track_y(0) + 30)
+    assert panel.store.start_of(clip) == pytest.approx(1.0)
+
+
+def test_right_edge_drag_trims_end_without_overlap(panel):
+    clip = add_clip(panel, 0, 0.0, 4.0)
+    follower = add_clip(panel, 0, 5.0, 2.0)
+    y = panel.track_y(0) + 30
+    drag(panel, 399, 349, y)
+    assert panel.store.end_of(clip) == pytest.approx(3.5)
+    
+    # التمديد يتوقف عند بداية المقطع التالي ولا يزيحه
+    drag(panel, 349, 649, y)
+    assert panel.store.end_of(clip) == pytest.approx(5.0)
+    assert panel.store.start_of(follower) == pytest.approx(5.0)
+
+
+def test_shift_right_edge_drag_ripple_trims(panel):
+    clip = add_clip(panel, 0, 0.0, 4.0)
+    follower = add_clip(panel, 0, 5.0, 2.0)
+    y = panel.track_y(0) + 30
+    drag(panel, 399, 599, y, Qt.ShiftModifier)
+    assert panel.store.end_of(clip) == pytest.approx(6.0)
+    # ما بعد المقطع يُزاح بنفس الفرق فتبقى الفجوة بينهما
+    assert panel.store.start_of(follower) == pytest.approx(7.0)
+    
+    drag(panel, 599, 299, y, Qt.ShiftModifier)
+    assert panel.store.end_of(clip) == pytest.approx(3.0)
+    assert panel.store.start_of(follower) == pytest.approx(4.0)
+
+
+def test_middle_drag_still_moves_clip(panel):
+    clip = add_clip(panel, 0, 0.0, 4.0)
+    drag(panel, 200, 300, panel.track_y(0) + 30)
+    assert panel.store.start_of(clip) == pytest.approx(1.0)
+    assert panel.store.end_of(clip) == pytest.approx(5.0)
@@ -6,7 +6,10 @@ from .media_panel import MediaPanel
 from .player_panel import PlayerPanel
 from .timeline_panel import TimelinePanel
 import os
-import shutil
+from utils.thumbnail_cache import thumbnail_cache
+from utils.thread_manager import thread_manager
+from utils.frame_server import frame_server
+from utils.proxy_manager import proxy_manager
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -70,6 +73,7 @@ class MainWindow(QMainWindow):
         self.timeline_panel.setMinimumHeight(180)  # زيادة الحد الأدنى للارتفاع
         self.timeline_panel.setMaximumHeight(300)  # زيادة الحد الأقصى للارتفاع
         main_layout.addWidget(self.timeline_panel)
+        self.player_panel.set_timeline(self.timeline_panel.store, self.timeline_panel.timeline_header.frame_rate)
         
         # تعيين نسب التقسيم الأولية (تحسين توزيع المساحات)
         horizontal_splitter.setSizes([250, 950])  # 20% للميديا، 80% للباقي
@@ -87,19 +91,20 @@ class MainWindow(QMainWindow):
             self.apply_theme(self.available_themes[0])
     
     def closeEvent(self, event):
-        """حفظ الإعدادات وحذف الصور المصغرة عند إغلاق البرنامج"""
+        """حفظ الإعدادات عند إغلاق البرنامج"""
         # حفظ التيم الحالي
         current_theme = self.settings.value("theme", "Light Modern")
         self.settings.setValue("theme", current_theme)
         
-        # حذف مجلد الصور المصغرة
-        thumbnails_dir = "resources/thumbnails"
-        if os.path.exists(thumbnails_dir):
-            try:
-                shutil.rmtree(thumbnails_dir)
-                print("Thumbnails directory deleted successfully")
-            except Exception as e:
-                print(f"Error deleting thumbnails directory: {e}")
+        # إيقاف المهام الخلفية بشكل تعاوني
+        self.timeline_panel.cleanup()
+        self.player_panel.cleanup()
+        frame_server.cleanup()
+        proxy_manager.cleanup()
+        thread_manager.cleanup_all()
+        
+        # كاش الصور المصغرة يبقى بين مرات التشغيل، نكتفي بحفظ أوقات الاستخدام
+        thumbnail_cache.flush()
         
         event.accept()
     
@@ -237,7 +242,7 @@ class MainWindow(QMainWindow):
             self.history_index = -1
             
             # مسح لوحة الميديا
-            self.media_panel.media_list.clear()
+            self.media_panel.clear()
             
             # مسح التايم لاين
             # سيتم تنفيذ هذا لاحقاً
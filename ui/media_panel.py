@@ -1,82 +1,80 @@
 import os
+import io
 import cv2
 from PIL import Image, ImageDraw, ImageFont
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QPushButton, QListWidget, 
                             QAbstractItemView, QFileDialog, QMessageBox, 
                             QListWidgetItem, QMenu, QAction, QInputDialog)
-from PyQt5.QtCore import Qt, QSize, QPoint, QThread, pyqtSignal
+from PyQt5.QtCore import Qt, QSize, QPoint, QTimer
 from PyQt5.QtGui import QIcon, QPixmap, QFont, QImage, QPainter
 import time
+from utils.thumbnail_cache import thumbnail_cache
+from utils.thread_manager import thread_manager, PRIORITY_LOW, PRIORITY_VISIBLE
+from utils.proxy_manager import proxy_manager
 
-class ThumbnailThread(QThread):
-    """خيط منفصل لإنشاء الصور المصغرة"""
-    thumbnail_ready = pyqtSignal(str, object)  # إشارة عند اكتمال الصورة المصغرة
-    
-    def __init__(self, file_path, file_ext, parent=None):
-        super().__init__(parent)
-        self.file_path = file_path
-        self.file_ext = file_ext
-    
-    def run(self):
-        """إنشاء الصورة المصغرة في خيط منفصل"""
-        thumbnail = self.create_thumbnail(self.file_path, self.file_ext)
-        self.thumbnail_ready.emit(self.file_path, thumbnail)
-    
-    def create_thumbnail(self, file_path, file_ext):
-        """إنشاء صورة مصغرة للملف"""
-        try:
-            # إنشاء مسار للصورة المصغرة
-            file_hash = str(hash(file_path))
-            thumbnail_path = f"resources/thumbnails/{file_hash}.jpg"
-            
-            # إذا كانت الصورة المصغرة موجودة بالفعل، أرجعها
-            if os.path.exists(thumbnail_path) and os.path.getsize(thumbnail_path) > 0:
-                return thumbnail_path
-            
-            # إنشاء صورة مصغرة حسب نوع الملف
-            if file_ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff']:
-                # للصور، قم بتغيير الحجم مباشرة
-                with Image.open(file_path) as img:
-                    img.thumbnail((80, 80))
-                    img.save(thumbnail_path, quality=95)
-                return thumbnail_path
-            
-            elif file_ext in ['.mp4', '.avi', '.mov', '.mkv']:
-                # للفيديو، استخدم إطارًا أول
-                cap = cv2.VideoCapture(file_path)
-                success, frame = cap.read()
-                if success:
-                    # تحويل من BGR إلى RGB
-                    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    img = Image.fromarray(frame)
-                    img.thumbnail((80, 80))
-                    img.save(thumbnail_path, quality=95)
-                    cap.release()
-                    return thumbnail_path
-                cap.release()
-            
-            elif file_ext in ['.mp3', '.wav']:
-                # للصوت، أنشئ صورة مع اسم الملف
-                img = Image.new('RGB', (80, 80), color=(73, 109, 137))
-                d = ImageDraw.Draw(img)
-                try:
-                    font = ImageFont.truetype("arial.ttf", 12)
-                except:
-                    font = ImageFont.load_default()
-                d.text((10, 10), "AUDIO", fill=(255, 255, 255), font=font)
-                img.save(thumbnail_path, quality=95)
-                return thumbnail_path
-            
+def create_thumbnail(job, file_path, file_ext):
+    """إنشاء صورة مصغرة للملف (QImage في الذاكرة) مع الاستفادة من الكاش الدائم"""
+    try:
+        # المفتاح مبني على بصمة المحتوى فيبقى صالحاً بين مرات التشغيل
+        key = thumbnail_cache.make_key(file_path, 80, 80)
+        
+        # إذا كانت الصورة المصغرة موجودة بالفعل، أرجعها
+        data = thumbnail_cache.get(key)
+        if data:
+            return QImage.fromData(data)
+        
+        if job.is_cancelled():
             return None
-        except Exception as e:
-            print(f"Error creating thumbnail: {e}")
+        
+        # إنشاء صورة مصغرة حسب نوع الملف
+        img = None
+        if file_ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff']:
+            # للصور، قم بتغيير الحجم مباشرة
+            with Image.open(file_path) as src:
+                img = src.convert('RGB')
+                img.thumbnail((80, 80))
+        
+        elif file_ext in ['.mp4', '.avi', '.mov', '.mkv']:
+            # للفيديو، استخدم إطارًا أول
+            cap = cv2.VideoCapture(proxy_manager.resolve_preview_path(file_path))
+            success, frame = cap.read()
+            cap.release()
+            if success:
+                # تحويل من BGR إلى RGB
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                img = Image.fromarray(frame)
+                img.thumbnail((80, 80))
+        
+        elif file_ext in ['.mp3', '.wav']:
+            # للصوت، أنشئ صورة مع اسم الملف
+            img = Image.new('RGB', (80, 80), color=(73, 109, 137))
+            d = ImageDraw.Draw(img)
+            try:
+                font = ImageFont.truetype("arial.ttf", 12)
+            except:
+                font = ImageFont.load_default()
+            d.text((10, 10), "AUDIO", fill=(255, 255, 255), font=font)
+        
+        if img is None or job.is_cancelled():
             return None
+        
+        # الضغط إلى JPEG يتم في الذاكرة فقط لأجل الكاش؛ الواجهة تستلم QImage مباشرة
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=95)
+        thumbnail_cache.put(key, buffer.getvalue())
+        
+        raw = img.tobytes()
+        image = QImage(raw, img.width, img.height, img.width * 3, QImage.Format_RGB888)
+        return image.copy()  # نسخة تملك بياناتها بعد تحرير raw
+    except Exception as e:
+        print(f"Error creating thumbnail: {e}")
+        return None
 
 class MediaPanel(QWidget):
     def __init__(self, main_window):
         super().__init__()
         self.main_window = main_window
-        self.thumbnail_threads = {}  # لتتبع خيوط الصور المصغرة
+        self.thumbnail_jobs = {}  # id(عنصر القائمة) -> العنصر الذي ينتظر صورته المصغرة
         
         # إعدادات اللوحة
         self.setMinimumWidth(200)
@@ -104,6 +102,13 @@ class MediaPanel(QWidget):
         self.media_list.setSpacing(2)  # تقليل المسافة بين العناصر
         layout.addWidget(self.media_list)
         
+        # إعادة ترتيب أولويات الصور المصغرة عند التمرير (مع تجميع الأحداث المتتالية)
+        self.priority_timer = QTimer(self)
+        self.priority_timer.setSingleShot(True)
+        self.priority_timer.setInterval(50)
+        self.priority_timer.timeout.connect(self.update_thumbnail_priorities)
+        self.media_list.verticalScrollBar().valueChanged.connect(self.priority_timer.start)
+        
         # أزرار التحكم
         controls_layout = QVBoxLayout()
         controls_layout.setSpacing(2)  # تقليل المسافات بين الأزرار
@@ -117,9 +122,6 @@ class MediaPanel(QWidget):
         controls_layout.addWidget(properties_btn)
         
         layout.addLayout(controls_layout)
-        
-        # إنشاء مجلد الصور المصغرة إذا لم يكن موجوداً
-        os.makedirs("resources/thumbnails", exist_ok=True)
     
     def add_files(self):
         """إضافة ملفات جديدة إلى القائمة"""
@@ -157,26 +159,44 @@ class MediaPanel(QWidget):
             item.setIcon(QIcon("resources/icons/audio.png"))
         elif file_ext in ['.mp4', '.avi', '.mov', '.mkv']:
             item.setIcon(QIcon("resources/icons/video.png"))
+            # بروكسي للمعاينة في الخلفية (مرة واحدة لكل ملف)
+            proxy_manager.request(file_path)
         
-        # إنشاء الصورة المصغرة في خيط منفصل
-        thread = ThumbnailThread(file_path, file_ext)
-        thread.thumbnail_ready.connect(self.set_thumbnail)
-        self.thumbnail_threads[file_path] = thread
-        thread.start()
+        # إنشاء الصورة المصغرة في مجمع الخيوط المشترك (العناصر الظاهرة أولاً)
+        priority = PRIORITY_VISIBLE if self.is_item_visible(item) else PRIORITY_LOW
+        self.thumbnail_jobs[id(item)] = item
+        thread_manager.submit(
+            self.thumbnail_job_key(item), create_thumbnail, file_path, file_ext,
+            priority=priority,
+            on_finished=lambda _key, image, item=item: self.set_thumbnail(item, image)
+        )
+        self.priority_timer.start()
     
-    def set_thumbnail(self, file_path, thumbnail_path):
+    def set_thumbnail(self, item, image):
         """تعيين الصورة المصغرة للعنصر"""
-        # البحث عن العنصر المطابق للمسار
-        for i in range(self.media_list.count()):
-            item = self.media_list.item(i)
-            if item.data(Qt.UserRole) == file_path:
-                if thumbnail_path and os.path.exists(thumbnail_path):
-                    item.setIcon(QIcon(thumbnail_path))
-                break
-        
-        # حذف الخيط من القائمة
-        if file_path in self.thumbnail_threads:
-            del self.thumbnail_threads[file_path]
+        # العنصر ربما حُذف قبل وصول النتيجة
+        if self.thumbnail_jobs.pop(id(item), None) is None:
+            return
+        if image is not None and not image.isNull():
+            item.setIcon(QIcon(QPixmap.fromImage(image)))
+    
+    def thumbnail_job_key(self, item):
+        """مفتاح مهمة الصورة المصغرة لعنصر في القائمة"""
+        return ('media_thumbnail', id(item))
+    
+    def is_item_visible(self, item):
+        """هل العنصر ظاهر حالياً في القائمة"""
+        return self.media_list.visualItemRect(item).intersects(self.media_list.viewport().rect())
+    
+    def update_thumbnail_priorities(self):
+        """رفع أولوية الصور المصغرة للعناصر الظاهرة وخفضها للباقي"""
+        for item in self.thumbnail_jobs.values():
+            priority = PRIORITY_VISIBLE if self.is_item_visible(item) else PRIORITY_LOW
+            thread_manager.set_priority(self.thumbnail_job_key(item), priority)
+    
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.priority_timer.start()
     
     def remove_selected(self):
         """إزالة العناصر المحددة من القائمة"""
@@ -190,17 +210,21 @@ class MediaPanel(QWidget):
             
             if reply == QMessageBox.Yes:
                 for item in selected_items:
-                    file_path = item.data(Qt.UserRole)
-                    # إيقاف خيط الصورة المصغرة إذا كان يعمل
-                    if file_path in self.thumbnail_threads:
-                        self.thumbnail_threads[file_path].terminate()
-                        self.thumbnail_threads[file_path].wait()
-                        del self.thumbnail_threads[file_path]
+                    # إلغاء مهمة الصورة المصغرة (إلغاء تعاوني بدلاً من terminate)
+                    if self.thumbnail_jobs.pop(id(item), None) is not None:
+                        thread_manager.cancel(self.thumbnail_job_key(item))
                     
                     self.media_list.takeItem(self.media_list.row(item))
                 
                 self.main_window.statusBar().showMessage(f"Removed {len(selected_items)} item(s)", 2000)
     
+    def clear(self):
+        """حذف كل العناصر وإلغاء مهام الصور المصغرة المعلقة"""
+        for item in self.thumbnail_jobs.values():
+            thread_manager.cancel(self.thumbnail_job_key(item))
+        self.thumbnail_jobs.clear()
+        self.media_list.clear()
+    
     def show_properties(self):
         """عرض خصائص العنصر المحدد"""
         selected_items = self.media_list.selectedItems()
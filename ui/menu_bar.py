@@ -211,16 +211,10 @@ class MenuBar(QMenuBar):
         
         if reply == QMessageBox.Yes:
             if hasattr(self.parent, 'timeline_panel'):
-                for track in self.parent.timeline_panel.tracks:
-                    for item in track['items']:
-                        self.parent.timeline_panel.scene.removeItem(item)
-                    track['items'].clear()
-                
-                self.parent.timeline_panel.tracks = []
-                self.parent.timeline_panel.add_track()
+                self.parent.timeline_panel.clear()
             
             if hasattr(self.parent, 'media_panel'):
-                self.parent.media_panel.media_list.clear()
+                self.parent.media_panel.clear()
             
             # الإصلاح هنا
             self.parent.statusBar().showMessage("New project created", 2000)
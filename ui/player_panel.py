@@ -1,9 +1,26 @@
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QSlider, QLabel, QFileDialog
+import os
+
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QSlider, QLabel, QFileDialog, QComboBox
 from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QPixmap
 from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent
-from PyQt5.QtMultimediaWidgets import QVideoWidget
 from PyQt5.QtCore import QUrl
 
+from utils.frame_server import frame_server
+from utils.media_probe import media_probe
+from utils.proxy_manager import proxy_manager
+from utils.playback_engine import PlaybackEngine, PLAYBACK_QUALITIES
+from utils.sequence_source import SequenceSource
+from utils.clip_store import CHANGE_CLIPS, CHANGE_TRACKS
+from utils.thread_manager import thread_manager, PRIORITY_VISIBLE
+
+
+def build_packet_index(job, file_path):
+    """مهمة خلفية: تجهيز فهرس الحزم حتى يصبح السحب على شريط التقدم دقيقاً للإطار"""
+    media_probe.packet_index(file_path, job=job)
+    return None
+
+
 class PlayerPanel(QWidget):
     def __init__(self):
         super().__init__()
@@ -11,8 +28,16 @@ class PlayerPanel(QWidget):
         # إعدادات اللوحة - زيادة الارتفاع
         self.setMinimumHeight(400)
         
-        # إنشاء مشغل الوسائط
-        self.media_player = QMediaPlayer(None, QMediaPlayer.VideoSurface)
+        # مشغل الوسائط للصوت فقط (وموضعه هو الساعة المرجعية)؛ الصورة من محرك التشغيل
+        self.media_player = QMediaPlayer(None)
+        self.playback_engine = PlaybackEngine()
+        self.file_path = None
+        self.has_video = False
+        self.has_audio = False
+        self.timeline_store = None  # نموذج مقاطع الخط الزمني لوضع تشغيل التسلسل
+        self.timeline_frame_rate = 30.0
+        self.scrub_request = None  # آخر إطار طُلب من خادم الإطارات أثناء السحب
+        self.resume_after_scrub = False
         
         # إنشاء التخطيط
         layout = QVBoxLayout(self)
@@ -20,12 +45,12 @@ class PlayerPanel(QWidget):
         layout.setSpacing(2)  # تقليل المسافات بين المكونات
         
         # منطقة عرض الفيديو - زيادة المساحة
-        self.video_widget = QVideoWidget()
-        self.video_widget.setStyleSheet("background-color: #2d2d2d;")
-        layout.addWidget(self.video_widget, 1)  # إضافة عامل تمدد لزيادة المساحة
-        
-        # ربط مشغل الوسائط بعرض الفيديو
-        self.media_player.setVideoOutput(self.video_widget)
+        # تعرض إطارات محرك التشغيل أثناء التشغيل وإطارات خادم الإطارات أثناء السحب
+        self.frame_label = QLabel()
+        self.frame_label.setAlignment(Qt.AlignCenter)
+        self.frame_label.setMinimumSize(1, 1)
+        self.frame_label.setStyleSheet("background-color: #2d2d2d;")
+        layout.addWidget(self.frame_label, 1)  # إضافة عامل تمدد لزيادة المساحة
         
         # أزرار التحكم في المشغل
         controls_layout = QHBoxLayout()
@@ -43,14 +68,30 @@ class PlayerPanel(QWidget):
         self.open_btn.clicked.connect(self.open_media)
         controls_layout.addWidget(self.open_btn)
         
+        # تشغيل تسلسل الخط الزمني بدلاً من الملف المفتوح
+        self.timeline_btn = QPushButton("Timeline")
+        self.timeline_btn.setCheckable(True)
+        self.timeline_btn.setEnabled(False)
+        self.timeline_btn.toggled.connect(self.set_timeline_mode)
+        controls_layout.addWidget(self.timeline_btn)
+        
         controls_layout.addStretch()
         
         # شريط التقدم
         self.progress_slider = QSlider(Qt.Horizontal)
         self.progress_slider.setRange(0, 100)
-        self.progress_slider.sliderMoved.connect(self.set_position)
+        self.progress_slider.sliderPressed.connect(self.start_scrub)
+        self.progress_slider.sliderMoved.connect(self.scrub)
+        self.progress_slider.sliderReleased.connect(self.end_scrub)
         controls_layout.addWidget(self.progress_slider)
         
+        # جودة التشغيل: المسودة تفك وتخزن الإطارات بكسر من دقة العرض
+        self.quality_combo = QComboBox()
+        for name, quality in PLAYBACK_QUALITIES:
+            self.quality_combo.addItem(name, quality)
+        self.quality_combo.currentIndexChanged.connect(self.quality_changed)
+        controls_layout.addWidget(self.quality_combo)
+        
         # زر ملء الشاشة
         self.fullscreen_btn = QPushButton("Fullscreen")
         self.fullscreen_btn.clicked.connect(self.toggle_fullscreen)
@@ -67,6 +108,17 @@ class PlayerPanel(QWidget):
         
         time_layout.addStretch()
         
+        # عدادات مخزن القراءة المسبقة والإطارات المسقطة
+        self.stats_label = QLabel()
+        time_layout.addWidget(self.stats_label)
+        
+        # صوت الخط الزمني غير ممزوج بعد: تنبيه ظاهر في وضع تشغيل التسلسل
+        self.audio_off_label = QLabel("Audio off in timeline mode")
+        self.audio_off_label.setVisible(False)
+        time_layout.addWidget(self.audio_off_label)
+        
+        time_layout.addStretch()
+        
         self.total_time_label = QLabel("00:00:00")
         time_layout.addWidget(self.total_time_label)
         
@@ -74,8 +126,13 @@ class PlayerPanel(QWidget):
         
         # ربط إشارات مشغل الوسائط
         self.media_player.stateChanged.connect(self.media_state_changed)
-        self.media_player.positionChanged.connect(self.position_changed)
-        self.media_player.durationChanged.connect(self.duration_changed)
+        self.media_player.positionChanged.connect(self.media_position_changed)
+        self.media_player.durationChanged.connect(self.media_duration_changed)
+        frame_server.frameReady.connect(self.on_frame_ready)
+        self.playback_engine.frameReady.connect(self.on_playback_frame)
+        self.playback_engine.stateChanged.connect(self.media_state_changed)
+        self.playback_engine.statsChanged.connect(self.show_stats)
+        self.playback_engine.finished.connect(self.media_player.pause)
     
     def open_media(self):
         """فتح ملف وسائط"""
@@ -85,20 +142,108 @@ class PlayerPanel(QWidget):
         
         if file_dialog.exec_():
             file_path = file_dialog.selectedFiles()[0]
-            self.media_player.setMedia(QMediaContent(QUrl.fromLocalFile(file_path)))
+            self.file_path = file_path
+            if self.timeline_btn.isChecked():
+                # يعيد تحميل الملف عند الخروج من وضع الخط الزمني
+                self.timeline_btn.setChecked(False)
+            else:
+                self.load_file(file_path)
+            thread_manager.submit(('player_index', file_path), build_packet_index, file_path,
+                                  priority=PRIORITY_VISIBLE)
+            self.parent().statusBar().showMessage(f"Opened: {os.path.basename(file_path)}", 2000)
+
+    def load_file(self, file_path):
+        """تجهيز الصوت والصورة لملف واحد"""
+        self.pause()
+        info = media_probe.probe(file_path) or {}
+        self.has_video = info.get('has_video', False)
+        self.has_audio = info.get('has_audio', False)
+        self.media_player.setMedia(QMediaContent(QUrl.fromLocalFile(file_path)))
+        self.frame_label.clear()
+        if self.has_video:
+            proxy_manager.request(file_path)
+            # مزامنة الصورة مع الصوت عند وجوده، وإلا ساعة المحرك الداخلية
+            self.playback_engine.set_clock(self.audio_clock if self.has_audio else None)
+            self.playback_engine.open(file_path, self.frame_label.height())
+        else:
+            self.playback_engine.cleanup()
+        self.play_btn.setEnabled(True)
+
+    def set_timeline(self, store, frame_rate=30.0):
+        """ربط المشغل بنموذج مقاطع الخط الزمني"""
+        self.timeline_store = store
+        self.timeline_frame_rate = frame_rate
+        self.timeline_btn.setEnabled(store is not None)
+
+    def set_timeline_mode(self, enabled):
+        """التبديل بين تشغيل الملف المفتوح وتشغيل تسلسل الخط الزمني"""
+        self.pause()
+        timeline_mode = enabled and self.timeline_store is not None
+        self.audio_off_label.setVisible(timeline_mode)
+        if self.timeline_store is not None:
+            self.timeline_store.remove_listener(self.on_timeline_changed)
+        if timeline_mode:
+            # صوت الخط الزمني غير ممزوج بعد: الصورة على ساعة المحرك الداخلية، ومشغل
+            # الوسائط يُفرغ حتى لا يبقى صوت الملف السابق محملاً
+            self.media_player.stop()
+            self.media_player.setMedia(QMediaContent())
+            self.has_video, self.has_audio = True, False
+            self.frame_label.clear()
+            self.playback_engine.set_clock(None)
+            source = SequenceSource(self.timeline_store, self.timeline_frame_rate)
+            self.playback_engine.open_source(source, self.frame_label.height())
+            # المدة تتبع تعديلات الخط الزمني ما دام هذا الوضع مفعلاً
+            self.timeline_store.add_listener(self.on_timeline_changed)
+            self.duration_changed(int(self.timeline_store.end * 1000))
+            self.position_changed(0)
             self.play_btn.setEnabled(True)
-            self.parent().statusBar().showMessage(f"Opened: {file_path.split('/')[-1].split('\\')[-1]}", 2000)
+        elif self.file_path:
+            self.load_file(self.file_path)
+        else:
+            self.playback_engine.cleanup()
+            self.has_video = self.has_audio = False
+            self.frame_label.clear()
+    
+    def on_timeline_changed(self, kinds, clips):
+        """تحديث مدة التسلسل ومدى شريط التقدم بعد تعديل مقاطع الخط الزمني"""
+        if CHANGE_CLIPS in kinds or CHANGE_TRACKS in kinds:
+            self.duration_changed(int(self.timeline_store.end * 1000))
     
+    def is_playing(self):
+        return self.playback_engine.playing or self.media_player.state() == QMediaPlayer.PlayingState
+
+    def audio_clock(self):
+        """موضع الصوت بالثواني كساعة مرجعية للصورة (None إذا لم يكن الصوت يعمل)"""
+        if self.media_player.state() != QMediaPlayer.PlayingState:
+            return None
+        return self.media_player.position() / 1000.0
+
     def toggle_play(self):
         """تبديل حالة التشغيل"""
-        if self.media_player.state() == QMediaPlayer.PlayingState:
-            self.media_player.pause()
+        if self.is_playing():
+            self.pause()
         else:
+            self.play()
+
+    def play(self):
+        if self.has_audio or not self.has_video:
             self.media_player.play()
+        if self.has_video:
+            # الإطارات تُفك بحجم منطقة العرض (تصغير 4K داخل التحويل من YUV)
+            self.playback_engine.set_height(self.frame_label.height())
+            self.playback_engine.play()
+
+    def pause(self):
+        # المحرك أولاً حتى يحفظ موضعه من ساعة الصوت قبل توقفها
+        self.playback_engine.pause()
+        self.media_player.pause()
     
     def stop(self):
         """إيقاف التشغيل"""
         self.media_player.stop()
+        if self.has_video:
+            self.playback_engine.pause()
+            self.playback_engine.seek(0.0)
     
     def toggle_fullscreen(self):
         """تبديل وضع ملء الشاشة"""
@@ -111,16 +256,27 @@ class PlayerPanel(QWidget):
     
     def media_state_changed(self, state):
         """تحديث حالة زر التشغيل"""
-        if self.media_player.state() == QMediaPlayer.PlayingState:
+        if self.is_playing():
             self.play_btn.setText("Pause")
         else:
             self.play_btn.setText("Play")
     
+    def media_position_changed(self, position):
+        # في وضع الخط الزمني مشغل الوسائط فارغ وموضعه لا يخص التسلسل
+        if not self.timeline_btn.isChecked():
+            self.position_changed(position)
+    
+    def media_duration_changed(self, duration):
+        if not self.timeline_btn.isChecked():
+            self.duration_changed(duration)
+    
     def position_changed(self, position):
         """تحديث شريط التقدم"""
         self.progress_slider.setValue(position)
-        
-        # تحديث وقت التشغيل الحالي
+        self.update_time_label(position)
+
+    def update_time_label(self, position):
+        """تحديث وقت التشغيل الحالي"""
         seconds = position // 1000
         minutes = seconds // 60
         hours = minutes // 60
@@ -143,6 +299,71 @@ class PlayerPanel(QWidget):
     def set_position(self, position):
         """تعيين موضع التشغيل"""
         self.media_player.setPosition(position)
+        if self.has_video:
+            self.playback_engine.seek(position / 1000.0)
+
+    def start_scrub(self):
+        """بداية السحب: إيقاف التشغيل مؤقتاً حتى لا يتنافس المشغل مع إطارات السحب"""
+        self.resume_after_scrub = self.is_playing()
+        if self.resume_after_scrub:
+            self.pause()
+
+    def scrub(self, position):
+        """طلب الإطار الدقيق عند الموضع من خادم الإطارات (آخر طلب يفوز)"""
+        self.update_time_label(position)
+        if self.timeline_btn.isChecked():
+            # في وضع الخط الزمني يقفز المحرك مباشرة (آخر قفز يلغي ما قبله) ويعرض أول إطار
+            self.playback_engine.seek(position / 1000.0)
+            return
+        frame = frame_server.frame_at(self.file_path, position / 1000.0) if self.file_path else None
+        if frame is None:
+            # لا يوجد فيديو أو الفهرس لم يجهز بعد: القفز في المشغل مباشرة
+            self.set_position(position)
+            return
+        height = max(1, self.frame_label.height() // self.playback_engine.quality)
+        self.scrub_request = (os.path.abspath(self.file_path), frame, height)
+        image = frame_server.request(self.file_path, frame, height, channel=self)
+        if image is not None:
+            self.show_frame(image)
+
+    def end_scrub(self):
+        """نهاية السحب: قفز واحد فقط في المشغل إلى الموضع النهائي"""
+        frame_server.cancel(channel=self)
+        self.scrub_request = None
+        self.set_position(self.progress_slider.value())
+        if self.resume_after_scrub:
+            self.play()
+
+    def on_frame_ready(self, request, image):
+        if request == self.scrub_request:
+            self.show_frame(image)
+
+    def show_frame(self, image):
+        pixmap = QPixmap.fromImage(image)
+        if pixmap.size() != self.frame_label.size():
+            # تكبير إطارات المسودة بدون تنعيم: أرخص والجودة منخفضة أصلاً
+            transform = Qt.SmoothTransformation if self.playback_engine.quality == 1 else Qt.FastTransformation
+            pixmap = pixmap.scaled(self.frame_label.size(), Qt.KeepAspectRatio, transform)
+        self.frame_label.setPixmap(pixmap)
+
+    def on_playback_frame(self, image, time):
+        self.show_frame(image)
+        if not self.has_audio:
+            # بدون صوت لا تصل مواضع من مشغل الوسائط؛ الإطار المعروض هو الموضع
+            self.position_changed(int(time * 1000))
+
+    def quality_changed(self, index):
+        self.playback_engine.set_quality(self.quality_combo.itemData(index))
+
+    def show_stats(self, stats):
+        self.stats_label.setText(
+            f"Buffer {stats['buffer_fill']}/{stats['buffer_depth']} · Dropped {stats['dropped_frames']}")
+
+    def cleanup(self):
+        """إيقاف محرك التشغيل عند الإغلاق"""
+        if self.timeline_store is not None:
+            self.timeline_store.remove_listener(self.on_timeline_changed)
+        self.playback_engine.shutdown()
     
     def select_all(self):
         """تحديد كل العناصر في لوحة المشغل"""
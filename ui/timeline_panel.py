@@ -2,101 +2,434 @@ from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
                              QMessageBox, QGraphicsView, QGraphicsScene, 
                              QGraphicsItem, QGraphicsRectItem, QMenu, QAction, 
                              QLabel, QFileDialog, QApplication)
-from PyQt5.QtCore import Qt, QRectF, QPointF, QSize, pyqtSignal, QLineF
-from PyQt5.QtGui import QPixmap, QPainter, QColor, QPen, QBrush, QDragEnterEvent, QDropEvent, QImage
+from PyQt5.QtCore import Qt, QRectF, QPointF, QSize, pyqtSignal, QLineF, QTimer
+from PyQt5.QtGui import (QPixmap, QPainter, QColor, QPen, QBrush, QDragEnterEvent, QDropEvent, QImage,
+                         QPixmapCache, QPolygonF, QTransform, QStaticText)
 import os
-import cv2
-import librosa
+import itertools
 import numpy as np
+from utils.media_probe import media_probe
+from utils.media_analysis import analyze_media, PeakPyramidAnalyzer
+from utils.peak_pyramid import PeakPyramid, load_cached_pyramid, store_cached_pyramid
+from utils.thread_manager import thread_manager, PRIORITY_NORMAL, PRIORITY_VISIBLE
+from utils.clip_store import ClipStore, CHANGE_TRACKS, CHANGE_CLIPS, CHANGE_SELECTION
+from utils.snapping import SnapEngine
+from utils.filmstrip import KeyframeFilmstrip, decode_keyframes
+from utils.proxy_manager import proxy_manager
+
+# وحدات المشهد لكل ثانية؛ التكبير تحويل على العرض وليس تغييراً في هندسة العناصر
+PIXELS_PER_SECOND = 100
+# عرض البلاطة الواحدة بالبكسل على الشاشة
+TILE_PIXELS = 256
+# حد كاش البلاطات (كيلوبايت) في QPixmapCache
+TILE_CACHE_KB = 64 * 1024
+# مستوى الموجة الذي يُعتبر صمتاً
+SILENCE_THRESHOLD = 0.05
+# تحت هذا العرض (بالبكسل على الشاشة) يُرسم العنصر كمستطيل مبسط بدون صورة أو موجة
+LOD_MIN_DETAIL_PIXELS = 24
+# عدد الإطارات في خطوة التحريك بالأسهم مع Shift
+NUDGE_FAST_FRAMES = 10
+# عرض مقبض القص عند حافتي العنصر بالبكسل على الشاشة
+TRIM_HANDLE_PIXELS = 6
+# هامش الربط المسبق للعناصر قبل ظهورها (كنسبة من عرض الجزء الظاهر)
+VIEWPORT_MARGIN = 0.5
+# أقصى عدد للعناصر المخفية المحتفظ بها لإعادة الاستخدام
+ITEM_POOL_LIMIT = 256
+# مدة المقطع المؤقتة حتى تُقرأ مدة ملفه (أو إذا تعذرت قراءتها)
+PLACEHOLDER_DURATION = 5.0
+# رقم فريد لكل تحليل مصدر في العملية؛ أرقام المصادر تبدأ من جديد بعد مسح الخط الزمني
+_analysis_generations = itertools.count(1)
+
+def array_to_polygon(xs, ys):
+    """بناء QPolygonF من مصفوفتي NumPy بنسخ مباشر إلى ذاكرة المضلع"""
+    count = len(xs)
+    polygon = QPolygonF()
+    polygon.fill(QPointF(), count)
+    if count:
+        pointer = polygon.data()
+        pointer.setsize(count * 2 * np.dtype(np.float64).itemsize)
+        points = np.frombuffer(pointer, np.float64).reshape(count, 2)
+        points[:, 0] = xs
+        points[:, 1] = ys
+    return polygon
+
+def silence_runs(levels, threshold=SILENCE_THRESHOLD):
+    """فترات الصمت كأزواج (بداية، نهاية) من فهارس الأعمدة المتتالية تحت الحد"""
+    mask = np.concatenate(([0], (levels < threshold).view(np.int8), [0]))
+    edges = np.diff(mask)
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+class SourceAnalysis:
+    """نتائج تحليل ملف مصدر واحد تشترك فيها كل مقاطعه
+
+    المقطع يشير إلى جزء من المصدر بنقطتي src_in/src_out، فالقص والتقسيم لا يعيدان
+    فك الترميز: كل مقطع يأخذ من الهرم وشريط الصور الجزء الواقع بين نقطتيه فقط.
+    """
+    
+    def __init__(self, source, filmstrip=None):
+        self.source = source
+        self.filmstrip = filmstrip  # KeyframeFilmstrip لملفات الفيديو (صور تُفك عند الطلب)
+        self.peaks = None
+        self.packet_index = None    # PacketIndex لملفات الفيديو (زمن كل إطار والإطارات المفتاحية)
+        self.revision = 0           # يزيد مع كل نتيجة جديدة (جزء من مفتاح البلاطات)
+        self.frames_requested = None  # تستدعيه البلاطات عند طلب صور غير جاهزة
+        self.jobs = set()           # مفاتيح مهام فك الصور الجارية
+        self.generation = next(_analysis_generations)  # جزء من مفتاح البلاطات
+    
+    def is_loaded(self):
+        return self.peaks is not None
 
 class TimelineItem(QGraphicsItem):
-    def __init__(self, file_path, video_thumbnail=None, audio_waveform=None, duration_seconds=0, parent=None):
+    """العنصر الرسومي لمقطع ظاهر فقط؛ بياناته في ClipStore ويُعاد استخدامه من مجمع العناصر"""
+    
+    def __init__(self, parent=None):
         super().__init__(parent)
-        self.file_path = file_path
-        self.video_thumbnail = video_thumbnail
-        self.audio_waveform = audio_waveform
-        self.duration = duration_seconds
+        self.store = None
+        self.clip_id = None
+        self.analysis = None  # نتائج تحليل ملف المصدر (مشتركة بين كل مقاطعه)
+        self.file_path = None
+        self.source = -1
+        self.track = -1
+        self.src_in = 0.0
+        self.duration = 0
         self.video_height = 60
         self.audio_height = 40
         self.total_height = self.video_height + self.audio_height
+        self.snap_engine = None  # محرك الالتقاط المشترك للخط الزمني
+        self.timeline = None     # لوحة الخط الزمني التي تنفذ عمليات القص
+        self.drag_start = None   # بداية المقطع في النموذج عند الضغط للسحب
+        self.trim_edge = None    # 'start' أو 'end' أثناء السحب من مقبض القص
+        # أثناء الربط بمقطع لا نعيد كتابة التحديد إلى النموذج
+        self.binding = False
         self.setFlags(QGraphicsItem.ItemIsMovable | QGraphicsItem.ItemSendsGeometryChanges | QGraphicsItem.ItemIsSelectable)
+        # نحتاج exposedRect لرسم البلاطات الظاهرة فقط
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
         self.setAcceptHoverEvents(True)
+    
+    def bind(self, store, clip_id, analysis, y_pos):
+        """ربط العنصر بمقطع من النموذج"""
+        record = store.clips[clip_id]
+        self.prepareGeometryChange()
+        self.store = store
+        self.clip_id = clip_id
+        self.analysis = analysis
+        self.source = int(record['source'])
+        self.track = int(record['track'])
+        self.file_path = store.source_path(self.source)
+        self.src_in = float(record['src_in'])
+        self.duration = float(record['duration'])
+        self.binding = True
+        self.setPos(store.start_of(clip_id) * PIXELS_PER_SECOND, y_pos)
+        self.setSelected(store.is_selected(clip_id))
+        self.binding = False
+        self.update()
+    
+    def unbind(self):
+        self.binding = True
+        self.setSelected(False)
+        self.binding = False
+        self.store = None
+        self.clip_id = None
+        self.analysis = None
+    
+    def matches_record(self):
+        """هل ما زال سجل المقطع في النموذج كما رُبط العنصر (عدا الموضع)"""
+        if self.store is None or not self.store.is_alive(self.clip_id):
+            return False
+        record = self.store.clips[self.clip_id]
+        return (int(record['source']) == self.source and int(record['track']) == self.track
+                and float(record['src_in']) == self.src_in and float(record['duration']) == self.duration)
+    
+    @property
+    def audio_peaks(self):
+        return self.analysis.peaks if self.analysis else None
+    
+    def is_loaded(self):
+        """هل وصل شريط الصور وموجة الصوت من الخيوط الخلفية"""
+        return self.analysis is not None and self.analysis.is_loaded()
+    
+    def analysis_changed(self):
+        """وصلت نتيجة تحليل جديدة لملف المصدر"""
+        self.update()
         
     def boundingRect(self) -> QRectF:
-        width = self.duration * 100  # يمكن تعديل نسبة البكسل لكل ثانية حسب zoom بالـ TimelinePanel
+        width = self.duration * PIXELS_PER_SECOND
         return QRectF(0, 0, width, self.total_height)
     
     def paint(self, painter: QPainter, option, widget=None):
+        # عنصر أُزيح في الفهرس بعملية ripple ولم يُحدّث موضعه بعد
+        if self.position_is_stale():
+            QTimer.singleShot(0, self.sync_position)
+            return
+        
         rect = self.boundingRect()
-        # خلفية العنصر
-        painter.setBrush(QBrush(QColor(40, 40, 40)))
-        painter.setPen(Qt.NoPen)
-        painter.drawRect(rect)
+        exposed = option.exposedRect.intersected(rect)
+        transform = painter.worldTransform()
+        scale_x, scale_y = abs(transform.m11()), abs(transform.m22())
+        if exposed.isEmpty() or scale_x <= 0 or scale_y <= 0:
+            return
+        
+        # عند التصغير الشديد لا فائدة من التفاصيل: مستطيلان بلون ثابت
+        if rect.width() * scale_x < LOD_MIN_DETAIL_PIXELS:
+            painter.fillRect(QRectF(exposed.left(), 0, exposed.width(), self.video_height), QColor(70, 90, 110))
+            painter.fillRect(QRectF(exposed.left(), self.video_height, exposed.width(), self.audio_height),
+                             QColor(25, 60, 80))
+            return
+        
+        # بعد التمرير يصبح الرسم مجرد نسخ لبلاطات جاهزة من الكاش
+        tile_units = TILE_PIXELS / scale_x
+        first = int(exposed.left() // tile_units)
+        last = int(min(exposed.right(), rect.right() - 1e-6) // tile_units)
+        for index in range(first, last + 1):
+            pixmap = self.tile_pixmap(index, scale_x, scale_y)
+            if pixmap.isNull():
+                continue
+            target = QRectF(index * tile_units, 0, pixmap.width() / scale_x, pixmap.height() / scale_y)
+            painter.drawPixmap(target, pixmap, QRectF(pixmap.rect()))
         
-        # رسم الفيديو (صورة مصغرة)
-        if self.video_thumbnail:
-            scaled_video = self.video_thumbnail.scaled(int(rect.width()), self.video_height, Qt.KeepAspectRatioByExpanding, Qt.SmoothTransformation)
-            painter.drawPixmap(0, 0, scaled_video)
+        if self.isSelected():
+            painter.setPen(QPen(QColor(255, 200, 0), 0))
+            painter.setBrush(Qt.NoBrush)
+            painter.drawRect(rect)
+        
+        # عنصر مؤقت: التحليل ما زال يعمل في الخلفية
+        if not self.is_loaded():
+            # النص يُرسم بإحداثيات الشاشة حتى لا يتمدد مع التكبير الأفقي
+            device_rect = transform.mapRect(rect)
+            painter.save()
+            painter.setWorldTransform(QTransform())
+            painter.setPen(QColor(150, 150, 150))
+            painter.drawText(device_rect.adjusted(5, 0, 0, 0), Qt.AlignLeft | Qt.AlignVCenter, "Loading...")
+            painter.restore()
+    
+    def tile_pixmap(self, index, scale_x, scale_y):
+        """البلاطة رقم index عند هذا التكبير: من الكاش أو تُرسم مرة واحدة"""
+        # المفتاح من محتوى المقطع وليس من العنصر، فالعنصر المعاد استخدامه يجد بلاطات مقطعه
+        generation, revision = (self.analysis.generation, self.analysis.revision) if self.analysis else (0, 0)
+        key = (f"clip:{self.source}:{generation}:{revision}:{self.src_in:.5f}:{self.duration:.5f}:"
+               f"{scale_x:.5f}:{scale_y:.5f}:{index}")
+        pixmap = QPixmapCache.find(key)
+        if pixmap is None or pixmap.isNull():
+            pixmap = self.render_tile(index, scale_x, scale_y)
+            QPixmapCache.insert(key, pixmap)
+        return pixmap
+    
+    def render_tile(self, index, scale_x, scale_y):
+        """رسم جزء من العنصر بإحداثيات الشاشة مباشرة (بدون تحجيم عند النسخ)"""
+        clip_pixels = self.boundingRect().width() * scale_x
+        left = index * TILE_PIXELS
+        width = int(np.ceil(min(TILE_PIXELS, clip_pixels - left)))
+        video_height = int(round(self.video_height * scale_y))
+        height = int(round(self.total_height * scale_y))
+        if width <= 0 or height <= 0:
+            return QPixmap()
+        
+        pixmap = QPixmap(width, height)
+        pixmap.fill(QColor(40, 40, 40))
+        painter = QPainter(pixmap)
+        
+        # رسم الفيديو: لكل خانة في الشريط أقرب إطار مفتاحي إلى زمنها داخل المصدر؛
+        # الإطارات غير الجاهزة تُطلب الآن وتُرسم أقرب صورة متاحة مكانها مؤقتاً
+        analysis = self.analysis
+        if analysis is not None and analysis.filmstrip is not None \
+                and analysis.packet_index is not None and clip_pixels > 0:
+            filmstrip = analysis.filmstrip
+            frame_width = filmstrip.frame_width(video_height)
+            seconds_per_pixel = self.duration / clip_pixels
+            for slot in range(left // frame_width, (left + width - 1) // frame_width + 1):
+                x = slot * frame_width
+                source_time = self.src_in + (x + frame_width / 2) * seconds_per_pixel
+                pts = analysis.packet_index.nearest_keyframe(source_time)
+                image = filmstrip.image(pts)
+                if image is None:
+                    image = filmstrip.nearest(pts)
+                if image is not None:
+                    painter.drawImage(QRectF(x - left, 0, frame_width, video_height), image)
+            if filmstrip.requested and analysis.frames_requested is not None:
+                analysis.frames_requested(analysis)
         
         # رسم شريط الصوت
-        audio_rect = QRectF(0, self.video_height, rect.width(), self.audio_height)
-        painter.setBrush(QBrush(QColor(25, 25, 25)))
-        painter.drawRect(audio_rect)
-        
-        if self.audio_waveform:
-            pen_wave = QPen(QColor(0, 180, 255))
-            pen_wave.setWidth(1)
-            painter.setPen(pen_wave)
-            total_points = len(self.audio_waveform)
-            if total_points > 1:
-                step_x = audio_rect.width() / (total_points - 1)
-                for i in range(total_points - 1):
-                    x1 = i * step_x
-                    x2 = (i + 1) * step_x
-                    y1 = audio_rect.bottom() - (self.audio_waveform[i] * audio_rect.height())
-                    y2 = audio_rect.bottom() - (self.audio_waveform[i + 1] * audio_rect.height())
-                    painter.drawLine(QLineF(x1, y1, x2, y2))
+        audio_rect = QRectF(0, video_height, width, height - video_height)
+        painter.fillRect(audio_rect, QColor(25, 25, 25))
+        
+        levels = []
+        if self.audio_peaks is not None and clip_pixels > 0:
+            # الزمن داخل ملف المصدر يبدأ من نقطة دخول المقطع
+            seconds_per_pixel = self.duration / clip_pixels
+            levels = self.audio_peaks.envelope(self.src_in + left * seconds_per_pixel,
+                                               self.src_in + (left + width) * seconds_per_pixel, width)
+        
+        if len(levels):
+            column_width = width / len(levels)
+            # الموجة كخط متعدد واحد بدلاً من خط لكل عمود
+            xs = (np.arange(len(levels)) + 0.5) * column_width
+            ys = audio_rect.bottom() - levels * audio_rect.height()
+            painter.setPen(QPen(QColor(0, 180, 255), 1))
+            painter.drawPolyline(array_to_polygon(xs, ys))
             
-            # تمييز مناطق الصمت (أقل من 0.05) برسم مستطيل شفاف أبيض
-            silence_threshold = 0.05
-            brush_silence = QBrush(QColor(255, 255, 255, 80))
-            painter.setBrush(brush_silence)
-            painter.setPen(Qt.NoPen)
-            in_silence = False
-            silence_start_x = 0
-            for i, amplitude in enumerate(self.audio_waveform):
-                x = i * step_x
-                if amplitude < silence_threshold:
-                    if not in_silence:
-                        in_silence = True
-                        silence_start_x = x
-                else:
-                    if in_silence:
-                        in_silence = False
-                        silence_width = x - silence_start_x
-                        painter.drawRect(silence_start_x, audio_rect.top(), silence_width, audio_rect.height())
-            if in_silence:
-                painter.drawRect(silence_start_x, audio_rect.top(), audio_rect.right() - silence_start_x, audio_rect.height())
+            # تمييز مناطق الصمت برسم مستطيلات شفافة دفعة واحدة
+            starts, ends = silence_runs(levels)
+            if len(starts):
+                painter.setPen(Qt.NoPen)
+                painter.setBrush(QBrush(QColor(255, 255, 255, 80)))
+                painter.drawRects([
+                    QRectF(start * column_width, audio_rect.top(),
+                           (end - start) * column_width, audio_rect.height())
+                    for start, end in zip(starts.tolist(), ends.tolist())
+                ])
+        painter.end()
+        return pixmap
     
     def itemChange(self, change, value):
-        # تقييد الحركة أفقياً فقط حسب الحاجة (y يبقى ثابت)
-        if change == QGraphicsItem.ItemPositionChange:
-            new_pos = value
-            if new_pos.x() < 0:
-                new_pos.setX(0)
-            return new_pos
+        if self.store is not None and not self.binding and change == QGraphicsItem.ItemSelectedHasChanged:
+            self.store.set_selected([self.clip_id], bool(value))
         return super().itemChange(change, value)
     
-    def cleanup(self):
-        """تنظيف الموارد"""
-        pass
+    def view_scale(self):
+        views = self.scene().views() if self.scene() is not None else []
+        return views[0].transform().m11() if views else 1.0
+    
+    def edge_at(self, x):
+        """'start' أو 'end' إذا كان x (بإحداثيات العنصر) على أحد مقبضي القص"""
+        width = self.boundingRect().width()
+        # المقبض لا يتجاوز ثلث العنصر حتى تبقى المقاطع القصيرة قابلة للسحب
+        handle = min(TRIM_HANDLE_PIXELS / self.view_scale(), width / 3)
+        if x <= handle:
+            return 'start'
+        if x >= width - handle:
+            return 'end'
+        return None
+    
+    def hoverMoveEvent(self, event):
+        if self.store is not None and self.timeline is not None and self.edge_at(event.pos().x()):
+            self.setCursor(Qt.SizeHorCursor)
+        else:
+            self.unsetCursor()
+        super().hoverMoveEvent(event)
+    
+    def hoverLeaveEvent(self, event):
+        self.unsetCursor()
+        super().hoverLeaveEvent(event)
+    
+    def mousePressEvent(self, event):
+        self.trim_edge = None
+        if self.store is not None and self.timeline is not None and event.button() == Qt.LeftButton:
+            self.trim_edge = self.edge_at(event.pos().x())
+        if self.trim_edge is not None:
+            # القص لا يمر بمعالجة Qt للسحب؛ التحديد تم في النموذج عند النقر على العرض
+            event.accept()
+            self.drag_start = (self.store.start_of(self.clip_id) if self.trim_edge == 'start'
+                               else self.store.end_of(self.clip_id))
+            return
+        super().mousePressEvent(event)
+        self.drag_start = self.store.start_of(self.clip_id) if self.store is not None else None
+    
+    def mouseMoveEvent(self, event):
+        """السحب يزيح كل المقاطع المحددة في النموذج (الظاهرة وغير الظاهرة) بإزاحة واحدة
+        
+        العناصر لا تتحرك بنفسها؛ تتبع النموذج عند مزامنة الجزء الظاهر.
+        """
+        if self.store is None or self.drag_start is None or not event.buttons() & Qt.LeftButton:
+            return
+        dx = event.scenePos().x() - event.buttonDownScenePos(Qt.LeftButton).x()
+        if self.trim_edge is not None:
+            ripple = bool(event.modifiers() & Qt.ShiftModifier)
+            self.trim_to(self.drag_start + dx / PIXELS_PER_SECOND, ripple)
+            return
+        x = max(0.0, self.drag_start * PIXELS_PER_SECOND + dx)
+        if self.snap_engine is not None and self.scene() is not None:
+            x = self.snapped_x(x)
+        delta = x / PIXELS_PER_SECOND - self.store.start_of(self.clip_id)
+        if delta:
+            clips = self.store.selected_ids()
+            # Ctrl+سحب لمقطع غير محدد يحركه مع المحدد كما يفعل المشهد
+            if not self.store.is_selected(self.clip_id):
+                clips = np.append(clips, self.clip_id)
+            self.store.move_clips(clips, delta)
+    
+    def trim_to(self, time, ripple=False):
+        """نقل حافة القص الممسوكة إلى زمن (مع الالتقاط لأقرب حافة أخرى)
+
+        مع Shift تُزاح المقاطع التالية في المسار بنفس فرق المدة عند قص النهاية.
+        """
+        if self.snap_engine is not None:
+            tolerance = self.snap_engine.tolerance_pixels / (PIXELS_PER_SECOND * self.view_scale())
+            own_edges = (self.store.start_of(self.clip_id), self.store.end_of(self.clip_id))
+            time = self.snap_engine.snap(time, tolerance, exclude=[e for e in own_edges if e is not None])
+        if self.trim_edge == 'start':
+            self.timeline.trim_start(self.clip_id, time)
+        elif ripple:
+            self.timeline.ripple_trim(self.clip_id, time - self.store.start_of(self.clip_id))
+        else:
+            self.timeline.trim_end(self.clip_id, time - self.store.start_of(self.clip_id))
+    
+    def mouseReleaseEvent(self, event):
+        self.drag_start = None
+        if self.trim_edge is not None:
+            self.trim_edge = None
+            event.accept()
+            return
+        moved = event.scenePos() != event.buttonDownScenePos(Qt.LeftButton)
+        super().mouseReleaseEvent(event)
+        # نقرة بدون سحب على مقطع محدد: يبقى هو فقط محدداً (Qt يلغي تحديد الظاهر فقط)
+        if self.store is not None and not moved and event.button() == Qt.LeftButton \
+                and not event.modifiers() & Qt.ControlModifier:
+            self.store.select_only([self.clip_id])
+    
+    def position_is_stale(self):
+        if self.store is None:
+            return False
+        return abs(self.store.start_of(self.clip_id) * PIXELS_PER_SECOND - self.pos().x()) > 1e-6
+    
+    def sync_position(self):
+        """نقل العنصر إلى بداية مقطعه في النموذج"""
+        if self.position_is_stale():
+            self.binding = True
+            self.setPos(self.store.start_of(self.clip_id) * PIXELS_PER_SECOND, self.pos().y())
+            self.binding = False
+    
+    def snapped_x(self, x):
+        """موضع العنصر بعد التقاط بدايته أو نهايته لأقرب حافة"""
+        tolerance = self.snap_engine.tolerance_pixels / (PIXELS_PER_SECOND * self.view_scale())
+        # حواف العنصر نفسه لا تُحسب
+        own_edges = (self.store.start_of(self.clip_id), self.store.end_of(self.clip_id))
+        start = self.snap_engine.snap_clip(x / PIXELS_PER_SECOND, self.duration, tolerance,
+                                           exclude=[e for e in own_edges if e is not None])
+        return start * PIXELS_PER_SECOND
+
+# خطوات التدريج الممكنة بالثواني (العنوان، التدريج الصغير)؛ ما دون الثانية يُحسب بالإطارات
+RULER_SECOND_STEPS = ((1, 0.5), (2, 1), (5, 1), (10, 2), (15, 5), (30, 10), (60, 15), (120, 30),
+                      (300, 60), (600, 120), (900, 300), (1800, 600), (3600, 900))
+RULER_FRAME_STEPS = (1, 2, 5, 10, 15)
+# أقل مسافة بين عنوانين على المسطرة بالبكسل
+RULER_LABEL_SPACING = 80
+# عدد نصوص العناوين المحضّرة التي نحتفظ بها
+RULER_LABEL_CACHE = 512
+
+def format_ruler_time(seconds, frame_rate, show_frames):
+    """نص عنوان المسطرة: M:SS أو H:MM:SS مع رقم الإطار عند التكبير الشديد"""
+    total_frames = int(round(seconds * frame_rate))
+    whole, frame = divmod(total_frames, int(round(frame_rate)) or 1)
+    hours, rest = divmod(whole, 3600)
+    minutes, secs = divmod(rest, 60)
+    text = f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
+    if show_frames:
+        text += f":{frame:02d}"
+    return text
 
 class TimelineHeader(QWidget):
+    seeked = pyqtSignal(float)  # الزمن بالثواني عند النقر أو السحب على المسطرة
+    
     def __init__(self, theme_manager=None):
         super().__init__()
         self.theme_manager = theme_manager
         self.width_pixels = 1000
         self.zoom_factor = 1.0
+        self.frame_rate = 30.0
+        self.playhead = 0.0
+        # إزاحة التمرير الأفقي للعرض حتى تتطابق المسطرة مع العناصر
+        self.offset = 0
+        self.label_cache = {}
         self.setMinimumHeight(30)
         
         # تطبيق الثيم الأولي
@@ -104,60 +437,255 @@ class TimelineHeader(QWidget):
             theme_manager.apply_theme(self)
     
     def set_width(self, width_pixels, zoom_factor):
+        # المسطرة بعرض العرض فقط؛ width_pixels هو طول الخط الزمني كاملاً بعد التكبير
         self.width_pixels = width_pixels
         self.zoom_factor = zoom_factor
-        self.setFixedWidth(int(width_pixels))  # التحويل إلى int لتفادي الخطأ
         self.update()
     
+    def set_offset(self, offset):
+        if offset != self.offset:
+            self.offset = offset
+            self.update()
+    
+    def set_playhead(self, time):
+        if time != self.playhead:
+            self.playhead = time
+            self.update()
+    
+    def time_at(self, x):
+        return max(0.0, (x + self.offset) / (PIXELS_PER_SECOND * self.zoom_factor))
+    
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self.seeked.emit(self.time_at(event.pos().x()))
+    
+    def mouseMoveEvent(self, event):
+        if event.buttons() & Qt.LeftButton:
+            self.seeked.emit(self.time_at(event.pos().x()))
+    
+    def tick_steps(self):
+        """(خطوة العنوان، خطوة التدريج الصغير، هل نعرض الإطارات) حسب التكبير"""
+        pixels_per_second = PIXELS_PER_SECOND * self.zoom_factor
+        frame_rate = self.frame_rate or 30.0
+        for frames in RULER_FRAME_STEPS:
+            step = frames / frame_rate
+            if step * pixels_per_second >= RULER_LABEL_SPACING:
+                return step, 1 / frame_rate, True
+        for step, minor in RULER_SECOND_STEPS:
+            if step * pixels_per_second >= RULER_LABEL_SPACING:
+                return step, minor, False
+        step = RULER_SECOND_STEPS[-1][0]
+        while step * pixels_per_second < RULER_LABEL_SPACING:
+            step *= 2
+        return step, step / 4, False
+    
+    def label(self, text):
+        """نص محضّر مسبقاً (QStaticText) حتى لا يُعاد تشكيل الحروف عند كل رسم"""
+        static = self.label_cache.get(text)
+        if static is None:
+            if len(self.label_cache) >= RULER_LABEL_CACHE:
+                self.label_cache.clear()
+            static = QStaticText(text)
+            static.setTextFormat(Qt.PlainText)
+            static.prepare(QTransform(), self.font())
+            self.label_cache[text] = static
+        return static
+    
     def paintEvent(self, event):
         painter = QPainter(self)
-        painter.fillRect(self.rect(), QColor(50, 50, 50))
+        exposed = event.rect()
+        painter.fillRect(exposed, QColor(50, 50, 50))
         painter.setPen(QColor(200, 200, 200))
-        pixels_per_second = 100 * self.zoom_factor
-        total_seconds = int(self.width_pixels / pixels_per_second) + 1
-        for sec in range(total_seconds):
-            x = sec * pixels_per_second
+        pixels_per_second = PIXELS_PER_SECOND * self.zoom_factor
+        end_x = min(exposed.right() + 1, self.width_pixels - self.offset)
+        if pixels_per_second <= 0 or end_x <= exposed.left():
+            painter.end()
+            return
+        
+        # الأزمنة الظاهرة فقط؛ التكلفة ثابتة مهما طال الخط الزمني
+        step, minor_step, show_frames = self.tick_steps()
+        start_time = max(0.0, (exposed.left() + self.offset - RULER_LABEL_SPACING) / pixels_per_second)
+        end_time = (end_x + self.offset) / pixels_per_second
+        
+        first = int(start_time // minor_step)
+        last = int(end_time // minor_step) + 1
+        painter.drawLines([
+            QLineF(x, 25, x, 30)
+            for x in (i * minor_step * pixels_per_second - self.offset for i in range(first, last))
+        ])
+        
+        first = int(start_time // step)
+        last = int(end_time // step) + 1
+        for i in range(first, last):
+            seconds = i * step
+            x = seconds * pixels_per_second - self.offset
             painter.drawLine(QLineF(x, 20, x, 30))
-            painter.drawText(int(x) + 2, 15, f"{sec}s")
+            painter.drawStaticText(QPointF(x + 2, 2),
+                                   self.label(format_ruler_time(seconds, self.frame_rate, show_frames)))
+        
+        # مؤشر التشغيل
+        x = self.playhead * pixels_per_second - self.offset
+        painter.setPen(QPen(QColor(230, 60, 60), 2))
+        painter.drawLine(QLineF(x, 0, x, 30))
         painter.end()
 
+class TimelineView(QGraphicsView):
+    """عرض الخط الزمني: خلفية المسارات تُرسم للجزء الظاهر فقط وتُخزن، والتحديث بالمستطيلات المتغيرة فقط"""
+    clicked = pyqtSignal(QPointF)              # موضع النقر في المشهد
+    filesDropped = pyqtSignal(list, QPointF, bool)  # مسارات الملفات، موضع الإفلات، إدراج ripple (Shift)
+    resized = pyqtSignal()
+    
+    def __init__(self, scene=None, parent=None):
+        super().__init__(parent)
+        self.track_count = 0
+        self.track_height = 100
+        self.track_spacing = 10
+        self.playhead_x = None  # موضع مؤشر التشغيل في المشهد
+        if scene is not None:
+            self.setScene(scene)
+        
+        # بداية المشهد عند يسار العرض دائماً حتى تتطابق المسطرة مع العناصر
+        self.setAlignment(Qt.AlignLeft | Qt.AlignTop)
+        self.setCacheMode(QGraphicsView.CacheBackground)
+        self.setViewportUpdateMode(QGraphicsView.SmartViewportUpdate)
+        self.setOptimizationFlags(QGraphicsView.DontSavePainterState |
+                                  QGraphicsView.DontAdjustForAntialiasing)
+    
+    def set_tracks(self, track_count, track_height, track_spacing):
+        """تحديث خطوط المسارات (بدلاً من عنصر خط في المشهد لكل مسار)"""
+        self.track_count = track_count
+        self.track_height = track_height
+        self.track_spacing = track_spacing
+        self.resetCachedContent()
+        self.viewport().update()
+    
+    def set_playhead(self, x):
+        """نقل خط مؤشر التشغيل مع تحديث موضعيه القديم والجديد فقط"""
+        for old_x in (self.playhead_x, x):
+            if old_x is not None:
+                left = self.mapFromScene(QPointF(old_x, 0)).x()
+                self.viewport().update(left - 2, 0, 5, self.viewport().height())
+        self.playhead_x = x
+    
+    def drawForeground(self, painter, rect):
+        if self.playhead_x is None or not rect.left() - 1 <= self.playhead_x <= rect.right() + 1:
+            return
+        painter.setPen(QPen(QColor(230, 60, 60), 0))
+        painter.drawLine(QLineF(self.playhead_x, rect.top(), self.playhead_x, rect.bottom()))
+    
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.resized.emit()
+    
+    def mousePressEvent(self, event):
+        # التحديد في النموذج أولاً، ثم يتعامل المشهد مع العناصر الظاهرة (والسحب والمستطيل)
+        self.clicked.emit(self.mapToScene(event.pos()))
+        super().mousePressEvent(event)
+    
+    def dragEnterEvent(self, event):
+        if event.mimeData().hasUrls():
+            event.acceptProposedAction()
+        else:
+            super().dragEnterEvent(event)
+    
+    def dragMoveEvent(self, event):
+        if event.mimeData().hasUrls():
+            event.acceptProposedAction()
+        else:
+            super().dragMoveEvent(event)
+    
+    def dropEvent(self, event):
+        paths = [url.toLocalFile() for url in event.mimeData().urls() if url.isLocalFile()]
+        if paths:
+            event.acceptProposedAction()
+            ripple = bool(event.keyboardModifiers() & Qt.ShiftModifier)
+            self.filesDropped.emit(paths, self.mapToScene(event.pos()), ripple)
+        else:
+            super().dropEvent(event)
+    
+    def drawBackground(self, painter, rect):
+        painter.fillRect(rect, QColor(30, 30, 30))
+        step = self.track_height + self.track_spacing
+        if self.track_count <= 0 or step <= 0:
+            return
+        # خطوط المسارات التي تقع داخل المستطيل المطلوب فقط
+        first = max(0, int(rect.top() // step))
+        last = min(self.track_count - 1, int(rect.bottom() // step))
+        left = max(0.0, rect.left())
+        if last < first or rect.right() <= left:
+            return
+        painter.setPen(QPen(QColor(100, 100, 100)))
+        painter.drawLines([QLineF(left, track * step, rect.right(), track * step)
+                           for track in range(first, last + 1)])
+
 class TimelinePanel(QWidget):  # تغيير من QGraphicsView إلى QWidget
-    itemSelected = pyqtSignal(object)
+    itemSelected = pyqtSignal(object)  # رقم المقطع في ClipStore
     
     def __init__(self, theme_manager=None):
         super().__init__()
         self.theme_manager = theme_manager
         
-        # إعدادات التكبير/التصغير
+        # إعدادات التكبير/التصغير: التحويل الوحيد بين الزمن والبكسل هو
+        # PIXELS_PER_SECOND في المشهد ثم zoom_factor كتحويل على العرض
         self.zoom_factor = 1.0
         
-        self.tracks = []
+        # الالتقاط المغناطيسي لحواف العناصر أثناء السحب
+        self.snap_engine = SnapEngine()
+        
+        # نموذج الخط الزمني: كل المقاطع في مصفوفة واحدة، والعناصر الرسومية للظاهر منها فقط
+        self.store = ClipStore()
+        self.analysis = {}      # رقم المصدر -> SourceAnalysis
+        self.bound_items = {}   # رقم المقطع -> TimelineItem الظاهر له
+        self.item_pool = []     # عناصر مخفية جاهزة لإعادة الاستخدام
+        self.pending_frames = set()  # سجلات تحليل لها طلبات صور لم تُرسل بعد
+        self.frame_job_count = 0
+        self.pending_probes = {}  # مسار الملف -> [(مقطع مؤقت، ripple)] بانتظار قراءة معلوماته
+        self.probe_jobs = set()   # مفاتيح مهام القراءة الجارية
+        self.probe_job_count = 0
         self.track_height = 100
         self.track_spacing = 10
+        self.playhead = 0.0       # زمن مؤشر التشغيل بالثواني
         
         # شريط زمني علوي - تهيئته أولاً
         self.timeline_header = TimelineHeader(theme_manager)
+        self.timeline_header.seeked.connect(self.set_playhead)
         
         # إنشاء QGraphicsView و QGraphicsScene
-        self.view = QGraphicsView()
         self.scene = QGraphicsScene()
-        self.view.setScene(self.scene)
+        # عدد العناصر في المشهد صغير دائماً، فلا حاجة لفهرس BSP يُعاد بناؤه مع كل تغيير
+        self.scene.setItemIndexMethod(QGraphicsScene.NoIndex)
+        self.view = TimelineView(self.scene)
         
         self.view.setMinimumHeight(180)
         self.view.setMaximumHeight(300)
         self.view.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOn)
         self.view.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOn)
         
-        self.scene.setBackgroundBrush(QColor(30, 30, 30))
-        self.view.setRenderHint(QPainter.Antialiasing)
+        
+        # مساحة كافية لبلاطات العناصر الظاهرة بعدة مستويات تكبير
+        QPixmapCache.setCacheLimit(max(QPixmapCache.cacheLimit(), TILE_CACHE_KB))
         
         self.view.setAcceptDrops(True)
         self.view.setDragMode(QGraphicsView.RubberBandDrag)
         
+        # المسطرة تتبع التمرير الأفقي للعرض
+        self.view.horizontalScrollBar().valueChanged.connect(self.sync_header_offset)
+        # العناصر الرسومية تتبع الجزء الظاهر من الخط الزمني
+        self.view.horizontalScrollBar().valueChanged.connect(self.update_viewport_items)
+        self.view.verticalScrollBar().valueChanged.connect(self.update_viewport_items)
+        self.view.resized.connect(self.update_viewport_items)
+        self.view.clicked.connect(self.on_view_clicked)
+        self.view.filesDropped.connect(self.on_files_dropped)
+        
+        # كل تعديل على النموذج (أو مجموعة تعديلات في transaction) يصل كإشعار واحد
+        self.store.add_listener(self.on_store_changed)
+        
         # الآن يمكننا استدعاء add_track بأمان
         self.add_track()
+        self.set_playhead(self.playhead)
         
         self.setup_ui()
+        self.setup_shortcuts()
         
         # تطبيق الثيم الأولي
         if theme_manager:
@@ -186,8 +714,28 @@ class TimelinePanel(QWidget):  # تغيير من QGraphicsView إلى QWidget
         add_media_btn.clicked.connect(self.add_media_file_dialog)
         toolbar_layout.addWidget(add_media_btn)
         
+        ripple_delete_btn = QPushButton("Ripple Delete")
+        ripple_delete_btn.clicked.connect(self.ripple_delete_selected)
+        toolbar_layout.addWidget(ripple_delete_btn)
+        
+        split_btn = QPushButton("Split")
+        split_btn.setToolTip("Split selected items at the playhead (S)")
+        split_btn.clicked.connect(self.split_selected)
+        toolbar_layout.addWidget(split_btn)
+        
+        razor_btn = QPushButton("Razor")
+        razor_btn.setToolTip("Cut all tracks at the playhead (Ctrl+K)")
+        razor_btn.clicked.connect(self.razor_at_playhead)
+        toolbar_layout.addWidget(razor_btn)
+        
         toolbar_layout.addStretch()
         
+        snap_btn = QPushButton("Snap")
+        snap_btn.setCheckable(True)
+        snap_btn.setChecked(self.snap_engine.enabled)
+        snap_btn.toggled.connect(self.set_snapping)
+        toolbar_layout.addWidget(snap_btn)
+        
         zoom_in_btn = QPushButton("Zoom In")
         zoom_in_btn.clicked.connect(self.zoom_in)
         toolbar_layout.addWidget(zoom_in_btn)
@@ -203,56 +751,75 @@ class TimelinePanel(QWidget):  # تغيير من QGraphicsView إلى QWidget
         
         self.setLayout(main_layout)
     
+    def setup_shortcuts(self):
+        """اختصارات لوحة المفاتيح للتعديل على المقاطع المحددة"""
+        shortcuts = (
+            ("Delete", self.delete_selected),
+            ("Shift+Delete", self.ripple_delete_selected),
+            ("Left", lambda: self.nudge_selected(-1)),
+            ("Right", lambda: self.nudge_selected(1)),
+            ("Shift+Left", lambda: self.nudge_selected(-NUDGE_FAST_FRAMES)),
+            ("Shift+Right", lambda: self.nudge_selected(NUDGE_FAST_FRAMES)),
+            ("S", self.split_selected),
+            ("Ctrl+K", self.razor_at_playhead),
+        )
+        for shortcut, slot in shortcuts:
+            action = QAction(self)
+            action.setShortcut(shortcut)
+            # الاختصارات تعمل فقط عندما يكون التركيز داخل اللوحة
+            action.setShortcutContext(Qt.WidgetWithChildrenShortcut)
+            action.triggered.connect(lambda _checked=False, slot=slot: slot())
+            self.addAction(action)
+    
     def add_track(self):
-        track_id = len(self.tracks)
-        self.tracks.append({
-            'id': track_id,
-            'items': []
-        })
-        
-        y_pos = track_id * (self.track_height + self.track_spacing)
-        self.scene.addLine(0, y_pos, 2000, y_pos, QPen(QColor(100, 100, 100)))
-        
-        self.update_scene_size()
+        track_id = self.store.add_track()
         
         # التحقق من وجود شريط الحالة قبل استخدامه
         if hasattr(self.parent(), 'status_bar'):
             self.parent().status_bar().showMessage(f"Track {track_id+1} added", 2000)
     
     def remove_track(self):
-        if not self.tracks:
+        if not self.store.track_count:
             return
             
         reply = QMessageBox.question(
             self, 'Remove Track',
-            f'Are you sure you want to remove track {len(self.tracks)}?',
+            f'Are you sure you want to remove track {self.store.track_count}?',
             QMessageBox.Yes | QMessageBox.No, QMessageBox.No
         )
         
         if reply == QMessageBox.Yes:
-            removed_track = self.tracks.pop()
-            
-            for item in removed_track['items']:
-                self.scene.removeItem(item)
-            
-            self.update_scene_size()
+            self.store.remove_track(self.store.track_count - 1)
             
             # التحقق من وجود شريط الحالة قبل استخدامه
             if hasattr(self.parent(), 'status_bar'):
                 self.parent().statusBar().showMessage("Track removed", 2000)
     
+    def time_to_x(self, seconds):
+        """موضع الزمن بوحدات المشهد"""
+        return seconds * PIXELS_PER_SECOND
+    
+    def x_to_time(self, x):
+        """الزمن المقابل لموضع في المشهد"""
+        return x / PIXELS_PER_SECOND
+    
+    def track_y(self, track_id):
+        """موضع y لعناصر المسار في المشهد"""
+        return track_id * (self.track_height + self.track_spacing) + 5
+    
     def update_scene_size(self):
-        max_width = 0
-        max_tracks = len(self.tracks)
-        for track in self.tracks:
-            for item in track['items']:
-                item_width = item.duration * 100 * self.zoom_factor
-                if item_width > max_width:
-                    max_width = item_width
-        
-        height = max_tracks * (self.track_height + self.track_spacing)
-        self.scene.setSceneRect(0, 0, int(max_width) + 200, height + 50)
-        self.timeline_header.set_width(int(max_width) + 200, self.zoom_factor)
+        # نهاية الخط الزمني من نهاية كل مسار في فهرسه (O(عدد المسارات))
+        timeline_end = self.time_to_x(self.store.end)
+        height = self.store.track_count * (self.track_height + self.track_spacing)
+        # هامش 200 بكسل على الشاشة بعد آخر عنصر
+        self.scene.setSceneRect(0, 0, timeline_end + 200 / self.zoom_factor, height + 50)
+        self.timeline_header.set_width(int(self.scene.width() * self.zoom_factor), self.zoom_factor)
+        self.sync_header_offset()
+    
+    def sync_header_offset(self, value=None):
+        if value is None:
+            value = self.view.horizontalScrollBar().value()
+        self.timeline_header.set_offset(value - self.view.frameWidth())
     
     def zoom_in(self):
         if self.zoom_factor < 5.0:
@@ -271,14 +838,10 @@ class TimelinePanel(QWidget):  # تغيير من QGraphicsView إلى QWidget
                 self.parent().statusBar().showMessage("Zoomed out", 2000)
     
     def apply_zoom(self):
-        for track in self.tracks:
-            for item in track['items']:
-                # prepareGeometryChange لتنبيه Qt بتغيير الحجم
-                item.prepareGeometryChange()
-                # boundingRect تعتمد على self.duration فقط لذلك لا نحتاج تعديل عرض يدوي
-                pass
+        # تحويل واحد على العرض؛ تكلفته ثابتة مهما كان عدد العناصر
+        self.view.setTransform(QTransform.fromScale(self.zoom_factor, 1.0))
         self.update_scene_size()
-        self.timeline_header.set_width(self.scene.width(), self.zoom_factor)
+        self.update_viewport_items()
     
     def add_media_file_dialog(self):
         options = QFileDialog.Options()
@@ -292,152 +855,503 @@ class TimelinePanel(QWidget):  # تغيير من QGraphicsView إلى QWidget
         for file_path in files:
             self.add_media_item(file_path)
     
-    def add_media_item(self, file_path, track_id=None):
-        # تحضير الصورة المصغرة للفيديو
-        thumbnail = get_video_thumbnail(file_path)
-        
-        # الحصول على مدة الفيديو
-        duration = get_video_duration_seconds(file_path)
-        if duration == 0:
-            duration = 5  # مدة افتراضية
-        
-        # تحضير موجة الصوت
-        waveform = get_audio_waveform(file_path, max_duration=duration)
-        
-        # إنشاء عنصر التايم لاين
-        timeline_item = TimelineItem(
-            file_path=file_path,
-            video_thumbnail=thumbnail,
-            audio_waveform=waveform,
-            duration_seconds=duration
-        )
-        
-        # تحديد المسار المناسب
-        if track_id is None or track_id >= len(self.tracks):
-            # ضع العنصر في أول مسار فيه مكان (عدم التداخل)
-            track_index = 0
-            while True:
-                can_place = True
-                if track_index >= len(self.tracks):
-                    self.add_track()
-                
-                # حساب الموضع الأفقي المناسب
-                position = 0
-                for existing_item in self.tracks[track_index]['items']:
-                    # التحقق من عدم التداخل
-                    item_rect = QRectF(position, 0, timeline_item.duration * 100, timeline_item.total_height)
-                    existing_rect = QRectF(existing_item.pos().x(), 0, existing_item.duration * 100, existing_item.total_height)
-                    
-                    if item_rect.intersects(existing_rect):
-                        can_place = False
-                        # تحديث الموضع المحتمل
-                        position = existing_item.pos().x() + existing_item.duration * 100
-                
-                if can_place:
-                    break
-                track_index += 1
-            
-            track_id = track_index
-        
-        # إضافة العنصر إلى المسار المحدد
-        y_pos = track_id * (self.track_height + self.track_spacing) + 5
-        
-        # حساب الموضع الأفقي
-        position = 0
-        for item in self.tracks[track_id]['items']:
-            position += item.duration * 100
-        
-        timeline_item.setPos(position, y_pos)
+    def add_media_item(self, file_path, track_id=None, start_time=None, ripple=False):
+        """إضافة مقطع من ملف إلى الخط الزمني ويُرجع رقمه
+
+        الملف غير المقروء من قبل يُضاف فوراً بمدة مؤقتة، وتُقرأ معلوماته في الخلفية.
+        """
+        probed = media_probe.is_probed(file_path)
+        # الحصول على مدة الفيديو (قراءة سريعة من الكاش بدون فك ترميز)
+        duration = (get_video_duration_seconds(file_path) if probed else 0) or PLACEHOLDER_DURATION
         
-        self.scene.addItem(timeline_item)
-        self.tracks[track_id]['items'].append(timeline_item)
+        # تحديد المسار المناسب: أول مسار، والموضع أول فراغ يتسع للمقطع
+        if not self.store.track_count:
+            self.add_track()
+        if track_id is None or track_id >= self.store.track_count:
+            track_id = 0
+        start_time = max(0.0, start_time or 0.0)
+        if ripple:
+            # الإدراج داخل مقطع يتم بعد نهايته
+            covering = self.store.at(track_id, start_time)
+            if covering is not None:
+                start_time = self.store.end_of(covering)
+        else:
+            start_time = self.store.find_gap(track_id, duration, after=start_time)
         
-        self.scene.update()
-        self.view.update()
+        # الصورة المصغرة وموجة الصوت تُحسب في الخلفية مرة واحدة لكل ملف
+        source = self.store.source_id(file_path, duration)
+        if probed:
+            self.start_source_analysis(source)
         
-        self.update_scene_size()
+        # المقطع سجل في النموذج فقط؛ العنصر الرسومي يُنشأ إذا كان ظاهراً
+        clip = self.store.add_clip(source, track_id, start_time, duration, ripple=ripple)
+        if not probed:
+            self.schedule_probe(file_path, clip, ripple)
         
         # التحقق من وجود شريط الحالة قبل استخدامه
         if hasattr(self.parent(), 'status_bar'):
             self.parent().statusBar().showMessage(f"Added {os.path.basename(file_path)} to timeline", 2000)
+        return clip
     
-    def dragEnterEvent(self, event: QDragEnterEvent):
-        # توجيه الحدث إلى QGraphicsView
-        self.view.dragEnterEvent(event)
+    def schedule_probe(self, file_path, clip, ripple):
+        """تجميع الملفات المضافة في نفس الدورة في مهمة قراءة واحدة"""
+        if not self.pending_probes:
+            QTimer.singleShot(0, self.probe_pending_files)
+        self.pending_probes.setdefault(file_path, []).append((clip, ripple))
     
-    def dropEvent(self, event: QDropEvent):
-        # توجيه الحدث إلى QGraphicsView
-        self.view.dropEvent(event)
+    def probe_pending_files(self):
+        if not self.pending_probes:
+            return
+        self.probe_job_count += 1
+        key = ('timeline_probe', self.probe_job_count)
+        placeholders, self.pending_probes = self.pending_probes, {}
+        self.probe_jobs.add(key)
+        # قراءة كل الملفات بالتوازي خارج خيط الواجهة
+        thread_manager.submit(
+            key, probe_files, list(placeholders),
+            priority=PRIORITY_VISIBLE,
+            on_finished=lambda key, _result, placeholders=placeholders: self.set_probe_results(key, placeholders),
+            on_failed=lambda key, _error, placeholders=placeholders: self.set_probe_results(key, placeholders)
+        )
     
-    def mousePressEvent(self, event):
-        # توجيه الحدث إلى QGraphicsView
-        self.view.mousePressEvent(event)
+    def set_probe_results(self, key, placeholders):
+        """ضبط مدد المقاطع المؤقتة بعد قراءة ملفاتها، ثم بدء تحليلها"""
+        # مهمة أُلغيت بـ clear(): أرقام مقاطعها قد تكون لمقاطع أخرى الآن
+        if key not in self.probe_jobs:
+            return
+        self.probe_jobs.discard(key)
+        with self.store.transaction():
+            for file_path, clips in placeholders.items():
+                source = self.store.source_ids.get(file_path)
+                if source is None:
+                    continue
+                duration = get_video_duration_seconds(file_path) or PLACEHOLDER_DURATION
+                self.store.set_source_duration(source, duration)
+                for clip, ripple in clips:
+                    if not self.store.is_alive(clip) or int(self.store.clips['source'][clip]) != source:
+                        continue
+                    track = self.store.track_of(clip)
+                    start = self.store.start_of(clip)
+                    # ما بعد المقطع يُزاح إذا كان ملاصقاً له (كالملفات المضافة معاً) أو إذا
+                    # كانت المدة الحقيقية أطول من الفراغ المتاح، بدل ترك فجوة أو تداخل
+                    follower = self.store.at(track, self.store.end_of(clip))
+                    blocked = follower is not None or any(
+                        other != clip for other in self.store.overlapping(track, start, start + duration))
+                    self.store.trim_clip(clip, duration, ripple=ripple or blocked)
+                self.start_source_analysis(source)
+    
+    def start_source_analysis(self, source):
+        """تحليل ملف المصدر في الخلفية بمرور واحد؛ كل نتيجة تصل لكل مقاطعه فور جهوزها"""
+        entry = self.analysis.get(source)
+        if entry is not None:
+            return entry
+        file_path = self.store.source_path(source)
+        info = media_probe.probe(file_path) or {}
+        filmstrip = None
+        if info.get('has_video') and info.get('width') and info.get('height'):
+            filmstrip = KeyframeFilmstrip(info['width'] / info['height'])
+            proxy_manager.request(file_path)
+        entry = SourceAnalysis(source, filmstrip)
+        entry.packet_index = media_probe.packet_index(file_path, build=False)
+        entry.frames_requested = self.schedule_frames
+        self.analysis[source] = entry
+        # النتائج تُربط بسجل التحليل نفسه حتى لا تصل نتيجة متأخرة لمصدر آخر بعد clear()
+        thread_manager.submit(
+            ('timeline_analysis', file_path), analyze_clip, file_path,
+            priority=PRIORITY_NORMAL,
+            on_progress=lambda _key, result, entry=entry: self.set_analysis_result(entry, *result),
+            on_failed=lambda _key, error, entry=entry: self.set_analysis_failed(entry)
+        )
+        return entry
+    
+    def schedule_frames(self, entry):
+        """تجميع طلبات الصور من كل البلاطات المرسومة في مهمة واحدة بعد انتهاء الرسم"""
+        if not self.pending_frames:
+            QTimer.singleShot(0, self.decode_requested_frames)
+        self.pending_frames.add(entry)
+    
+    def decode_requested_frames(self):
+        entries, self.pending_frames = self.pending_frames, set()
+        for entry in entries:
+            keyframes = entry.filmstrip.take_requests()
+            if not keyframes or self.analysis.get(entry.source) is not entry:
+                continue
+            self.frame_job_count += 1
+            key = ('timeline_filmstrip', self.store.source_path(entry.source), self.frame_job_count)
+            entry.jobs.add(key)
+            # صور الجزء الظاهر لها أولوية على تحليل باقي الملفات
+            thread_manager.submit(
+                key, decode_keyframes, self.store.source_path(entry.source), keyframes,
+                priority=PRIORITY_VISIBLE,
+                on_progress=lambda _key, result, entry=entry: self.set_filmstrip_frame(entry, *result),
+                on_finished=lambda key, _result, entry=entry: entry.jobs.discard(key),
+                on_failed=lambda key, _error, entry=entry: entry.jobs.discard(key)
+            )
+    
+    def set_filmstrip_frame(self, entry, pts, image):
+        entry.filmstrip.add(pts, image)
+        self.analysis_changed(entry)
+    
+    def cancel_source_analysis(self):
+        """إلغاء كل التحاليل الخلفية الجارية"""
+        for source, entry in self.analysis.items():
+            thread_manager.cancel(('timeline_analysis', self.store.source_path(source)))
+            for key in entry.jobs:
+                thread_manager.cancel(key)
+            entry.jobs.clear()
+            if entry.filmstrip is not None:
+                entry.filmstrip.cancel_pending()
+        self.pending_frames.clear()
+    
+    def cancel_probes(self):
+        """إلغاء قراءة الملفات المضافة التي لم تكتمل (مقاطعها المؤقتة ستُحذف)"""
+        for key in self.probe_jobs:
+            thread_manager.cancel(key)
+        self.probe_jobs.clear()
+        self.pending_probes.clear()
+    
+    def set_analysis_result(self, entry, name, value):
+        """استلام نتيجة محلل واحد من مرور التحليل المشترك"""
+        if name == 'peaks':
+            entry.peaks = value if value is not None else PeakPyramid.empty()
+        elif name == 'packet_index':
+            entry.packet_index = value
+            # المدة الدقيقة للمصدر تحدد حدود القص غير المتلف
+            if self.analysis.get(entry.source) is entry:
+                self.store.set_source_duration(entry.source, value.duration)
+        else:
+            return
+        self.analysis_changed(entry)
+    
+    def set_analysis_failed(self, entry):
+        """إنهاء حالة التحميل عند فشل التحليل"""
+        if entry.peaks is None:
+            entry.peaks = PeakPyramid.empty()
+        self.analysis_changed(entry)
+    
+    def analysis_changed(self, entry):
+        # رقم المراجعة جزء من مفتاح البلاطات، فالبلاطات القديمة لا تُستخدم بعد الآن
+        entry.revision += 1
+        for item in self.bound_items.values():
+            if item.analysis is entry:
+                item.analysis_changed()
+    
+    def set_snapping(self, enabled):
+        self.snap_engine.enabled = enabled
+    
+    def track_at(self, y):
+        """رقم المسار عند إحداثي y في المشهد أو None"""
+        track_id = int(y // (self.track_height + self.track_spacing))
+        return track_id if 0 <= track_id < self.store.track_count else None
+    
+    def item_at(self, scene_pos):
+        """المقطع تحت نقطة في المشهد من فهرس المسار (بدون البحث في كل العناصر)"""
+        track_id = self.track_at(scene_pos.y())
+        if track_id is None:
+            return None
+        return self.store.at(track_id, self.x_to_time(scene_pos.x()))
+    
+    def items_in_range(self, start_time, end_time, first_track=0, last_track=None):
+        """المقاطع المتقاطعة مع مدى زمني في مجموعة من المسارات"""
+        if last_track is None:
+            last_track = self.store.track_count - 1
+        clips = []
+        for track_id in range(max(0, first_track), min(last_track, self.store.track_count - 1) + 1):
+            clips.extend(self.store.overlapping(track_id, start_time, end_time))
+        return clips
+    
+    def select_range(self, start_time, end_time, first_track=0, last_track=None):
+        """تحديد كل المقاطع داخل مدى زمني"""
+        self.store.set_selected(self.items_in_range(start_time, end_time, first_track, last_track))
+    
+    def on_view_clicked(self, scene_pos):
+        """التحديد عند النقر من النموذج مباشرة، فيشمل المقاطع غير الظاهرة"""
+        clip = self.item_at(scene_pos)
+        if not QApplication.keyboardModifiers() & Qt.ControlModifier:
+            if clip is None:
+                self.store.clear_selection()
+            elif not self.store.is_selected(clip):
+                self.store.select_only([clip])
+            # النقر على مقطع محدد يبقي التحديد كله (حتى غير الظاهر) للسحب الجماعي
+        if clip is not None:
+            self.itemSelected.emit(clip)
+    
+    def on_files_dropped(self, paths, scene_pos, ripple=False):
+        """إضافة الملفات المسحوبة إلى المسار والزمن الذي أُفلتت عنده"""
+        track_id = self.track_at(scene_pos.y())
+        start_time = self.x_to_time(max(0.0, scene_pos.x()))
+        for file_path in reversed(paths) if ripple else paths:
+            # في وضع ripple كل ملف يُدرج عند نفس النقطة فيُدفع ما قبله للأمام
+            self.add_media_item(file_path, track_id, start_time, ripple)
+    
+    def ripple_delete(self, clip):
+        """حذف مقطع وسحب ما بعده في نفس المسار لملء الفراغ"""
+        if self.store.is_alive(clip):
+            self.store.remove_clip(clip, ripple=True)
+    
+    def delete_selected(self, ripple=False):
+        """حذف كل المقاطع المحددة كعملية واحدة على النموذج"""
+        clips = self.store.selected_ids().tolist()
+        if not clips:
+            return
+        self.store.remove_clips(clips, ripple)
         
-        if self.scene.selectedItems():
-            self.itemSelected.emit(self.scene.selectedItems()[0])
+        # التحقق من وجود شريط الحالة قبل استخدامه
+        if hasattr(self.parent(), 'status_bar'):
+            action = "Ripple deleted" if ripple else "Deleted"
+            self.parent().statusBar().showMessage(f"{action} {len(clips)} item(s)", 2000)
+    
+    def ripple_delete_selected(self):
+        self.delete_selected(ripple=True)
+    
+    def move_selected(self, delta):
+        """تحريك كل المقاطع المحددة بنفس الإزاحة (بالثواني) كعملية واحدة"""
+        return self.store.move_clips(self.store.selected_ids(), delta)
+    
+    def nudge_selected(self, frames):
+        """تحريك المقاطع المحددة بعدد من الإطارات"""
+        return self.move_selected(frames / self.timeline_header.frame_rate)
+    
+    def ripple_trim(self, clip, duration):
+        """تغيير مدة مقطع من نهايته وإزاحة ما بعده بنفس الفرق"""
+        if self.store.is_alive(clip) and duration > 0:
+            self.store.trim_clip(clip, duration, ripple=True)
+    
+    def trim_start(self, clip, start_time):
+        """تحريك بداية مقطع مع ثبات نهايته (تعديل غير متلف لنقطة الدخول في المصدر)"""
+        if not self.store.is_alive(clip):
+            return
+        # البداية لا تتجاوز نهاية المقطع السابق في نفس المسار
+        start, track = self.store.start_of(clip), self.store.track_of(clip)
+        if start_time < start:
+            ends = [self.store.end_of(other) for other in self.store.overlapping(track, start_time, start)
+                    if other != clip]
+            start_time = max([start_time] + ends)
+        self.store.trim_start(clip, start_time)
+    
+    def trim_end(self, clip, duration):
+        """تغيير مدة مقطع من نهايته بدون إزاحة ما بعده (لا يتجاوز بداية المقطع التالي)"""
+        if not self.store.is_alive(clip) or duration <= 0:
+            return
+        start, track = self.store.start_of(clip), self.store.track_of(clip)
+        starts = [self.store.start_of(other) for other in self.store.overlapping(track, start, start + duration)
+                  if other != clip]
+        duration = min([duration] + [other - start for other in starts if other > start])
+        self.store.trim_clip(clip, duration, ripple=False)
+    
+    def split_clip(self, clip, time):
+        """قص مقطع عند زمن داخله؛ الجزءان يستخدمان تحليل المصدر نفسه بدون فك ترميز"""
+        if not self.store.is_alive(clip):
+            return None
+        return self.store.split_clip(clip, time)
+    
+    def split_selected(self):
+        """قص المقاطع المحددة عند مؤشر التشغيل كعملية واحدة؛ يُرجع أرقام الأجزاء الجديدة"""
+        with self.store.transaction():
+            tails = [self.split_clip(clip, self.playhead) for clip in self.store.selected_ids().tolist()]
+        tails = [tail for tail in tails if tail is not None]
+        
+        # التحقق من وجود شريط الحالة قبل استخدامه
+        if tails and hasattr(self.parent(), 'status_bar'):
+            self.parent().statusBar().showMessage(f"Split {len(tails)} item(s)", 2000)
+        return tails
+    
+    def razor(self, time, first_track=0, last_track=None):
+        """قص كل المقاطع التي تعبر زمناً معيناً في مجموعة من المسارات"""
+        if last_track is None:
+            last_track = self.store.track_count - 1
+        return self.store.razor(time, list(range(first_track, last_track + 1)))
+    
+    def razor_at_playhead(self):
+        """قص كل المقاطع في كل المسارات عند مؤشر التشغيل"""
+        return self.razor(self.playhead)
+    
+    def set_playhead(self, time):
+        """نقل مؤشر التشغيل في الخط الزمني (نقطة القص ونقطة التقاط أثناء السحب)"""
+        self.playhead = max(0.0, time)
+        self.snap_engine.set_playhead(self.playhead)
+        self.view.set_playhead(self.time_to_x(self.playhead))
+        self.timeline_header.set_playhead(self.playhead)
+    
+    def on_store_changed(self, kinds, clips):
+        """تحديث الواجهة مرة واحدة لكل إشعار من النموذج مهما كان عدد المقاطع المعدلة"""
+        # الموضع القديم للمقاطع المعدلة الظاهرة قبل مزامنة عناصرها
+        dirty = [item.sceneBoundingRect() for clip, item in self.bound_items.items() if clip in clips]
+        if CHANGE_TRACKS in kinds:
+            self.view.set_tracks(self.store.track_count, self.track_height, self.track_spacing)
+            self.snap_engine.set_tracks(self.store.tracks)
+        if CHANGE_TRACKS in kinds or CHANGE_CLIPS in kinds:
+            self.update_scene_size()
+            # العناصر التي تغير سجلها (حذف، قص، إعادة استخدام الرقم) تُربط من جديد
+            grabber = self.scene.mouseGrabberItem()
+            for clip in clips:
+                item = self.bound_items.get(clip)
+                if item is not None and not item.matches_record():
+                    if item is grabber and self.store.is_alive(clip):
+                        # العنصر الممسوك (أثناء القص من حافته) يُربط بسجله الجديد في مكانه
+                        self.rebind_item(clip)
+                    else:
+                        self.release_item(clip)
+            self.update_viewport_items()
+        if CHANGE_SELECTION in kinds:
+            self.sync_selection()
+        if CHANGE_TRACKS in kinds:
+            # إضافة أو حذف مسار تغير كل ما تحته
+            self.view.viewport().update()
+            return
+        # باقي التغييرات: المستطيلات القديمة والجديدة للمقاطع المعدلة فقط؛ تحريك العناصر
+        # الأخرى (مثل إزاحات ripple) وتحديدها يحدّث مكانها في المشهد تلقائياً
+        dirty.extend(item.sceneBoundingRect() for clip, item in self.bound_items.items() if clip in clips)
+        for rect in dirty:
+            self.scene.update(rect)
+    
+    def visible_range(self):
+        """(بداية، نهاية، أول مسار، آخر مسار) للجزء الظاهر مع هامش للتمرير"""
+        visible = self.view.mapToScene(self.view.viewport().rect()).boundingRect()
+        margin = visible.width() * VIEWPORT_MARGIN
+        start_time = self.x_to_time(max(0.0, visible.left() - margin))
+        end_time = self.x_to_time(visible.right() + margin)
+        first_track = self.track_at(max(0.0, visible.top()))
+        last_track = self.track_at(visible.bottom())
+        if last_track is None:
+            last_track = self.store.track_count - 1
+        return start_time, end_time, first_track, last_track
+    
+    def update_viewport_items(self, *args):
+        """ربط عناصر رسومية بالمقاطع الظاهرة فقط وإعادة الباقي إلى المجمع"""
+        start_time, end_time, first_track, last_track = self.visible_range()
+        wanted = set()
+        if first_track is not None:
+            wanted.update(self.items_in_range(start_time, end_time, first_track, last_track))
+        
+        # العنصر المسحوب بالفأرة يبقى مربوطاً حتى لو خرج من الجزء الظاهر
+        grabber = self.scene.mouseGrabberItem()
+        for clip in [clip for clip, item in self.bound_items.items()
+                     if clip not in wanted and item is not grabber]:
+            self.release_item(clip)
+        
+        for clip in wanted:
+            item = self.bound_items.get(clip)
+            if item is None:
+                self.bind_item(clip)
+            else:
+                # الإزاحات المؤجلة لعمليات ripple تُطبق على العناصر الظاهرة فقط
+                item.sync_position()
+    
+    def bind_item(self, clip):
+        if self.item_pool:
+            item = self.item_pool.pop()
+        else:
+            item = TimelineItem()
+            item.snap_engine = self.snap_engine
+            item.timeline = self
+            self.scene.addItem(item)
+        source = int(self.store.clips['source'][clip])
+        item.bind(self.store, clip, self.analysis.get(source),
+                  self.track_y(self.store.track_of(clip)))
+        item.setVisible(True)
+        self.bound_items[clip] = item
+        return item
+    
+    def rebind_item(self, clip):
+        item = self.bound_items[clip]
+        source = int(self.store.clips['source'][clip])
+        item.bind(self.store, clip, self.analysis.get(source),
+                  self.track_y(self.store.track_of(clip)))
+    
+    def release_item(self, clip):
+        item = self.bound_items.pop(clip, None)
+        if item is None:
+            return
+        item.unbind()
+        if len(self.item_pool) < ITEM_POOL_LIMIT:
+            item.setVisible(False)
+            self.item_pool.append(item)
+        else:
+            self.scene.removeItem(item)
+    
+    def sync_selection(self):
+        """مطابقة تحديد العناصر الظاهرة مع أعلام التحديد في النموذج"""
+        for clip, item in self.bound_items.items():
+            item.binding = True
+            item.setSelected(self.store.is_selected(clip))
+            item.binding = False
     
     def select_all(self):
-        for track in self.tracks:
-            for item in track['items']:
-                item.setSelected(True)
+        # عملية واحدة على مصفوفة الأعلام بدلاً من المرور على كل عنصر
+        self.store.select_all()
         
         # التحقق من وجود شريط الحالة قبل استخدامه
         if hasattr(self.parent(), 'status_bar'):
             self.parent().statusBar().showMessage("All timeline items selected", 2000)
     
     def clear_selection(self):
-        for track in self.tracks:
-            for item in track['items']:
-                item.setSelected(False)
+        self.store.clear_selection()
         
         # التحقق من وجود شريط الحالة قبل استخدامه
         if hasattr(self.parent(), 'status_bar'):
             self.parent().statusBar().showMessage("Timeline selection cleared", 2000)
     
+    def clear(self):
+        """حذف كل المقاطع والمسارات والبدء بمسار واحد فارغ"""
+        self.cancel_source_analysis()
+        self.cancel_probes()
+        self.analysis.clear()
+        with self.store.transaction():
+            self.store.clear()
+            self.add_track()
+    
     def cleanup(self):
         """تنظيف الموارد"""
-        for track in self.tracks:
-            for item in track['items']:
-                item.cleanup()
+        # لا مزامنة للعناصر أثناء هدم العرض
+        self.view.horizontalScrollBar().valueChanged.disconnect(self.update_viewport_items)
+        self.view.verticalScrollBar().valueChanged.disconnect(self.update_viewport_items)
+        self.view.resized.disconnect(self.update_viewport_items)
+        self.store.remove_listener(self.on_store_changed)
+        self.cancel_source_analysis()
+        self.cancel_probes()
 
 # دوال مساعدة لتحضير الصورة المصغرة وموجات الصوت
-def get_video_thumbnail(video_path, width=320, height=180):
-    cap = cv2.VideoCapture(video_path)
-    success, frame = cap.read()
-    cap.release()
-    if not success:
-        return QPixmap(width, height)  # صورة فارغة في حالة الفشل
-    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    frame = cv2.resize(frame, (width, height))
-    h, w, ch = frame.shape
-    bytes_per_line = ch * w
-    qImg = QImage(frame.data, w, h, bytes_per_line, QImage.Format_RGB888)
-    return QPixmap.fromImage(qImg)
+def probe_files(job, file_paths):
+    """مهمة خلفية: قراءة معلومات الملفات المضافة للخط الزمني دفعة واحدة"""
+    return media_probe.probe_many(file_paths)
+
+def analyze_clip(job, file_path):
+    """مهمة خلفية: فهرس الحزم وهرم قمم الصوت لملف المصدر
 
-def get_audio_waveform(video_path, sr=22050, max_duration=5):
-    try:
-        y, _ = librosa.load(video_path, sr=sr, duration=max_duration)
-    except Exception as e:
-        print(f"خطأ في تحميل الصوت: {e}")
-        return []
-    y_abs = np.abs(y)
-    frames = 100  # عدد نقاط في waveform يمكن تعديلها حسب عرض التايم لاين
-    hop_length = max(1, int(len(y_abs) / frames)) 
-    waveform = [np.mean(y_abs[i * hop_length:(i + 1) * hop_length]) for i in range(frames)]
-    max_val = max(waveform) if max(waveform) > 0 else 1
-    waveform_normalized = [val / max_val for val in waveform]
-    return waveform_normalized
+    صور شريط الفيديو لا تُحسب هنا؛ تُفك عند الطلب للإطارات المفتاحية الظاهرة فقط.
+    """
+    # فهرس الحزم يُبنى بقراءة الحزم فقط (أسرع بكثير من فك الترميز) ويُحفظ مع معلومات الملف
+    info = media_probe.probe(file_path) or {}
+    if info.get('has_video'):
+        index = media_probe.packet_index(file_path, job=job)
+        if index is not None:
+            job.report(('packet_index', index))
+    
+    # الهرم يُحسب مرة واحدة لكل ملف ثم يُقرأ من الكاش
+    peaks = load_cached_pyramid(file_path)
+    if peaks is not None:
+        job.report(('peaks', peaks))
+        return {'peaks': peaks}
+    
+    results = analyze_media(
+        file_path, [PeakPyramidAnalyzer()], job=job,
+        on_result=lambda name, value: job.report((name, value))
+    )
+    if results is not None:
+        store_cached_pyramid(file_path, results['peaks'])
+    return results
 
 def get_video_duration_seconds(video_path):
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
+    # المدة تأتي من خدمة القراءة الموحدة (مع الكاش) بدلاً من فتح الملف مرة أخرى
+    info = media_probe.probe(video_path)
+    if not info:
         return 0
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
-    cap.release()
-    if fps > 0:
-        return frame_count / fps
-    return 0
+    # مدة الحاوية تقريبية في ملفات VFR؛ فهرس الحزم (إن كان مبنياً) يعطي المدة الدقيقة
+    index = media_probe.packet_index(video_path, build=False) if info['has_video'] else None
+    if index is not None and index.duration > 0:
+        return index.duration
+    return info['duration']
 
 # لتجربة الملف مباشرة
 if __name__ == "__main__":
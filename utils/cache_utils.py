@@ -0,0 +1,36 @@
+import os
+import hashlib
+from PyQt5.QtCore import QStandardPaths
+
+
+def get_cache_dir(*parts):
+    """إرجاع مجلد الكاش الخاص بالمستخدم (وإنشاؤه إن لم يكن موجوداً)"""
+    base = QStandardPaths.writableLocation(QStandardPaths.GenericCacheLocation)
+    if not base:
+        # احتياط في حال لم يحدد النظام مساراً للكاش
+        base = os.path.join(os.path.expanduser("~"), ".cache")
+    path = os.path.join(base, "OpenCut", *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def file_signature(file_path):
+    """هوية الملف: (المسار المطلق، الحجم، وقت التعديل بالنانوثانية)"""
+    path = os.path.abspath(file_path)
+    st = os.stat(path)
+    return path, st.st_size, st.st_mtime_ns
+
+
+# حجم كل عينة تُقرأ من الملف لحساب البصمة
+FINGERPRINT_CHUNK = 64 * 1024
+
+
+def content_fingerprint(file_path):
+    """بصمة محتوى الملف: الحجم + بداية ومنتصف ونهاية الملف (لا تتأثر بتغيير الاسم أو المسار)"""
+    size = os.path.getsize(file_path)
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(file_path, 'rb') as f:
+        for offset in (0, size // 2, max(0, size - FINGERPRINT_CHUNK)):
+            f.seek(offset)
+            digest.update(f.read(FINGERPRINT_CHUNK))
+    return digest.hexdigest()
@@ -0,0 +1,384 @@
+from contextlib import contextmanager
+
+import numpy as np
+
+from utils.track_index import TrackIndex
+
+# سجل المقطع الواحد (48 بايت) بدلاً من كائن رسومي لكل مقطع
+CLIP_DTYPE = np.dtype([
+    ('start', np.float64),     # بداية المقطع على الخط الزمني (ثوانٍ)
+    ('duration', np.float64),  # مدة المقطع على الخط الزمني
+    ('src_in', np.float64),    # نقطة الدخول داخل ملف المصدر
+    ('src_out', np.float64),   # نقطة الخروج داخل ملف المصدر
+    ('track', np.int32),
+    ('source', np.int32),      # رقم ملف المصدر في ClipStore.sources
+    ('flags', np.uint32),
+])
+
+FLAG_ALIVE = 1
+FLAG_SELECTED = 2
+
+# أقصر مقطع ينتج عن القص (ثوانٍ)
+MIN_CLIP_DURATION = 1e-3
+
+# أنواع التغييرات في إشعارات النموذج
+CHANGE_TRACKS = 'tracks'
+CHANGE_CLIPS = 'clips'          # إضافة أو حذف أو تحريك أو قص مقاطع
+CHANGE_SELECTION = 'selection'
+
+
+class ClipStore:
+    """نموذج الخط الزمني بدون واجهة: مصفوفة NumPy للمقاطع + فهرس زمني لكل مسار
+
+    فهرس المسار (TrackIndex) هو المرجع لبدايات المقاطع لأن عمليات ripple تزيحها
+    بإزاحات مؤجلة؛ عمود start في المصفوفة يُحدّث منه قبل الاستعلامات المتجهة فقط.
+
+    كل تعديل يُبلغ المستمعين listener(kinds, clips) حيث clips المقاطع التي تغير سجلها؛
+    داخل transaction() تُجمع التعديلات كلها في إشعار واحد عند نهايتها.
+    """
+
+    def __init__(self, capacity=1024):
+        self.clips = np.zeros(capacity, CLIP_DTYPE)
+        self.size = 0        # عدد الخانات المستخدمة (بما فيها المحذوفة)
+        self.free = []       # خانات محذوفة يُعاد استخدامها
+        self.sources = []    # مسار الملف لكل مصدر
+        self.source_durations = []  # مدة ملف المصدر (0 إذا كانت غير معروفة)
+        self.source_ids = {}
+        self.tracks = []     # TrackIndex لكل مسار
+        self.dirty_tracks = set()  # مسارات أُزيحت ولم يُحدّث عمود start لمقاطعها
+        self.listeners = []
+        self._transaction_depth = 0
+        self._pending_kinds = set()
+        self._pending_clips = set()
+
+    def __len__(self):
+        return self.size - len(self.free)
+
+    # الإشعارات
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    @contextmanager
+    def transaction(self):
+        """تجميع عدة تعديلات في إشعار واحد عند نهايتها (تقبل التداخل)"""
+        self._transaction_depth += 1
+        try:
+            yield self
+        finally:
+            self._transaction_depth -= 1
+            if not self._transaction_depth:
+                self._notify()
+
+    def _changed(self, kind, clips=()):
+        self._pending_kinds.add(kind)
+        self._pending_clips.update(clips)
+        if not self._transaction_depth:
+            self._notify()
+
+    def _notify(self):
+        if not self._pending_kinds:
+            return
+        kinds = frozenset(self._pending_kinds)
+        clips = frozenset(self._pending_clips)
+        self._pending_kinds.clear()
+        self._pending_clips.clear()
+        for listener in list(self.listeners):
+            listener(kinds, clips)
+
+    # المصادر
+
+    def source_id(self, path, duration=0.0):
+        """رقم ملف المصدر (يُضاف عند أول استخدام)"""
+        source = self.source_ids.get(path)
+        if source is None:
+            source = len(self.sources)
+            self.sources.append(path)
+            self.source_durations.append(duration)
+            self.source_ids[path] = source
+        return source
+
+    def source_path(self, source):
+        return self.sources[source]
+
+    def source_duration(self, source):
+        return self.source_durations[source]
+
+    def set_source_duration(self, source, duration):
+        """تحديث مدة المصدر (مثلاً بالمدة الدقيقة من فهرس الحزم)"""
+        self.source_durations[source] = duration
+
+    # المسارات
+
+    @property
+    def track_count(self):
+        return len(self.tracks)
+
+    def add_track(self):
+        self.tracks.append(TrackIndex())
+        self._changed(CHANGE_TRACKS)
+        return len(self.tracks) - 1
+
+    def remove_track(self, track):
+        """حذف مسار ومقاطعه؛ يُرجع أرقام المقاطع المحذوفة"""
+        removed = [clip for clip, _, _ in self.tracks[track].spans()]
+        for clip in removed:
+            self._release(clip)
+        del self.tracks[track]
+        self.dirty_tracks = {t - (t > track) for t in self.dirty_tracks if t != track}
+        # إعادة ترقيم المسارات التالية دفعة واحدة
+        live = self.alive_mask()
+        self.clips['track'][:self.size][live & (self.clips['track'][:self.size] > track)] -= 1
+        with self.transaction():
+            self._changed(CHANGE_TRACKS)
+            self._changed(CHANGE_CLIPS, removed)
+        return removed
+
+    # المقاطع
+
+    def add_clip(self, source, track, start, duration, src_in=0.0, src_out=None, ripple=False):
+        """إضافة مقطع ويُرجع رقمه"""
+        clip = self._allocate()
+        record = self.clips[clip]
+        record['start'] = start
+        record['duration'] = duration
+        record['src_in'] = src_in
+        record['src_out'] = src_in + duration if src_out is None else src_out
+        record['track'] = track
+        record['source'] = source
+        record['flags'] = FLAG_ALIVE
+        if ripple:
+            self.tracks[track].ripple_insert(clip, start, duration)
+            self.dirty_tracks.add(track)
+        else:
+            self.tracks[track].insert(clip, start, duration)
+        self._changed(CHANGE_CLIPS, (clip,))
+        return clip
+
+    def remove_clip(self, clip, ripple=False):
+        track = int(self.clips['track'][clip])
+        if ripple:
+            self.tracks[track].ripple_delete(clip)
+            self.dirty_tracks.add(track)
+        else:
+            self.tracks[track].remove(clip)
+        self._release(clip)
+        self._changed(CHANGE_CLIPS, (clip,))
+
+    def remove_clips(self, clips, ripple=False):
+        """حذف مجموعة مقاطع بإشعار واحد"""
+        with self.transaction():
+            for clip in clips:
+                if self.is_alive(clip):
+                    self.remove_clip(clip, ripple)
+
+    def move_clip(self, clip, start):
+        """تغيير بداية مقطع في نفس المسار"""
+        self.tracks[int(self.clips['track'][clip])].move(clip, start)
+        self.clips['start'][clip] = start
+        self._changed(CHANGE_CLIPS, (clip,))
+
+    def move_clips(self, clips, delta):
+        """إزاحة مجموعة مقاطع بنفس المقدار مع الحفاظ على المسافات بينها؛ يُرجع الإزاحة الفعلية"""
+        clips = np.asarray(clips, dtype=np.intp)
+        if not len(clips):
+            return 0.0
+        self.flush()
+        starts = self.clips['start'][clips]
+        # المجموعة تتوقف عند بداية الخط الزمني كوحدة واحدة
+        delta = max(delta, -float(starts.min()))
+        if not delta:
+            return 0.0
+        starts = starts + delta
+        for clip, track, start in zip(clips.tolist(), self.clips['track'][clips].tolist(), starts.tolist()):
+            self.tracks[track].move(clip, start)
+        self.clips['start'][clips] = starts
+        self._changed(CHANGE_CLIPS, clips.tolist())
+        return delta
+
+    def trim_clip(self, clip, duration, ripple=True):
+        """تغيير مدة مقطع من نهايته (مع إزاحة ما بعده في وضع ripple)
+
+        التعديل غير متلف: يتغير src_out فقط ولا يُعاد تحليل ملف المصدر.
+        """
+        record = self.clips[clip]
+        track = int(record['track'])
+        available = self.source_durations[int(record['source'])] - float(record['src_in'])
+        if available > 0:
+            duration = min(duration, available)
+        duration = max(duration, MIN_CLIP_DURATION)
+        if ripple:
+            self.tracks[track].ripple_trim(clip, duration)
+            self.dirty_tracks.add(track)
+        else:
+            self.tracks[track].insert(clip, self.start_of(clip), duration)
+        record['duration'] = duration
+        record['src_out'] = record['src_in'] + duration
+        self._changed(CHANGE_CLIPS, (clip,))
+
+    def trim_start(self, clip, start):
+        """تحريك بداية مقطع مع ثبات نهايته: src_in يتحرك بنفس المقدار"""
+        record = self.clips[clip]
+        current = self.start_of(clip)
+        end = self.end_of(clip)
+        # لا يمكن البدء قبل أول الملف ولا بعد نهاية المقطع
+        start = min(max(start, current - float(record['src_in']), 0.0), end - MIN_CLIP_DURATION)
+        delta = start - current
+        record['src_in'] += delta
+        record['duration'] = end - start
+        self.tracks[int(record['track'])].insert(clip, start, end - start)
+        record['start'] = start
+        self._changed(CHANGE_CLIPS, (clip,))
+
+    def split_clip(self, clip, time):
+        """قص مقطع عند زمن داخله إلى مقطعين يشيران لنفس المصدر؛ يُرجع رقم المقطع الثاني أو None"""
+        start, end = self.start_of(clip), self.end_of(clip)
+        if start is None or not start + MIN_CLIP_DURATION <= time <= end - MIN_CLIP_DURATION:
+            return None
+        record = self.clips[clip]
+        offset = time - start
+        src_cut = float(record['src_in']) + offset
+        tail = self._allocate()
+        # _allocate قد يعيد إنشاء المصفوفة، فنقرأ السجل من جديد
+        record = self.clips[clip]
+        self.clips[tail] = record
+        self.clips['start'][tail] = time
+        self.clips['duration'][tail] = end - time
+        self.clips['src_in'][tail] = src_cut
+        record['duration'] = offset
+        record['src_out'] = src_cut
+        index = self.tracks[int(record['track'])]
+        index.insert(clip, start, offset)
+        index.insert(tail, time, end - time)
+        self._changed(CHANGE_CLIPS, (clip, tail))
+        return tail
+
+    def razor(self, time, tracks=None):
+        """قص كل المقاطع التي تعبر time دفعة واحدة؛ يُرجع أرقام المقاطع الجديدة"""
+        clips = self.query(time - MIN_CLIP_DURATION, time + MIN_CLIP_DURATION, tracks)
+        with self.transaction():
+            return [tail for tail in (self.split_clip(clip, time) for clip in clips.tolist())
+                    if tail is not None]
+
+    def is_alive(self, clip):
+        return 0 <= clip < self.size and bool(self.clips['flags'][clip] & FLAG_ALIVE)
+
+    def start_of(self, clip):
+        return self.tracks[int(self.clips['track'][clip])].start_of(clip)
+
+    def end_of(self, clip):
+        return self.tracks[int(self.clips['track'][clip])].end_of(clip)
+
+    def track_of(self, clip):
+        return int(self.clips['track'][clip])
+
+    # استعلامات عبر الفهرس (O(log n))
+
+    def overlapping(self, track, start, end):
+        return self.tracks[track].overlapping(start, end)
+
+    def at(self, track, time):
+        return self.tracks[track].at(time)
+
+    def find_gap(self, track, duration, after=0.0):
+        return self.tracks[track].find_gap(duration, after)
+
+    @property
+    def end(self):
+        """نهاية آخر مقطع في كل المسارات"""
+        return max((index.end for index in self.tracks), default=0.0)
+
+    # استعلامات وتعديلات متجهة على المصفوفة
+
+    def flush(self):
+        """كتابة البدايات الحالية من فهارس المسارات التي أُزيحت إلى عمود start"""
+        for track in self.dirty_tracks:
+            spans = list(self.tracks[track].spans())
+            if spans:
+                clips, starts, _ = zip(*spans)
+                self.clips['start'][list(clips)] = starts
+        self.dirty_tracks.clear()
+
+    def alive_mask(self):
+        return (self.clips['flags'][:self.size] & FLAG_ALIVE) != 0
+
+    def alive_ids(self):
+        return np.flatnonzero(self.alive_mask())
+
+    def query(self, start, end, tracks=None):
+        """أرقام المقاطع المتقاطعة مع [start, end) في كل المسارات أو في tracks"""
+        self.flush()
+        clips = self.clips[:self.size]
+        mask = self.alive_mask()
+        mask &= clips['start'] < end
+        mask &= clips['start'] + clips['duration'] > start
+        if tracks is not None:
+            mask &= np.isin(clips['track'], tracks)
+        return np.flatnonzero(mask)
+
+    def selected_ids(self):
+        flags = self.clips['flags'][:self.size]
+        return np.flatnonzero((flags & (FLAG_ALIVE | FLAG_SELECTED)) == (FLAG_ALIVE | FLAG_SELECTED))
+
+    def is_selected(self, clip):
+        return bool(self.clips['flags'][clip] & FLAG_SELECTED)
+
+    def set_selected(self, clips, selected=True):
+        clips = np.asarray(clips, dtype=np.intp)
+        flags = self.clips['flags']
+        # تجاهل ما لا يغير شيئاً حتى لا يصدر إشعار بلا داعٍ
+        changed = clips[((flags[clips] & FLAG_SELECTED) != 0) != selected]
+        if not len(changed):
+            return
+        if selected:
+            flags[changed] |= FLAG_SELECTED
+        else:
+            flags[changed] &= ~np.uint32(FLAG_SELECTED)
+        self._changed(CHANGE_SELECTION)
+
+    def select_only(self, clips):
+        """تحديد هذه المقاطع فقط (إلغاء تحديد الباقي) بإشعار واحد"""
+        with self.transaction():
+            self.clear_selection()
+            self.set_selected(clips)
+
+    def select_all(self):
+        self.clips['flags'][:self.size][self.alive_mask()] |= FLAG_SELECTED
+        self._changed(CHANGE_SELECTION)
+
+    def clear_selection(self):
+        self.clips['flags'][:self.size] &= ~np.uint32(FLAG_SELECTED)
+        self._changed(CHANGE_SELECTION)
+
+    def clear(self):
+        removed = self.alive_ids().tolist()
+        self.clips[:self.size] = 0
+        self.size = 0
+        self.free.clear()
+        self.sources.clear()
+        self.source_durations.clear()
+        self.source_ids.clear()
+        self.tracks.clear()
+        self.dirty_tracks.clear()
+        with self.transaction():
+            self._changed(CHANGE_TRACKS)
+            self._changed(CHANGE_CLIPS, removed)
+            self._changed(CHANGE_SELECTION)
+
+    def _allocate(self):
+        if self.free:
+            return self.free.pop()
+        if self.size == len(self.clips):
+            grown = np.zeros(len(self.clips) * 2, CLIP_DTYPE)
+            grown[:self.size] = self.clips
+            self.clips = grown
+        self.size += 1
+        return self.size - 1
+
+    def _release(self, clip):
+        self.clips[clip] = 0
+        self.free.append(clip)
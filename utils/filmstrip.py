@@ -0,0 +1,92 @@
+from bisect import bisect_left, insort
+
+import av
+from PyQt5 import sip
+from PyQt5.QtGui import QImage
+
+from utils.proxy_manager import proxy_manager
+
+# ارتفاع صور شريط الفيديو بالبكسل (نفس ارتفاع شريط الفيديو في عنصر الخط الزمني)
+FILMSTRIP_HEIGHT = 60
+
+
+def frame_to_image(frame, height=FILMSTRIP_HEIGHT, interpolation=None):
+    """تحويل إطار إلى QImage صغير: التصغير يتم داخل swscale أثناء التحويل من YUV مباشرة
+
+    الـ QImage يشير إلى ذاكرة مصفوفة NumPy بدون نسخ؛ المصفوفة تبقى حية كخاصية للصورة.
+    interpolation يختار خوارزمية التصغير في swscale (مثل 'AREA')، والافتراضي خوارزمية PyAV.
+    """
+    width = max(1, int(round(height * frame.width / frame.height))) if frame.height else height
+    if interpolation is None:
+        array = frame.to_ndarray(width=width, height=height, format='rgb24')
+    else:
+        array = frame.to_ndarray(width=width, height=height, format='rgb24', interpolation=interpolation)
+    # الأسطر قد تحمل حشوة محاذاة من swscale (مصفوفة غير متصلة)، لذلك نمرر العنوان مع طول السطر
+    image = QImage(sip.voidptr(array.ctypes.data), width, height, array.strides[0], QImage.Format_RGB888)
+    image.buffer = array
+    return image
+
+
+def decode_keyframes(job, file_path, keyframes, height=FILMSTRIP_HEIGHT):
+    """مهمة خلفية: فك ترميز الإطارات المفتاحية المطلوبة فقط (pts) وإرسال (pts، QImage) لكل منها"""
+    with av.open(proxy_manager.resolve_preview_path(file_path)) as container:
+        stream = container.streams.video[0]
+        # المفكك يتخطى كل الإطارات غير المفتاحية بدون فك ترميزها
+        stream.codec_context.skip_frame = 'NONKEY'
+        for pts in sorted(keyframes):
+            if job.is_cancelled():
+                return None
+            container.seek(pts, stream=stream, backward=True, any_frame=False)
+            for frame in container.decode(stream):
+                job.report((pts, frame_to_image(frame, height)))
+                break
+    return None
+
+
+class KeyframeFilmstrip:
+    """صور الإطارات المفتاحية لملف مصدر تُفك عند الطلب فقط
+
+    كل خانة في شريط الفيديو تطلب أقرب إطار مفتاحي إلى زمنها؛ الكثافة تتبع عرض
+    المقطع والتكبير تلقائياً، ولا يُفك إلا ما يظهر في البلاطات المرسومة فعلاً.
+    """
+
+    def __init__(self, aspect=16 / 9):
+        self.aspect = aspect
+        self.pts = []       # pts الإطارات الجاهزة (مرتبة)
+        self.images = {}    # pts -> QImage
+        self.pending = set()  # pts مطلوبة ولم تصل بعد
+        self.requested = []   # طلبات جديدة لم تُرسل لخيط خلفي
+
+    def frame_width(self, height):
+        return max(1, int(round(height * self.aspect)))
+
+    def image(self, pts):
+        """الصورة عند pts أو None مع تسجيل طلبها"""
+        image = self.images.get(pts)
+        if image is None and pts not in self.pending:
+            self.pending.add(pts)
+            self.requested.append(pts)
+        return image
+
+    def nearest(self, pts):
+        """أقرب صورة جاهزة إلى pts (بديل مؤقت حتى تصل الصورة المطلوبة)"""
+        if not self.pts:
+            return None
+        i = bisect_left(self.pts, pts)
+        candidates = self.pts[max(i - 1, 0):i + 1]
+        return self.images[min(candidates, key=lambda p: abs(p - pts))]
+
+    def take_requests(self):
+        requests, self.requested = self.requested, []
+        return requests
+
+    def add(self, pts, image):
+        self.pending.discard(pts)
+        if pts not in self.images:
+            insort(self.pts, pts)
+        self.images[pts] = image
+
+    def cancel_pending(self):
+        """نسيان الطلبات التي لم تصل (بعد إلغاء المهام) حتى تُطلب من جديد عند الحاجة"""
+        self.pending.clear()
+        self.requested.clear()
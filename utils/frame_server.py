@@ -0,0 +1,243 @@
+import os
+import threading
+from collections import OrderedDict
+
+import av
+import numpy as np
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from utils.filmstrip import frame_to_image
+from utils.media_probe import media_probe
+from utils.proxy_manager import proxy_manager
+
+# حد ذاكرة الإطارات المفكوكة في الكاش (بايت)
+FRAME_CACHE_BYTES = 256 * 1024 * 1024
+# أقصى عدد لملفات مفتوحة بمفككاتها في نفس الوقت
+MAX_OPEN_DECODERS = 4
+# أقصى فرق (ثوانٍ) بين زمن الإطار في البروكسي وزمنه في الأصل حتى يُعتبرا نفس الإطار
+PROXY_TIME_TOLERANCE = 1e-3
+
+
+class FrameCache:
+    """كاش LRU للإطارات المفكوكة (QImage) محدود بحجم الذاكرة وليس بعدد الإطارات"""
+
+    def __init__(self, max_bytes=FRAME_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.frames = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.frames)
+
+    def get(self, key):
+        with self._lock:
+            image = self.frames.get(key)
+            if image is not None:
+                self.frames.move_to_end(key)
+            return image
+
+    def put(self, key, image):
+        cost = image.bytesPerLine() * image.height()
+        with self._lock:
+            old = self.frames.pop(key, None)
+            if old is not None:
+                self.bytes -= old.bytesPerLine() * old.height()
+            self.frames[key] = image
+            self.bytes += cost
+            # حذف الأقدم استخداماً حتى نعود تحت الحد (مع إبقاء الإطار الجديد دائماً)
+            while self.bytes > self.max_bytes and len(self.frames) > 1:
+                _, evicted = self.frames.popitem(last=False)
+                self.bytes -= evicted.bytesPerLine() * evicted.height()
+
+    def clear(self):
+        with self._lock:
+            self.frames.clear()
+            self.bytes = 0
+
+
+def frames_match(source_index, proxy_index):
+    """هل يحتوي البروكسي نفس إطارات الأصل بنفس الترتيب والأزمنة (رقم الإطار صالح لكليهما)"""
+    return (proxy_index is not None and proxy_index.frame_count == source_index.frame_count
+            and np.allclose(proxy_index.times(), source_index.times(), rtol=0, atol=PROXY_TIME_TOLERANCE))
+
+
+class _Decoder:
+    """مفكك مفتوح لملف واحد يتذكر موضعه حتى يكمل للأمام بدون قفز جديد"""
+
+    def __init__(self, path, index, source_index):
+        self.path = path  # الملف المفتوح فعلاً (الأصل أو البروكسي)
+        self.container = av.open(path)
+        self.stream = self.container.streams.video[0]
+        self.index = index                # فهرس الملف المفتوح
+        self.source_index = source_index  # فهرس الأصل الذي تُحسب منه أرقام الإطارات
+        self.frames = None    # مولد الإطارات منذ آخر قفز
+        self.position = None  # pts آخر إطار مفكوك
+
+    def decode(self, target, is_stale):
+        """الإطار عند pts=target؛ يتوقف ويُرجع None إذا أصبح الطلب قديماً (is_stale)"""
+        keyframe = self.index.keyframe_before(target)
+        # داخل نفس GOP وقبل الهدف: إكمال فك الترميز أرخص من القفز للإطار المفتاحي
+        if self.frames is None or self.position is None or not keyframe <= self.position < target:
+            self.container.seek(keyframe, stream=self.stream, backward=True, any_frame=False)
+            self.frames = self.container.decode(self.stream)
+            self.position = None
+        for frame in self.frames:
+            if frame.pts is None:
+                continue
+            self.position = frame.pts
+            if frame.pts >= target:
+                return frame
+            if is_stale():
+                return None
+        self.frames = None
+        self.position = None
+        return None
+
+    def close(self):
+        self.container.close()
+
+
+class FrameServer(QObject):
+    """خادم الإطارات: الإطار رقم N من ملف بارتفاع معين كـ QImage
+
+    الفك يتم في خيط واحد خلفي من أقرب إطار مفتاحي (عبر فهرس الحزم) مع كاش LRU.
+    كل قناة (مثل مشغل أو معاينة) تحتفظ بآخر طلب فقط: الطلب الأحدث يلغي الأقدم الذي لم
+    يُنفذ، ويوقف فك الطلب الجاري، فيبقى السحب على شريط التقدم سريع الاستجابة.
+    """
+    frameReady = pyqtSignal(object, object)  # الطلب (المسار، رقم الإطار، الارتفاع)، QImage
+
+    def __init__(self, cache_bytes=FRAME_CACHE_BYTES):
+        super().__init__()
+        self.cache = FrameCache(cache_bytes)
+        self._condition = threading.Condition()
+        self._pending = OrderedDict()  # القناة -> آخر طلب
+        self._decoders = OrderedDict()  # المسار -> _Decoder (يُستخدم من الخيط الخلفي فقط)
+        self._mismatched_proxies = set()  # بروكسيات لا تطابق إطاراتها الأصل (تُتجاهل)
+        self._worker = None
+        self._running = True
+
+    def frame_at(self, file_path, time):
+        """رقم الإطار المعروض عند time، أو None إذا لم يُبنَ فهرس الحزم بعد (أو لا يوجد فيديو)
+
+        لا يبني الفهرس هنا لأنها تُستدعى من الواجهة؛ يُبنى في مهمة خلفية عند فتح الملف.
+        time بالثواني من أول إطار كموضع المشغل، وليس على ساعة المسار.
+        """
+        index = media_probe.packet_index(file_path, build=False)
+        return index.frame_at(index.start_time + time) if index is not None else None
+
+    def time_of(self, file_path, frame):
+        index = media_probe.packet_index(file_path, build=False)
+        return index.time_of(frame) - index.start_time if index is not None else 0.0
+
+    def cached(self, file_path, frame, height=None):
+        return self.cache.get((os.path.abspath(file_path), frame, height))
+
+    def request(self, file_path, frame, height=None, channel='default'):
+        """الإطار من الكاش فوراً، أو None مع جدولة فكه (يصل عبر frameReady)
+
+        height=None يعني الدقة الأصلية.
+        """
+        key = (os.path.abspath(file_path), frame, height)
+        image = self.cache.get(key)
+        if image is not None:
+            return image
+        with self._condition:
+            self._pending[channel] = key
+            self._pending.move_to_end(channel)
+            self._condition.notify()
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="FrameServer", daemon=True)
+                self._worker.start()
+        return None
+
+    def cancel(self, channel='default'):
+        """إلغاء طلب قناة لم يُنفذ بعد"""
+        with self._condition:
+            self._pending.pop(channel, None)
+
+    def cleanup(self):
+        """إيقاف الخيط الخلفي وإغلاق الملفات"""
+        with self._condition:
+            self._running = False
+            self._pending.clear()
+            self._condition.notify()
+            worker = self._worker
+        if worker is not None:
+            worker.join(2.0)
+        self.cache.clear()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and not self._pending:
+                    self._condition.wait()
+                if not self._running:
+                    break
+                channel, key = self._pending.popitem(last=False)
+            try:
+                image = self._decode(key, channel)
+            except Exception as e:
+                print(f"Error decoding frame {key[1]} of {key[0]}: {e}")
+                self._close_decoder(key[0])
+                continue
+            if image is not None:
+                self.frameReady.emit(key, image)
+        for path in list(self._decoders):
+            self._close_decoder(path)
+
+    def _decode(self, key, channel):
+        image = self.cache.get(key)
+        if image is not None:
+            return image
+        path, frame, height = key
+        decoder = self._decoder(path)
+        if decoder is None or not decoder.source_index.frame_count:
+            return None
+        # رقم الإطار من فهرس الأصل كما حسبه frame_at؛ البروكسي المطابق له نفس الإطار بنفس الرقم
+        frame = min(max(frame, 0), decoder.source_index.frame_count - 1)
+        target = int(decoder.index.pts[frame])
+        # وصل طلب أحدث لنفس القناة: نتوقف ونترك المفكك عند موضعه ليكمل منه
+        av_frame = decoder.decode(target, lambda: channel in self._pending or not self._running)
+        if av_frame is None:
+            return None
+        image = frame_to_image(av_frame, height or av_frame.height)
+        self.cache.put(key, image)
+        return image
+
+    def _decoder(self, path):
+        preview = proxy_manager.resolve_preview_path(path)
+        if preview in self._mismatched_proxies:
+            preview = path
+        decoder = self._decoders.get(path)
+        if decoder is not None:
+            if decoder.path == preview:
+                self._decoders.move_to_end(path)
+                return decoder
+            # أصبح البروكسي جاهزاً (أو حُذف): نفتح الملف الجديد بدل الاستمرار في القديم
+            self._close_decoder(path)
+        source_index = media_probe.packet_index(path, build=False)
+        if source_index is None:
+            return None
+        index = source_index
+        if preview != path:
+            # البروكسي يُستخدم للفك فقط إذا تطابقت إطاراته مع الأصل واحداً لواحد
+            index = media_probe.packet_index(preview)
+            if not frames_match(source_index, index):
+                print(f"Proxy {preview} does not match the frames of {path}; decoding the original")
+                self._mismatched_proxies.add(preview)
+                preview, index = path, source_index
+        decoder = _Decoder(preview, index, source_index)
+        self._decoders[path] = decoder
+        while len(self._decoders) > MAX_OPEN_DECODERS:
+            self._close_decoder(next(iter(self._decoders)))
+        return decoder
+
+    def _close_decoder(self, path):
+        decoder = self._decoders.pop(path, None)
+        if decoder is not None:
+            decoder.close()
+
+
+# إنشاء نسخة واحدة من FrameServer
+frame_server = FrameServer()
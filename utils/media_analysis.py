@@ -0,0 +1,282 @@
+import av
+import numpy as np
+from PyQt5.QtGui import QImage
+
+from utils.media_probe import media_probe
+from utils.peak_pyramid import PeakReducer
+from utils.pcm_source import open_pcm_source
+
+# حجم كتلة الصوت التي تصل إلى المحللات (حوالي 85 ms عند 48 kHz)
+AUDIO_BLOCK_SAMPLES = 4096
+
+
+def amplitude_to_db(value):
+    """تحويل سعة (0..1) إلى ديسيبل"""
+    return float(20 * np.log10(value)) if value > 0 else float('-inf')
+
+
+class Analyzer:
+    """أساس المحللات: كل محلل يستقبل الإطارات من نفس مرور فك الترميز"""
+    name = None
+    media_type = None  # 'video' أو 'audio'
+
+    def start(self, info):
+        """يُستدعى قبل بدء فك الترميز مع معلومات الملف من media_probe"""
+        pass
+
+    def feed(self, data, time):
+        """إطار فيديو (av.VideoFrame) أو عينات صوت mono بصيغة float32"""
+        pass
+
+    @property
+    def done(self):
+        """True إذا لم يعد المحلل يحتاج مزيداً من الإطارات"""
+        return False
+
+    def finish(self):
+        """النتيجة النهائية"""
+        return None
+
+
+class FilmstripAnalyzer(Analyzer):
+    """صور مصغرة (QImage) موزعة على مدة الملف؛ زمن كل صورة في self.times"""
+    name = 'filmstrip'
+    media_type = 'video'
+
+    def __init__(self, count=5, width=80, height=60):
+        self.count = count
+        self.width = width
+        self.height = height
+        self.targets = []
+        self.images = []
+        self.times = []
+
+    def start(self, info):
+        duration = info.get('duration') or 0
+        if self.count == 1 or duration <= 0:
+            self.targets = [0.0]
+        else:
+            # منتصف كل جزء من أجزاء الشريط
+            self.targets = [(i + 0.5) * duration / self.count for i in range(self.count)]
+
+    def feed(self, frame, time):
+        if self.done or time is None or time < self.targets[len(self.images)]:
+            return
+        img = frame.to_ndarray(width=self.width, height=self.height, format='rgb24')
+        image = QImage(img.data, self.width, self.height, img.strides[0], QImage.Format_RGB888)
+        self.images.append(image.copy())
+        self.times.append(time)
+
+    @property
+    def done(self):
+        return len(self.images) >= len(self.targets) > 0
+
+    def finish(self):
+        return self.images
+
+
+class PeakPyramidAnalyzer(Analyzer):
+    """هرم قمم الصوت (min/max) لعرض الموجة بأي مستوى تكبير"""
+    name = 'peaks'
+    media_type = 'audio'
+
+    def start(self, info):
+        # تجميع تدريجي: لا نحتفظ بالعينات المفككة مهما طال الملف
+        self.reducer = PeakReducer(info.get('sample_rate') or 48000)
+
+    def feed(self, samples, time):
+        self.reducer.feed(samples)
+
+    def finish(self):
+        return self.reducer.finish()
+
+
+class SilenceAnalyzer(Analyzer):
+    """فترات الصمت (بداية، نهاية) بالثواني"""
+    name = 'silence'
+    media_type = 'audio'
+
+    def __init__(self, threshold_db=-40.0, min_duration=0.5):
+        self.threshold = 10 ** (threshold_db / 20)
+        self.min_duration = min_duration
+        self.ranges = []
+        self.silence_start = None
+        self.end_time = 0.0
+
+    def start(self, info):
+        self.sample_rate = info.get('sample_rate') or 48000
+
+    def feed(self, samples, time):
+        if not len(samples):
+            return
+        rms = np.sqrt(np.mean(np.square(samples, dtype=np.float64)))
+        self.end_time = time + len(samples) / self.sample_rate
+        if rms < self.threshold:
+            if self.silence_start is None:
+                self.silence_start = time
+        elif self.silence_start is not None:
+            self._close(time)
+
+    def _close(self, time):
+        if time - self.silence_start >= self.min_duration:
+            self.ranges.append((self.silence_start, time))
+        self.silence_start = None
+
+    def finish(self):
+        if self.silence_start is not None:
+            self._close(self.end_time)
+        return self.ranges
+
+
+class LoudnessAnalyzer(Analyzer):
+    """مستوى الصوت الإجمالي: RMS والقمة بالديسيبل"""
+    name = 'loudness'
+    media_type = 'audio'
+
+    def __init__(self):
+        self.sum_squares = 0.0
+        self.sample_count = 0
+        self.peak = 0.0
+
+    def feed(self, samples, time):
+        if not len(samples):
+            return
+        self.sum_squares += float(np.dot(samples, samples))
+        self.sample_count += len(samples)
+        self.peak = max(self.peak, float(np.abs(samples).max()))
+
+    def finish(self):
+        rms = np.sqrt(self.sum_squares / self.sample_count) if self.sample_count else 0.0
+        return {'rms_db': amplitude_to_db(rms), 'peak_db': amplitude_to_db(self.peak)}
+
+
+class SceneChangeAnalyzer(Analyzer):
+    """درجة تغير المشهد بين كل إطارين متتاليين (0..1) على نسخة رمادية صغيرة"""
+    name = 'scene_changes'
+    media_type = 'video'
+
+    def __init__(self, threshold=0.3, width=64, height=36):
+        self.threshold = threshold
+        self.width = width
+        self.height = height
+        self.previous = None
+        self.times = []
+        self.scores = []
+
+    def feed(self, frame, time):
+        gray = frame.to_ndarray(width=self.width, height=self.height, format='gray').astype(np.int16)
+        if self.previous is not None:
+            self.times.append(time)
+            self.scores.append(np.abs(gray - self.previous).mean() / 255.0)
+        self.previous = gray
+
+    def finish(self):
+        times = np.asarray(self.times, dtype=np.float64)
+        scores = np.asarray(self.scores, dtype=np.float32)
+        return {
+            'times': times,
+            'scores': scores,
+            'cuts': times[scores >= self.threshold].tolist(),
+        }
+
+
+def analyze_media(file_path, analyzers, job=None, on_result=None):
+    """فك ترميز الملف مرة واحدة وتمرير الإطارات لكل المحللات معاً
+
+    on_result(name, result) يُستدعى فور انتهاء أي محلل حتى تصل النتائج تدريجياً.
+    """
+    info = media_probe.probe(file_path) or {}
+    results = {}
+
+    def deliver(analyzer):
+        results[analyzer.name] = analyzer.finish()
+        if on_result is not None:
+            on_result(analyzer.name, results[analyzer.name])
+
+    for analyzer in analyzers:
+        analyzer.start(info)
+
+    # ملفات PCM غير المضغوطة تُقرأ مباشرة من الذاكرة المربوطة بدون فك ترميز
+    if not info.get('has_video') or not any(a.media_type == 'video' for a in analyzers):
+        source = open_pcm_source(file_path)
+        if source is not None:
+            return _analyze_pcm(source, analyzers, results, deliver, job)
+
+    with av.open(file_path) as container:
+        video_stream = container.streams.video[0] if container.streams.video else None
+        audio_stream = container.streams.audio[0] if container.streams.audio else None
+        pending = {
+            'video': [a for a in analyzers if a.media_type == 'video'] if video_stream else [],
+            'audio': [a for a in analyzers if a.media_type == 'audio'] if audio_stream else [],
+        }
+        streams = []
+        if pending['video']:
+            video_stream.thread_type = 'AUTO'
+            streams.append(video_stream)
+        if pending['audio']:
+            streams.append(audio_stream)
+            # تحويل الصوت مرة واحدة إلى mono float32 لكل المحللات، بكتل كبيرة
+            # لتقليل عدد الاستدعاءات في Python لكل ثانية صوت
+            resampler = av.AudioResampler(format='flt', layout='mono', frame_size=AUDIO_BLOCK_SAMPLES)
+            audio_time = None
+
+        def dispatch(media_type, data, time):
+            for analyzer in list(pending[media_type]):
+                analyzer.feed(data, time)
+                if analyzer.done:
+                    pending[media_type].remove(analyzer)
+                    deliver(analyzer)
+
+        def feed_audio(frames):
+            nonlocal audio_time
+            for rframe in frames:
+                samples = rframe.to_ndarray()[0]
+                if audio_time is None:
+                    audio_time = rframe.time or 0.0
+                dispatch('audio', samples, audio_time)
+                audio_time += len(samples) / rframe.sample_rate
+
+        if streams:
+            for packet in container.demux(*streams):
+                if job is not None and job.is_cancelled():
+                    return None
+                media_type = packet.stream.type
+                if not pending[media_type]:
+                    # كل محللات هذا المسار انتهت؛ نتوقف إذا انتهى الجميع
+                    if not pending['video'] and not pending['audio']:
+                        break
+                    continue
+                for frame in packet.decode():
+                    if media_type == 'video':
+                        dispatch('video', frame, frame.time)
+                    else:
+                        feed_audio(resampler.resample(frame))
+            if pending['audio']:
+                feed_audio(resampler.resample(None))
+
+    for analyzer in analyzers:
+        if analyzer.name not in results:
+            deliver(analyzer)
+    return results
+
+
+def _analyze_pcm(source, analyzers, results, deliver, job):
+    """المسار السريع: تمرير كتل PCM من numpy.memmap إلى محللات الصوت مباشرة"""
+    pending = [a for a in analyzers if a.media_type == 'audio']
+    for analyzer in pending:
+        # معدل العينات الأصلي كما هو (لا إعادة تعيين)
+        analyzer.start({'sample_rate': source.sample_rate, 'duration': source.duration})
+    for samples, time in source.blocks(AUDIO_BLOCK_SAMPLES):
+        if job is not None and job.is_cancelled():
+            return None
+        for analyzer in list(pending):
+            analyzer.feed(samples, time)
+            if analyzer.done:
+                pending.remove(analyzer)
+                deliver(analyzer)
+        if not pending:
+            break
+    for analyzer in analyzers:
+        if analyzer.name not in results:
+            deliver(analyzer)
+    return results
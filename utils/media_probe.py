@@ -0,0 +1,280 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import av
+
+from utils.cache_utils import get_cache_dir, file_signature
+from utils.packet_index import PacketIndex, build_packet_index
+
+# عدد حزم الفيديو التي نقرأها (بدون فك ترميز) لتقدير المسافة بين الإطارات المفتاحية
+KEYFRAME_SCAN_PACKETS = 600
+# مدة تذكر فشل قراءة ملف (ثوانٍ) قبل إعادة المحاولة؛ الأخطاء لا تُحفظ على القرص
+ERROR_RETRY_SECONDS = 30
+
+
+class MediaProbe:
+    """خدمة موحدة لقراءة معلومات ملفات الميديا مع كاش دائم على القرص"""
+
+    def __init__(self, db_path=None, max_workers=None):
+        if db_path is None:
+            db_path = os.path.join(get_cache_dir(), "media_probe.sqlite")
+        self.db_path = db_path
+        self.max_workers = max_workers or min(8, os.cpu_count() or 2)
+        self._lock = threading.Lock()
+        self._indexes = {}  # التوقيع -> PacketIndex (أو None) بعد أول قراءة من القاعدة
+        self._building = {}  # التوقيع -> قفل البناء الجاري (طلب آخر لنفس الملف ينتظر نتيجته)
+        self._errors = {}  # التوقيع -> (وقت الفشل، نتيجة الخطأ) في هذه الجلسة فقط
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS probes ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime INTEGER NOT NULL,"
+            " info TEXT NOT NULL)"
+        )
+        # فهرس الحزم بجانب معلومات الملف (data فارغ = لا يوجد مسار فيديو)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS packet_indexes ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime INTEGER NOT NULL,"
+            " data BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    def probe(self, file_path):
+        """معلومات الملف من الكاش، أو قراءتها مرة واحدة وتخزينها"""
+        try:
+            signature = file_signature(file_path)
+        except OSError as e:
+            print(f"Error probing {file_path}: {e}")
+            return None
+
+        info = self._load(signature)
+        if info is None:
+            info = self._probe_file(signature[0])
+            self._store(signature, info)
+        return info if 'error' not in info else None
+
+    def is_probed(self, file_path):
+        """هل يُرجع probe() معلومات الملف بدون فتحه (موجودة في الكاش أو الملف غير موجود)"""
+        try:
+            signature = file_signature(file_path)
+        except OSError:
+            return True
+        return self._load(signature) is not None
+
+    def probe_many(self, file_paths):
+        """قراءة معلومات عدة ملفات بالتوازي، مع تخطي الملفات الموجودة في الكاش"""
+        results = {}
+        pending = []
+        for file_path in file_paths:
+            try:
+                signature = file_signature(file_path)
+            except OSError:
+                results[file_path] = None
+                continue
+            info = self._load(signature)
+            if info is None:
+                pending.append((file_path, signature))
+            else:
+                results[file_path] = info if 'error' not in info else None
+
+        if pending:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                probed = pool.map(lambda p: self._probe_file(p[1][0]), pending)
+                for (file_path, signature), info in zip(pending, probed):
+                    self._store(signature, info)
+                    results[file_path] = info if 'error' not in info else None
+        return results
+
+    def packet_index(self, file_path, build=True, job=None):
+        """فهرس حزم الفيديو (PacketIndex) من الكاش، أو بناؤه بمرور demux واحد وتخزينه
+
+        build=False يُرجع الفهرس فقط إذا كان مخزناً (للاستدعاء من خيط الواجهة).
+        الطلبات المتزامنة لنفس الملف تنتظر بناءً واحداً بدل قراءة الملف أكثر من مرة.
+        """
+        try:
+            signature = file_signature(file_path)
+        except OSError as e:
+            print(f"Error indexing {file_path}: {e}")
+            return None
+
+        if signature in self._indexes:
+            return self._indexes[signature]
+        path, size, mtime = signature
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM packet_indexes WHERE path = ? AND size = ? AND mtime = ?",
+                (path, size, mtime)
+            ).fetchone()
+        if row is not None:
+            index = PacketIndex.from_bytes(row[0]) if row[0] else None
+            self._indexes[signature] = index
+            return index
+        if not build:
+            return None
+
+        with self._lock:
+            building = self._building.setdefault(signature, threading.Lock())
+        with building:
+            # انتهى بناء جارٍ لنفس الملف أثناء الانتظار
+            if signature in self._indexes:
+                return self._indexes[signature]
+            try:
+                index = build_packet_index(path, job)
+            except Exception as e:
+                print(f"Error indexing {path}: {e}")
+                index = None
+            else:
+                if index is not None or job is None or not job.is_cancelled():
+                    self._store_index(signature, index)
+            finally:
+                with self._lock:
+                    self._building.pop(signature, None)
+            return index
+
+    def _store_index(self, signature, index):
+        path, size, mtime = signature
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO packet_indexes (path, size, mtime, data) VALUES (?, ?, ?, ?)",
+                (path, size, mtime, sqlite3.Binary(index.to_bytes() if index is not None else b''))
+            )
+            self._conn.commit()
+        self._indexes[signature] = index
+
+    def invalidate(self, file_path):
+        """حذف معلومات ملف من الكاش"""
+        with self._lock:
+            self._conn.execute("DELETE FROM probes WHERE path = ?", (os.path.abspath(file_path),))
+            self._conn.execute("DELETE FROM packet_indexes WHERE path = ?", (os.path.abspath(file_path),))
+            self._conn.commit()
+            path = os.path.abspath(file_path)
+            for signature in [sig for sig in self._indexes if sig[0] == path]:
+                del self._indexes[signature]
+            for signature in [sig for sig in self._errors if sig[0] == path]:
+                del self._errors[signature]
+
+    def _load(self, signature):
+        path, size, mtime = signature
+        with self._lock:
+            failure = self._errors.get(signature)
+            if failure is not None:
+                # فشل حديث: لا نعيد فتح الملف مع كل طلب، لكن نحاول مجدداً بعد المهلة
+                if time.monotonic() - failure[0] < ERROR_RETRY_SECONDS:
+                    return failure[1]
+                del self._errors[signature]
+            row = self._conn.execute(
+                "SELECT info FROM probes WHERE path = ? AND size = ? AND mtime = ?",
+                (path, size, mtime)
+            ).fetchone()
+        info = json.loads(row[0]) if row else None
+        # صفوف أخطاء قديمة من إصدارات سابقة: تُعامل كملف لم يُقرأ
+        return info if info is not None and 'error' not in info else None
+
+    def _store(self, signature, info):
+        path, size, mtime = signature
+        with self._lock:
+            if 'error' in info:
+                self._errors[signature] = (time.monotonic(), info)
+                return
+            self._errors.pop(signature, None)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO probes (path, size, mtime, info) VALUES (?, ?, ?, ?)",
+                (path, size, mtime, json.dumps(info))
+            )
+            self._conn.commit()
+
+    def _probe_file(self, path):
+        """قراءة المدة والـ fps والمسارات والكوديك والإطارات المفتاحية في مرور واحد"""
+        try:
+            with av.open(path) as container:
+                info = {
+                    'path': path,
+                    'format': container.format.name,
+                    'duration': container.duration / av.time_base if container.duration else 0.0,
+                    'streams': [],
+                    'has_video': False,
+                    'has_audio': False,
+                    'fps': 0.0,
+                    'width': 0,
+                    'height': 0,
+                    'frame_count': 0,
+                    'keyframe_interval': 0.0,
+                    'sample_rate': 0,
+                    'channels': 0,
+                }
+
+                video_stream = None
+                for stream in container.streams:
+                    stream_info = {
+                        'index': stream.index,
+                        'type': stream.type,
+                        'codec': stream.codec_context.name if stream.codec_context else None,
+                    }
+                    if stream.duration and stream.time_base:
+                        stream_info['duration'] = float(stream.duration * stream.time_base)
+
+                    if stream.type == 'video' and video_stream is None:
+                        video_stream = stream
+                        rate = stream.average_rate or stream.guessed_rate
+                        stream_info.update({
+                            'width': stream.codec_context.width,
+                            'height': stream.codec_context.height,
+                            'fps': float(rate) if rate else 0.0,
+                            'frames': stream.frames,
+                        })
+                        info.update({
+                            'has_video': True,
+                            'video_codec': stream_info['codec'],
+                            'width': stream_info['width'],
+                            'height': stream_info['height'],
+                            'fps': stream_info['fps'],
+                            'frame_count': stream.frames,
+                        })
+                    elif stream.type == 'audio' and not info['has_audio']:
+                        stream_info.update({
+                            'sample_rate': stream.codec_context.sample_rate,
+                            'channels': stream.codec_context.channels,
+                        })
+                        info.update({
+                            'has_audio': True,
+                            'audio_codec': stream_info['codec'],
+                            'sample_rate': stream_info['sample_rate'],
+                            'channels': stream_info['channels'],
+                        })
+                    info['streams'].append(stream_info)
+
+                if not info['duration']:
+                    info['duration'] = max((s.get('duration', 0.0) for s in info['streams']), default=0.0)
+                if info['has_video'] and not info['frame_count'] and info['fps']:
+                    info['frame_count'] = int(round(info['duration'] * info['fps']))
+
+                if video_stream is not None and info['duration'] > 0:
+                    info['keyframe_interval'] = self._scan_keyframes(container, video_stream)
+                return info
+        except Exception as e:
+            print(f"Error probing {path}: {e}")
+            return {'path': path, 'error': str(e)}
+
+    def _scan_keyframes(self, container, video_stream):
+        """قياس متوسط المسافة بين الإطارات المفتاحية بقراءة الحزم فقط (بدون فك ترميز)"""
+        keyframe_times = []
+        for i, packet in enumerate(container.demux(video_stream)):
+            if i >= KEYFRAME_SCAN_PACKETS:
+                break
+            if packet.is_keyframe and packet.pts is not None:
+                keyframe_times.append(float(packet.pts * video_stream.time_base))
+        if len(keyframe_times) < 2:
+            return 0.0
+        return (keyframe_times[-1] - keyframe_times[0]) / (len(keyframe_times) - 1)
+
+
+# إنشاء نسخة واحدة من MediaProbe
+media_probe = MediaProbe()
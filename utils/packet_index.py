@@ -0,0 +1,130 @@
+import io
+
+import av
+import numpy as np
+
+
+class PacketIndex:
+    """فهرس حزم مسار الفيديو من مرور demux واحد بدون فك ترميز
+
+    يحفظ pts كل إطار بترتيب العرض والإطارات المفتاحية، فيعطي زمن كل إطار بدقة
+    (حتى في الملفات متغيرة معدل الإطارات VFR) وأقرب إطار مفتاحي لأي زمن بـ O(log n).
+    الأزمنة بالثواني على ساعة المسار (pts * time_base) كما في frame.time.
+    """
+
+    def __init__(self, pts, keyframes, time_base, end_pts=None):
+        self.pts = np.asarray(pts, dtype=np.int64)            # مرتبة بترتيب العرض
+        self.keyframes = np.asarray(keyframes, dtype=np.int64)  # pts الإطارات المفتاحية (مرتبة)
+        self.time_base = float(time_base)
+        if end_pts is None:
+            # مدة الإطار الأخير غير معروفة: نفترضها مثل المسافة الوسيطة بين الإطارات
+            step = int(np.median(np.diff(self.pts))) if len(self.pts) > 1 else 0
+            end_pts = int(self.pts[-1]) + step if len(self.pts) else 0
+        self.end_pts = int(end_pts)
+
+    @property
+    def frame_count(self):
+        return len(self.pts)
+
+    @property
+    def start_time(self):
+        return float(self.pts[0]) * self.time_base if len(self.pts) else 0.0
+
+    @property
+    def duration(self):
+        """المدة الدقيقة من أول إطار حتى نهاية آخر إطار"""
+        if not len(self.pts):
+            return 0.0
+        return (self.end_pts - int(self.pts[0])) * self.time_base
+
+    @property
+    def is_variable_rate(self):
+        """هل تختلف المسافة بين الإطارات (مع سماحية 1%)"""
+        if len(self.pts) < 3:
+            return False
+        steps = np.diff(self.pts)
+        return bool(steps.max() - steps.min() > 0.01 * np.median(steps))
+
+    def times(self):
+        """زمن كل إطار بالثواني"""
+        return self.pts * self.time_base
+
+    def time_of(self, frame):
+        return float(self.pts[frame]) * self.time_base
+
+    def frame_at(self, time):
+        """رقم الإطار المعروض عند time (آخر إطار يبدأ عنده أو قبله)"""
+        if not len(self.pts):
+            return 0
+        target = time / self.time_base
+        # سماحية نصف وحدة زمنية لأخطاء التقريب في تحويل الثواني
+        frame = int(np.searchsorted(self.pts, target + 0.5, side='right')) - 1
+        return min(max(frame, 0), len(self.pts) - 1)
+
+    def keyframe_before(self, pts):
+        """pts أقرب إطار مفتاحي عند pts أو قبله (أو أول إطار مفتاحي)"""
+        if not len(self.keyframes):
+            return int(self.pts[0]) if len(self.pts) else 0
+        i = int(np.searchsorted(self.keyframes, pts, side='right')) - 1
+        return int(self.keyframes[max(i, 0)])
+
+    def nearest_keyframe(self, time):
+        """pts أقرب إطار مفتاحي إلى time (قبله أو بعده)"""
+        if not len(self.keyframes):
+            return self.keyframe_before(0)
+        target = time / self.time_base
+        i = int(np.searchsorted(self.keyframes, target))
+        candidates = self.keyframes[max(i - 1, 0):i + 1]
+        return int(candidates[np.argmin(np.abs(candidates - target))])
+
+    def seek_target(self, time):
+        """(pts الإطار المفتاحي الذي نبدأ منه، pts الإطار المطلوب) لفك ترميز الإطار عند time"""
+        target = int(self.pts[self.frame_at(time)]) if len(self.pts) else 0
+        return self.keyframe_before(target), target
+
+    def gop_sizes(self):
+        """عدد الإطارات في كل مجموعة GOP (من إطار مفتاحي حتى الذي يليه)"""
+        if not len(self.keyframes):
+            return np.array([len(self.pts)], dtype=np.int64)
+        starts = np.searchsorted(self.pts, self.keyframes)
+        return np.diff(np.append(starts, len(self.pts)))
+
+    def to_bytes(self):
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, pts=self.pts, keyframes=self.keyframes,
+                            meta=np.array([self.time_base, self.end_pts], dtype=np.float64))
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        with np.load(io.BytesIO(data)) as arrays:
+            time_base, end_pts = arrays['meta']
+            return cls(arrays['pts'], arrays['keyframes'], time_base, int(end_pts))
+
+
+def build_packet_index(file_path, job=None):
+    """قراءة حزم أول مسار فيديو فقط (بدون فك ترميز)؛ None إذا لم يكن في الملف فيديو"""
+    with av.open(file_path) as container:
+        if not container.streams.video:
+            return None
+        stream = container.streams.video[0]
+        pts = []
+        keyframes = []
+        end_pts = None
+        for packet in container.demux(stream):
+            if job is not None and job.is_cancelled():
+                return None
+            # حزمة التفريغ في نهاية الملف بلا pts
+            if packet.pts is None:
+                continue
+            pts.append(packet.pts)
+            if packet.is_keyframe:
+                keyframes.append(packet.pts)
+            if packet.duration and (end_pts is None or packet.pts + packet.duration > end_pts):
+                end_pts = packet.pts + packet.duration
+        if not pts:
+            return None
+        # الحزم تصل بترتيب فك الترميز (dts)؛ الإطارات B تجعل ترتيب العرض مختلفاً
+        return PacketIndex(np.sort(np.asarray(pts, dtype=np.int64)),
+                           np.sort(np.asarray(keyframes, dtype=np.int64)),
+                           stream.time_base, end_pts)
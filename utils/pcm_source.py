@@ -0,0 +1,197 @@
+import struct
+from functools import lru_cache
+
+import av
+import numpy as np
+
+# حجم النافذة التي نربطها بالذاكرة في كل مرة؛ النوافذ تُفك بعد معالجتها
+# حتى تبقى الذاكرة المقيمة صغيرة مهما كان حجم الملف
+WINDOW_BYTES = 16 * 1024 * 1024
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+@lru_cache(maxsize=None)
+def downmix_weights(channels):
+    """وزن كل قناة عند التحويل إلى mono كما يفعل AudioResampler(layout='mono') في مسار av
+
+    تُقرأ من المحوّل نفسه (إطار فيه نبضة واحدة في كل قناة) حتى يعطي المساران نفس المستوى.
+    """
+    if channels == 1:
+        return np.ones(1, dtype=np.float32)
+    impulses = np.eye(channels, dtype=np.float32).reshape(1, -1)
+    frame = av.AudioFrame.from_ndarray(impulses, format='flt', layout=f"{channels} channels")
+    frame.sample_rate = 48000
+    resampler = av.AudioResampler(format='flt', layout='mono', rate=frame.sample_rate)
+    frames = resampler.resample(frame) + resampler.resample(None)
+    return np.concatenate([f.to_ndarray().reshape(-1) for f in frames])[:channels].astype(np.float32)
+
+
+class PcmSource:
+    """ملف صوت PCM غير مضغوط يُقرأ مباشرة عبر numpy.memmap بدون فك ترميز أو إعادة تعيين معدل"""
+
+    def __init__(self, path, offset, frame_count, channels, sample_rate,
+                 sample_width, is_float, big_endian=False):
+        self.path = path
+        self.offset = offset
+        self.frame_count = frame_count
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.is_float = is_float
+        self.big_endian = big_endian
+        self.frame_bytes = channels * sample_width
+
+    @property
+    def duration(self):
+        return self.frame_count / self.sample_rate if self.sample_rate else 0.0
+
+    def blocks(self, block_frames=4096):
+        """كتل mono بصيغة float32 (-1..1) مع زمن بداية كل كتلة"""
+        window_frames = max(block_frames, WINDOW_BYTES // self.frame_bytes // block_frames * block_frames)
+        for window_start in range(0, self.frame_count, window_frames):
+            count = min(window_frames, self.frame_count - window_start)
+            window = np.memmap(self.path, dtype=np.uint8, mode='r',
+                               offset=self.offset + window_start * self.frame_bytes,
+                               shape=(count * self.frame_bytes,))
+            for start in range(0, count, block_frames):
+                end = min(start + block_frames, count)
+                mono = self._to_mono(window[start * self.frame_bytes:end * self.frame_bytes])
+                yield mono, (window_start + start) / self.sample_rate
+            # لا توجد مراجع أخرى للنافذة، فيُفك ربطها فوراً
+            del window
+
+    def _to_mono(self, raw):
+        """تحويل بايتات الإطارات إلى قناة واحدة float32 بدون نسخ الملف كاملاً"""
+        order = '>' if self.big_endian else '<'
+        if self.sample_width == 3:
+            b = raw.reshape(-1, self.channels, 3).astype(np.int32)
+            if self.big_endian:
+                b = b[..., ::-1]
+            values = (b[..., 0] | (b[..., 1] << 8) | (b[..., 2] << 16)) << 8 >> 8
+            scale = float(1 << 23)
+        elif self.is_float:
+            values = raw.view(f'{order}f{self.sample_width}').reshape(-1, self.channels)
+            scale = 1.0
+        elif self.sample_width == 1:
+            # WAV بعمق 8 بت بدون إشارة
+            values = raw.reshape(-1, self.channels).astype(np.int16) - 128
+            scale = 128.0
+        else:
+            values = raw.view(f'{order}i{self.sample_width}').reshape(-1, self.channels)
+            scale = float(1 << (8 * self.sample_width - 1))
+
+        # جمع القنوات عموداً بعمود أسرع بكثير من reduce على المحور 1
+        weights = downmix_weights(self.channels) / scale
+        mono = values[:, 0] * weights[0]
+        for channel in range(1, self.channels):
+            mono += values[:, channel] * weights[channel]
+        return mono.astype(np.float32, copy=False)
+
+
+def open_pcm_source(path):
+    """PcmSource لملفات WAV/RF64/AIFF غير المضغوطة، أو None لأي صيغة أخرى"""
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(12)
+            if len(header) < 12:
+                return None
+            if header[:4] in (b'RIFF', b'RF64') and header[8:12] == b'WAVE':
+                return _parse_wav(path, f, header[:4] == b'RF64')
+            if header[:4] == b'FORM' and header[8:12] in (b'AIFF', b'AIFC'):
+                return _parse_aiff(path, f, header[8:12] == b'AIFC')
+    except (OSError, struct.error, ValueError) as e:
+        print(f"Error reading PCM header of {path}: {e}")
+    return None
+
+
+def _parse_wav(path, f, is_rf64):
+    fmt = None
+    data_size_64 = None
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            return None
+        chunk_id, size = struct.unpack('<4sI', chunk)
+        if chunk_id == b'ds64':
+            body = f.read(size)
+            # riff_size, data_size, sample_count
+            data_size_64 = struct.unpack('<QQQ', body[:24])[1]
+        elif chunk_id == b'fmt ':
+            body = f.read(size)
+            tag, channels, rate, _, _, bits = struct.unpack('<HHIIHH', body[:16])
+            if tag == WAVE_FORMAT_EXTENSIBLE and size >= 26:
+                tag = struct.unpack('<H', body[24:26])[0]
+            fmt = (tag, channels, rate, bits)
+        elif chunk_id == b'data':
+            if fmt is None:
+                return None
+            tag, channels, rate, bits = fmt
+            if tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT) or bits % 8 or not channels:
+                return None
+            width = bits // 8
+            if tag == WAVE_FORMAT_IEEE_FLOAT and width not in (4, 8):
+                return None
+            if tag == WAVE_FORMAT_PCM and width not in (1, 2, 3, 4):
+                return None
+            if is_rf64 and size == 0xFFFFFFFF and data_size_64 is not None:
+                size = data_size_64
+            offset = f.tell()
+            # بعض المسجلات تكتب حجماً أكبر من الملف الفعلي
+            f.seek(0, 2)
+            size = min(size, f.tell() - offset)
+            return PcmSource(path, offset, size // (channels * width), channels, rate,
+                             width, tag == WAVE_FORMAT_IEEE_FLOAT)
+        else:
+            f.seek(size, 1)
+        if size % 2:
+            f.seek(1, 1)
+
+
+def _parse_aiff(path, f, is_aifc):
+    comm = None
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            return None
+        chunk_id, size = struct.unpack('>4sI', chunk)
+        if chunk_id == b'COMM':
+            body = f.read(size)
+            channels, frames, bits = struct.unpack('>hIh', body[:8])
+            rate = _extended_to_float(body[8:18])
+            compression = body[18:22] if is_aifc and size >= 22 else b'NONE'
+            comm = (channels, frames, bits, int(rate), compression)
+        elif chunk_id == b'SSND':
+            if comm is None:
+                return None
+            channels, frames, bits, rate, compression = comm
+            data_offset = struct.unpack('>I', f.read(4))[0]
+            f.read(4)
+            offset = f.tell() + data_offset
+            width = bits // 8
+            if compression in (b'NONE', b'twos') and width in (2, 3, 4):
+                big_endian, is_float = True, False
+            elif compression == b'sowt' and width in (2, 3, 4):
+                big_endian, is_float = False, False
+            elif compression in (b'fl32', b'FL32') and width == 4:
+                big_endian, is_float = True, True
+            else:
+                return None
+            return PcmSource(path, offset, frames, channels, rate, width, is_float, big_endian)
+        else:
+            f.seek(size + (size % 2), 1)
+            continue
+        if size % 2:
+            f.seek(1, 1)
+
+
+def _extended_to_float(data):
+    """تحويل رقم IEEE 754 الموسع (80 بت) المستخدم في AIFF لمعدل العينات"""
+    exponent, mantissa = struct.unpack('>HQ', data)
+    sign = -1 if exponent & 0x8000 else 1
+    exponent &= 0x7FFF
+    if exponent == 0 and mantissa == 0:
+        return 0.0
+    return sign * mantissa * 2.0 ** (exponent - 16383 - 63)
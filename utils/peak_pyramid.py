@@ -0,0 +1,206 @@
+import io
+
+import numpy as np
+
+from utils.thumbnail_cache import thumbnail_cache
+
+# عدد العينات في كل خانة من المستوى الأساسي
+BASE_BLOCK = 256
+
+
+def quantize(values, dtype):
+    """تحويل قيم (-1..1) إلى أعداد صحيحة مضغوطة"""
+    scale = np.iinfo(dtype).max
+    return np.clip(np.round(values * scale), -scale, scale).astype(dtype)
+
+
+class PeakPyramid:
+    """هرم قمم الصوت (min/max) بمستويات من قوى 2؛ أي تكبير هو مجرد شريحة من المستوى المناسب"""
+
+    def __init__(self, sample_rate, mins, maxs, base_block=BASE_BLOCK, sample_count=0):
+        self.sample_rate = sample_rate
+        self.base_block = base_block
+        self.sample_count = sample_count
+        self.scale = float(np.iinfo(mins.dtype).max) if len(mins) else 1.0
+        # المستوى 0 = base_block عينة لكل خانة، المستوى k = base_block * 2^k
+        self.levels = [(mins, maxs)]
+        while len(mins) > 1:
+            if len(mins) % 2:
+                mins = np.append(mins, mins[-1])
+                maxs = np.append(maxs, maxs[-1])
+            mins = mins.reshape(-1, 2).min(axis=1)
+            maxs = maxs.reshape(-1, 2).max(axis=1)
+            self.levels.append((mins, maxs))
+
+    @classmethod
+    def from_samples(cls, samples, sample_rate, base_block=BASE_BLOCK, dtype=np.int16):
+        """بناء الهرم من عينات mono (float في المدى -1..1) موجودة كلها في الذاكرة"""
+        reducer = PeakReducer(sample_rate, base_block, dtype)
+        reducer.feed(np.asarray(samples, dtype=np.float32))
+        return reducer.finish()
+
+    @classmethod
+    def empty(cls, sample_rate=48000):
+        return cls(sample_rate, np.zeros(0, np.int16), np.zeros(0, np.int16))
+
+    @property
+    def duration(self):
+        return self.sample_count / self.sample_rate if self.sample_rate else 0.0
+
+    def is_empty(self):
+        return self.sample_count == 0
+
+    def peak(self):
+        """أعلى قيمة مطلقة في الملف كله (0..1)"""
+        if self.is_empty():
+            return 0.0
+        mins, maxs = self.levels[-1]
+        return max(abs(int(mins[0])), abs(int(maxs[0]))) / self.scale
+
+    def level_for(self, samples_per_pixel):
+        """أعلى مستوى لا تزيد خانته عن عرض بكسل واحد"""
+        ratio = samples_per_pixel / self.base_block
+        if ratio < 2:
+            return 0
+        return min(int(np.log2(ratio)), len(self.levels) - 1)
+
+    def peaks(self, start_time, end_time, width):
+        """القمم (mins, maxs) بين زمنين مختصرة إلى width عمود، كقيم float بين -1 و 1"""
+        width = int(width)
+        if self.is_empty() or width <= 0 or end_time <= start_time:
+            return np.zeros(0, np.float32), np.zeros(0, np.float32)
+
+        samples_per_pixel = (end_time - start_time) * self.sample_rate / width
+        level = self.level_for(samples_per_pixel)
+        mins, maxs = self.levels[level]
+        block = self.base_block << level
+        first = int(start_time * self.sample_rate // block)
+        last = int(np.ceil(end_time * self.sample_rate / block))
+        first = max(0, min(first, len(mins)))
+        last = max(first, min(last, len(mins)))
+        if last == first:
+            return np.zeros(0, np.float32), np.zeros(0, np.float32)
+        mins, maxs = mins[first:last], maxs[first:last]
+
+        # تجميع الخانات في أعمدة بعرض البكسل
+        if len(mins) > width:
+            edges = np.linspace(0, len(mins), width + 1).astype(np.intp)[:-1]
+            mins = np.minimum.reduceat(mins, edges)
+            maxs = np.maximum.reduceat(maxs, edges)
+        return mins.astype(np.float32) / self.scale, maxs.astype(np.float32) / self.scale
+
+    def envelope(self, start_time, end_time, width, normalize=True):
+        """غلاف الموجة (أعلى قيمة مطلقة لكل عمود) بين 0 و 1"""
+        mins, maxs = self.peaks(start_time, end_time, width)
+        levels = np.maximum(np.abs(mins), np.abs(maxs))
+        peak = self.peak()
+        if normalize and peak > 0:
+            levels /= peak
+        return levels
+
+    def save(self, path):
+        """حفظ المستوى الأساسي فقط في مسار أو ملف مفتوح؛ باقي المستويات تُبنى عند التحميل"""
+        mins, maxs = self.levels[0]
+        np.savez(path, mins=mins, maxs=maxs,
+                 meta=np.array([self.sample_rate, self.base_block, self.sample_count], np.int64))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            sample_rate, base_block, sample_count = (int(v) for v in data['meta'])
+            return cls(sample_rate, data['mins'], data['maxs'], base_block, sample_count)
+
+
+class PeakReducer:
+    """بناء المستوى الأساسي للهرم تدريجياً من كتل عينات بأي حجم دون الاحتفاظ بالعينات نفسها
+
+    الذاكرة المستخدمة هي حجم الهرم فقط (قيمتان لكل base_block عينة) مهما طال الملف.
+    """
+
+    def __init__(self, sample_rate, base_block=BASE_BLOCK, dtype=np.int16):
+        self.sample_rate = sample_rate
+        self.base_block = base_block
+        self.dtype = dtype
+        self.sample_count = 0
+        # بقايا الكتلة السابقة التي لم تكتمل بعد
+        self.carry = np.empty(base_block, np.float32)
+        self.carry_len = 0
+        # مخازن تتضاعف عند الامتلاء بدلاً من قائمة مصفوفات صغيرة
+        self.mins = np.empty(1024, dtype)
+        self.maxs = np.empty(1024, dtype)
+        self.block_count = 0
+
+    def feed(self, samples):
+        """إضافة كتلة عينات mono (float32 بين -1 و 1)"""
+        count = len(samples)
+        if not count:
+            return
+        self.sample_count += count
+
+        if self.carry_len:
+            take = min(self.base_block - self.carry_len, count)
+            self.carry[self.carry_len:self.carry_len + take] = samples[:take]
+            self.carry_len += take
+            samples = samples[take:]
+            if self.carry_len < self.base_block:
+                return
+            self._append(self.carry[None, :])
+            self.carry_len = 0
+
+        full = len(samples) - len(samples) % self.base_block
+        if full:
+            self._append(samples[:full].reshape(-1, self.base_block))
+        rest = len(samples) - full
+        if rest:
+            self.carry[:rest] = samples[full:]
+            self.carry_len = rest
+
+    def _append(self, blocks):
+        n = len(blocks)
+        needed = self.block_count + n
+        if needed > len(self.mins):
+            capacity = max(needed, len(self.mins) * 2)
+            self.mins = np.resize(self.mins, capacity)
+            self.maxs = np.resize(self.maxs, capacity)
+        self.mins[self.block_count:needed] = quantize(blocks.min(axis=1), self.dtype)
+        self.maxs[self.block_count:needed] = quantize(blocks.max(axis=1), self.dtype)
+        self.block_count = needed
+
+    def finish(self):
+        """إغلاق الكتلة الأخيرة غير المكتملة وإرجاع الهرم"""
+        if self.carry_len:
+            self._append(self.carry[None, :self.carry_len])
+            self.carry_len = 0
+        if not self.sample_count:
+            return PeakPyramid.empty(self.sample_rate)
+        return PeakPyramid(self.sample_rate, self.mins[:self.block_count].copy(),
+                           self.maxs[:self.block_count].copy(), self.base_block, self.sample_count)
+
+
+def peak_cache_key(file_path):
+    """مفتاح الهرم في كاش الصور المصغرة (ببصمة المحتوى مثل الصور)"""
+    # رقم الإصدار يتغير مع أي تغيير في حساب الهرم (مثل أوزان دمج القنوات) فلا تُقرأ أهرام قديمة
+    return f"{thumbnail_cache.fingerprint(file_path)}:peaks:2"
+
+
+def load_cached_pyramid(file_path):
+    """الهرم المحسوب سابقاً لهذا الملف أو None
+
+    الأهرام مخزنة في نفس قاعدة الصور المصغرة فتخضع لحدها على القرص وحذف الأقدم استخداماً.
+    """
+    try:
+        data = thumbnail_cache.get(peak_cache_key(file_path))
+        if data is not None:
+            return PeakPyramid.load(io.BytesIO(data))
+    except Exception as e:
+        print(f"Error loading peaks for {file_path}: {e}")
+    return None
+
+
+def store_cached_pyramid(file_path, pyramid):
+    try:
+        buffer = io.BytesIO()
+        pyramid.save(buffer)
+        thumbnail_cache.put(peak_cache_key(file_path), buffer.getvalue())
+    except Exception as e:
+        print(f"Error saving peaks for {file_path}: {e}")
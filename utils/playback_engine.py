@@ -0,0 +1,423 @@
+import math
+import threading
+import time
+
+import av
+from PyQt5.QtCore import QObject, QTimer, Qt, pyqtSignal
+from PyQt5.QtGui import QImage
+
+from utils.filmstrip import frame_to_image
+from utils.media_probe import media_probe
+from utils.proxy_manager import proxy_manager
+
+# عمق القراءة المسبقة بالإطارات: يبدأ صغيراً ويكبر عند نفاد المخزن أو بطء فك الترميز
+MIN_BUFFER_FRAMES = 4
+MAX_BUFFER_FRAMES = 48
+# إذا تجاوز زمن فك الإطار هذه النسبة من مدته نزيد العمق، وإذا قل عن الثانية نقلله
+SLOW_DECODE_RATIO = 0.8
+FAST_DECODE_RATIO = 0.5
+# الإطار المتأخر عن الساعة بأكثر من هذا (بالثواني) لا يُحوّل ولا يُعرض
+LATE_TOLERANCE = 0.04
+# الفاصل بين تحديثات عدادات المخزن للواجهة (ميلي ثانية)
+STATS_INTERVAL_MS = 500
+# جودة التشغيل: كسر من الدقة المعروضة (المسودة أسرع في فك الترميز والتحويل والذاكرة)
+PLAYBACK_QUALITIES = (("Full", 1), ("1/2", 2), ("1/4", 4), ("1/8", 8))
+# تصغير المسودة: متوسط المساحة رخيص ولا يسبب تعرجات عند التصغير الكبير
+DRAFT_INTERPOLATION = 'AREA'
+
+
+class FrameRing:
+    """مخزن حلقي بحجم ثابت لإطارات مفكوكة (الزمن، QImage) بين خيط فك الترميز والواجهة
+
+    الخانات محجوزة مرة واحدة بطول capacity؛ depth هو حد الملء الحالي الذي يتكيف مع
+    سرعة فك الترميز، والمنتج ينتظر عند بلوغه.
+    """
+
+    def __init__(self, capacity=MAX_BUFFER_FRAMES, depth=MIN_BUFFER_FRAMES):
+        self.capacity = capacity
+        self.depth = min(depth, capacity)
+        self.slots = [None] * capacity
+        self.head = 0  # خانة أقدم إطار
+        self.count = 0
+        self.finished = False  # وصل المنتج إلى نهاية الملف
+        self.condition = threading.Condition()
+
+    def push(self, item, is_stale):
+        """إضافة إطار مع الانتظار حتى تتوفر خانة؛ False إذا أصبح المنتج قديماً (is_stale)"""
+        with self.condition:
+            while self.count >= self.depth:
+                if is_stale():
+                    return False
+                self.condition.wait(0.05)
+            if is_stale():
+                return False
+            self.slots[(self.head + self.count) % self.capacity] = item
+            self.count += 1
+            return True
+
+    def peek(self):
+        with self.condition:
+            return self.slots[self.head] if self.count else None
+
+    def pop(self):
+        with self.condition:
+            if not self.count:
+                return None
+            item = self.slots[self.head]
+            self.slots[self.head] = None
+            self.head = (self.head + 1) % self.capacity
+            self.count -= 1
+            self.condition.notify_all()
+            return item
+
+    def finish(self):
+        with self.condition:
+            self.finished = True
+
+    def clear(self):
+        with self.condition:
+            self.slots = [None] * self.capacity
+            self.head = 0
+            self.count = 0
+            self.finished = False
+            self.condition.notify_all()
+
+    def resize(self, depth):
+        with self.condition:
+            self.depth = max(MIN_BUFFER_FRAMES, min(self.capacity, depth))
+            self.condition.notify_all()
+
+
+def open_video(path, start, quality=1):
+    """فتح ملف للفك المتتابع بدءاً من الإطار المفتاحي قبل start: (الحاوية، المسار، مولد الإطارات، البداية)
+
+    start بالثواني من أول إطار؛ البداية هي frame.time لأول إطار (start_time الحاوية غالباً
+    ليس صفراً) فيُطرح من أزمنة الإطارات لتطابق ساعة التشغيل التي تبدأ من الصفر.
+
+    في المسودة (quality > 1) يُطلب من المفكك التصغير بنفسه (lowres، مدعوم في MJPEG وMPEG-4
+    ويُتجاهل في غيرها) ويُتخطى فلتر إزالة التكتل، وهو من أغلى مراحل فك H.264.
+    يُقرأ البروكسي بدل الأصل إن كان جاهزاً (بنفس pts الأصل).
+    """
+    path = proxy_manager.resolve_preview_path(path)
+    container = av.open(path)
+    if not container.streams.video:
+        container.close()
+        return None
+    stream = container.streams.video[0]
+    # فك ترميز متتابع: تعدد خيوط الإطارات يرفع الإنتاجية في الملفات الكبيرة
+    stream.thread_type = 'AUTO'
+    if quality > 1:
+        stream.codec_context.options = {
+            'lowres': str(min(3, quality.bit_length() - 1)),
+            'skip_loop_filter': 'all',
+        }
+    index = media_probe.packet_index(path)
+    if index is not None:
+        origin = index.start_time
+        container.seek(index.seek_target(start + origin)[0], stream=stream, backward=True, any_frame=False)
+    else:
+        origin = float(stream.start_time * stream.time_base) if stream.start_time and stream.time_base else 0.0
+        if start > 0 and stream.time_base:
+            container.seek(int((start + origin) / stream.time_base), stream=stream, backward=True, any_frame=False)
+    return container, stream, container.decode(stream), origin
+
+
+class FileSource:
+    """مصدر تشغيل لملف واحد: يعطي (الزمن، إطار av) بترتيب العرض بدءاً من الإطار المفتاحي قبل start"""
+
+    def __init__(self, path):
+        self.path = path
+        info = media_probe.probe(path) or {}
+        self.frame_duration = 1 / info['fps'] if info.get('fps') else 1 / 25
+        self.duration = info.get('duration', 0.0)
+
+    def prepare(self):
+        """تجهيز المصدر في خيط الواجهة قبل بدء الفك (لا شيء لملف واحد)"""
+
+    def frames(self, start, is_stale, quality=1):
+        opened = open_video(self.path, start, quality)
+        if opened is None:
+            return
+        container, _, decoded, origin = opened
+        with container:
+            for frame in decoded:
+                if is_stale():
+                    return
+                if frame.pts is not None and frame.time is not None:
+                    yield frame.time - origin, frame
+
+    def close(self):
+        pass
+
+
+class PlaybackEngine(QObject):
+    """محرك تشغيل: خيط يفك الترميز أمام رأس التشغيل إلى مخزن حلقي، ومؤقت في الواجهة يعرض
+    الإطار المناسب لزمن الساعة
+
+    الساعة داخلية افتراضياً، أو ساعة خارجية (مثل موضع الصوت) لمزامنة الصورة مع الصوت.
+    عندما يتأخر فك الترميز تُسقط الإطارات المتأخرة بدلاً من إبطاء الساعة، فيبقى الصوت
+    والصورة متزامنين. خيط فك واحد يخدم كل القفزات: القفز يكتب الهدف الأحدث فقط ويوقف
+    الفك الجاري، فالسحب المتواصل لا ينشئ خيطاً لكل حركة.
+    """
+    frameReady = pyqtSignal(object, float)  # QImage، زمن الإطار
+    stateChanged = pyqtSignal(bool)  # قيد التشغيل
+    statsChanged = pyqtSignal(object)  # قاموس العدادات
+    finished = pyqtSignal()
+
+    def __init__(self, capacity=MAX_BUFFER_FRAMES):
+        super().__init__()
+        self.ring = FrameRing(capacity)
+        self.source = None
+        self.height = None  # ارتفاع الإطارات المعروضة (None = الدقة التي يخرجها المفكك)
+        self.quality = 1  # مقام كسر الدقة (1 كاملة، 2 نصف، ...)
+        self.frame_duration = 1 / 25
+        self.playing = False
+        self.external_clock = None  # دالة تُرجع الزمن بالثواني أو None
+        self._position = 0.0  # زمن الساعة عند آخر تشغيل/إيقاف/قفز
+        self._started_at = 0.0
+        self._generation = 0  # يزيد مع كل قفز حتى يتوقف المنتج القديم
+        self._condition = threading.Condition()
+        self._target = None  # آخر قفز لم يبدأ فكه بعد (يحل محل أي قفز أقدم)
+        self._worker = None
+        self._running = True
+        self._decode_cost = 0.0  # متوسط زمن فك وتحويل الإطار (ثوانٍ)
+        # العدادات تُعدّل من خيط الواجهة ومن خيط الفك، فكل تعديل عليها يتم مع _condition
+        self.shown_frames = 0
+        self.dropped_frames = 0
+        self.underruns = 0
+        self._starved = False  # المخزن فارغ منذ آخر إطار معروض
+
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(self.tick)
+        self.stats_timer = QTimer(self)
+        self.stats_timer.setInterval(STATS_INTERVAL_MS)
+        self.stats_timer.timeout.connect(lambda: self.statsChanged.emit(self.stats()))
+
+    def open(self, file_path, height=None):
+        """تحميل ملف والبدء بملء المخزن من بدايته"""
+        self.open_source(FileSource(file_path), height)
+
+    def open_source(self, source, height=None):
+        """تشغيل أي مصدر يعطي (الزمن، إطار av أو None للفراغ) مثل FileSource أو SequenceSource"""
+        self.pause()
+        if self.source is not None and self.source is not source:
+            self.source.close()
+        self.source = source
+        self.height = height
+        self.frame_duration = source.frame_duration
+        self.timer.setInterval(max(1, int(self.frame_duration * 1000 / 4)))
+        with self._condition:
+            self.shown_frames = self.dropped_frames = self.underruns = 0
+        self.seek(0.0)
+
+    def set_clock(self, clock):
+        """استخدام ساعة خارجية (ثوانٍ) كمرجع للمزامنة، أو None للساعة الداخلية"""
+        self._position = self.clock()
+        self._started_at = time.perf_counter()
+        self.external_clock = clock
+
+    def set_quality(self, quality):
+        """تغيير جودة المسودة: المخزن يُملأ من جديد بالدقة الجديدة من الموضع الحالي"""
+        if quality != self.quality:
+            self.quality = quality
+            if self.source is not None:
+                self.seek(self.clock())
+
+    def set_height(self, height):
+        if height != self.height:
+            self.height = height
+            if self.source is not None:
+                self.seek(self.clock())
+
+    def clock(self):
+        if self.external_clock is not None:
+            position = self.external_clock()
+            if position is not None:
+                return position
+        if self.playing:
+            return self._position + time.perf_counter() - self._started_at
+        return self._position
+
+    def play(self):
+        if self.playing or self.source is None:
+            return
+        self._started_at = time.perf_counter()
+        self.playing = True
+        self.timer.start()
+        self.stats_timer.start()
+        self.stateChanged.emit(True)
+
+    def pause(self):
+        if not self.playing:
+            return
+        self._position = self.clock()
+        self.playing = False
+        self.timer.stop()
+        self.stats_timer.stop()
+        self.stateChanged.emit(False)
+        self.statsChanged.emit(self.stats())
+
+    def stop(self):
+        self.pause()
+        self._generation += 1
+        self.ring.clear()
+        self._position = 0.0
+
+    def seek(self, position):
+        """تفريغ المخزن وبدء فك الترميز من position"""
+        self._position = max(0.0, position)
+        self._started_at = time.perf_counter()
+        self._generation += 1
+        self.ring.clear()
+        if self.source is not None:
+            self.source.prepare()
+            if not self.playing:
+                # متوقف: المؤقت يعرض أول إطار يصل كصورة ثابتة ثم يتوقف
+                self.timer.start()
+            with self._condition:
+                self._target = (self._generation, self.source, self._position, self.height, self.quality)
+                self._condition.notify()
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="PlaybackDecoder", daemon=True)
+                    self._worker.start()
+
+    def cleanup(self):
+        self.stop()
+        with self._condition:
+            self._target = None
+        if self.source is not None:
+            self.source.close()
+        self.source = None
+
+    def shutdown(self):
+        """إيقاف خيط الفك نهائياً (عند إغلاق التطبيق)"""
+        self.cleanup()
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+            worker = self._worker
+        if worker is not None:
+            worker.join(2.0)
+
+    def stats(self):
+        """عدادات المخزن: الملء والعمق الحالي والإطارات المعروضة والمسقطة ومرات نفاد المخزن"""
+        with self._condition:
+            shown, dropped, underruns = self.shown_frames, self.dropped_frames, self.underruns
+        return {
+            'buffer_fill': self.ring.count,
+            'buffer_depth': self.ring.depth,
+            'buffer_capacity': self.ring.capacity,
+            'shown_frames': shown,
+            'dropped_frames': dropped,
+            'underruns': underruns,
+            'decode_ms': self._decode_cost * 1000,
+        }
+
+    def _count_dropped(self, count=1):
+        with self._condition:
+            self.dropped_frames += count
+
+    def tick(self):
+        """عرض آخر إطار حان وقته؛ الإطارات التي تجاوزتها الساعة في المخزن تُحسب مسقطة"""
+        if not self.playing:
+            item = self.ring.peek()
+            if item is not None:
+                self.frameReady.emit(item[1], item[0])
+            if item is not None or self.ring.finished:
+                self.timer.stop()
+            return
+        now = self.clock()
+        shown = None
+        skipped = 0
+        while True:
+            item = self.ring.peek()
+            if item is None or item[0] > now + self.frame_duration / 2:
+                break
+            self.ring.pop()
+            if shown is not None:
+                skipped += 1
+            shown = item
+        if skipped:
+            self._count_dropped(skipped)
+        if shown is not None:
+            self._starved = False
+            with self._condition:
+                self.shown_frames += 1
+            self.frameReady.emit(shown[1], shown[0])
+        elif self.ring.finished and not self.ring.count:
+            self.pause()
+            self.finished.emit()
+        elif not self.ring.count and not self._starved:
+            # المخزن فارغ والساعة تتقدم: القراءة المسبقة غير كافية
+            self._starved = True
+            with self._condition:
+                self.underruns += 1
+            self.ring.resize(self.ring.depth + 2)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and self._target is None:
+                    self._condition.wait()
+                if not self._running:
+                    break
+                target, self._target = self._target, None
+            # قفز أُلغي (إيقاف) قبل أن يبدأ: لا داعي لفتح الملف
+            if target[0] == self._generation:
+                self._decode_loop(*target)
+
+    def _decode_loop(self, generation, source, start, height, quality):
+        is_stale = lambda: generation != self._generation
+        frames = source.frames(start, is_stale, quality)
+        # الإطارات تُحول وتُخزن مباشرة بدقة المسودة
+        interpolation = DRAFT_INTERPOLATION if quality > 1 else None
+        if height is not None:
+            height = max(1, height // quality)
+        blank = None
+        try:
+            decoded = 0
+            began = time.perf_counter()
+            for frame_time, frame in frames:
+                if is_stale():
+                    return
+                # إطارات ما قبل الهدف بعد القفز للإطار المفتاحي: فك فقط بدون تحويل
+                if frame_time < start - self.frame_duration / 2:
+                    began = time.perf_counter()
+                    continue
+                if self.playing and frame_time < self.clock() - LATE_TOLERANCE:
+                    # متأخر أصلاً: التحويل والتصغير أغلى من فك الترميز في ملفات 4K
+                    self._count_dropped()
+                    began = time.perf_counter()
+                    continue
+                if frame is None:
+                    # فراغ بين المقاطع: صورة سوداء واحدة مشتركة
+                    if blank is None:
+                        blank_height = height or 360
+                        blank = QImage(int(round(blank_height * 16 / 9)), blank_height, QImage.Format_RGB888)
+                        blank.fill(Qt.black)
+                    image = blank
+                else:
+                    image = frame_to_image(frame, height or frame.height, interpolation)
+                    self._measure(time.perf_counter() - began)
+                    decoded += 1
+                    if decoded % 30 == 0 and self._decode_cost < FAST_DECODE_RATIO * self.frame_duration:
+                        self.ring.resize(self.ring.depth - 1)
+                if not self.ring.push((frame_time, image), is_stale):
+                    return
+                began = time.perf_counter()
+        except Exception as e:
+            print(f"Error during playback: {e}")
+        finally:
+            frames.close()
+        if not is_stale():
+            self.ring.finish()
+
+    def _measure(self, cost):
+        """متوسط متحرك لزمن الإطار مع زيادة العمق إذا اقترب من مدة الإطار"""
+        self._decode_cost = cost if not self._decode_cost else 0.9 * self._decode_cost + 0.1 * cost
+        if self._decode_cost > SLOW_DECODE_RATIO * self.frame_duration:
+            needed = MIN_BUFFER_FRAMES * self._decode_cost / (SLOW_DECODE_RATIO * self.frame_duration)
+            if needed > self.ring.depth:
+                self.ring.resize(math.ceil(needed))
+
@@ -0,0 +1,234 @@
+import os
+import sys
+import time
+import queue
+import sqlite3
+import hashlib
+import threading
+import subprocess
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from utils.cache_utils import get_cache_dir, file_signature
+
+# أقصى مساحة على القرص لكل ملفات البروكسي؛ الأقدم استخداماً يُحذف أولاً
+PROXY_BUDGET_BYTES = 20 * 1024 ** 3
+# عدد عمليات التحويل المتوازية (التحويل ثقيل، نترك بقية الأنوية للواجهة والتشغيل)
+PROXY_WORKERS = max(1, min(2, (os.cpu_count() or 2) // 2))
+# جذر المشروع: عمليات التحويل تُشغَّل منه كـ python -m utils.proxy_worker
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STATUS_READY = 'ready'
+STATUS_SKIPPED = 'skipped'  # الأصل لا يحتاج بروكسي (صغير وكل إطاراته مفتاحية أو بدون فيديو)
+STATUS_FAILED = 'failed'
+
+
+class ProxyManager(QObject):
+    """توليد ملفات بروكسي صغيرة (MJPEG) للأصول في عمليات خلفية منخفضة الأولوية
+
+    كل تحويل عملية مستقلة عبر utils/proxy_worker.py (لا تستورد إلا utils.proxy_transcode)،
+    وعددها المتزامن محدود بـ max_workers خيطاً يسحب من طابور مشترك.
+
+    المعاينة (التشغيل والسحب وشريط الفيديو والصور المصغرة) تمر عبر resolve_preview_path
+    فتستخدم البروكسي تلقائياً عند جهوزه، أما التصدير فيقرأ الأصل دائماً. حالة كل أصل
+    محفوظة في SQLite بتوقيعه (المسار، الحجم، وقت التعديل) فلا يُعالج إلا مرة واحدة.
+    """
+    proxyReady = pyqtSignal(str)  # مسار الأصل
+
+    def __init__(self, db_path=None, budget=PROXY_BUDGET_BYTES, max_workers=PROXY_WORKERS):
+        super().__init__()
+        self.proxy_dir = get_cache_dir("proxies")
+        if db_path is None:
+            db_path = os.path.join(self.proxy_dir, "proxies.sqlite")
+        self.budget = budget
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._workers = []
+        self._processes = set()
+        self._stopping = False
+        self._ready = {}     # التوقيع -> مسار البروكسي
+        self._done = set()   # توقيعات تمت معالجتها بدون بروكسي (تخطٍ أو فشل)
+        self._pending = set()
+        self._touched = {}   # التوقيع -> آخر استخدام لم يُكتب بعد
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS proxies ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime INTEGER NOT NULL,"
+            " status TEXT NOT NULL,"
+            " proxy TEXT,"
+            " bytes INTEGER NOT NULL DEFAULT 0,"
+            " last_used REAL NOT NULL DEFAULT 0)"
+        )
+        self._conn.commit()
+        self._load()
+
+    def request(self, file_path):
+        """جدولة توليد بروكسي للملف إذا لم يُعالج من قبل (يُستدعى من الواجهة بدون انتظار)"""
+        try:
+            signature = file_signature(file_path)
+        except OSError:
+            return
+        with self._lock:
+            if signature in self._ready or signature in self._done or signature in self._pending:
+                return
+            self._pending.add(signature)
+        digest = hashlib.blake2b(repr(signature).encode(), digest_size=16).hexdigest()
+        self._start_workers()
+        self._queue.put((signature, os.path.join(self.proxy_dir, f"{digest}.mov")))
+
+    def proxy_path(self, file_path):
+        """مسار البروكسي الجاهز أو None"""
+        try:
+            signature = file_signature(file_path)
+        except OSError:
+            return None
+        # يُستدعى من الواجهة ومن خيط خادم الإطارات بينما يعدّل خيط التحويل نفس القواميس
+        with self._lock:
+            proxy = self._ready.get(signature)
+            if proxy is None or not os.path.exists(proxy):
+                return None
+            self._touched[signature] = time.time()
+            return proxy
+
+    def resolve_preview_path(self, file_path):
+        """الملف الذي تقرأ منه المعاينة: البروكسي إن كان جاهزاً وإلا الأصل"""
+        return self.proxy_path(file_path) or file_path
+
+    def flush(self):
+        """كتابة أوقات الاستخدام المتراكمة (تُستخدم لاختيار ما يُحذف عند تجاوز المساحة)"""
+        with self._lock:
+            touched, self._touched = self._touched, {}
+            if not touched:
+                return
+            self._conn.executemany(
+                "UPDATE proxies SET last_used = ? WHERE path = ? AND size = ? AND mtime = ?",
+                [(used, *signature) for signature, used in touched.items()])
+            self._conn.commit()
+
+    def cleanup(self):
+        """إيقاف عمليات التحويل الجارية (الملف الجزئي يُعاد توليده في التشغيل القادم)"""
+        self.flush()
+        with self._lock:
+            self._stopping = True
+            self._pending.clear()
+            processes = list(self._processes)
+        for _ in self._workers:
+            self._queue.put(None)
+        for process in processes:
+            process.kill()
+
+    def _start_workers(self):
+        if self._workers:
+            return
+        for i in range(self.max_workers):
+            worker = threading.Thread(target=self._work, name=f"ProxyWorker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _work(self):
+        """خيط يشغّل عملية تحويل واحدة في كل مرة وينتظر نتيجتها"""
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            signature, proxy_path = job
+            with self._lock:
+                if self._stopping:
+                    return
+            try:
+                process = subprocess.Popen(
+                    [sys.executable, "-m", "utils.proxy_worker", signature[0], proxy_path],
+                    cwd=PROJECT_ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                    creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+            except OSError as e:
+                self._failed(signature, proxy_path, e)
+                continue
+            with self._lock:
+                self._processes.add(process)
+            out, err = process.communicate()
+            with self._lock:
+                self._processes.discard(process)
+                if self._stopping:
+                    return
+            if process.returncode != 0:
+                lines = err.strip().splitlines()
+                self._failed(signature, proxy_path, lines[-1] if lines else f"exit code {process.returncode}")
+                continue
+            size = out.strip()
+            self._finished(signature, proxy_path, int(size) if size else None)
+
+    def _load(self):
+        rows = self._conn.execute("SELECT path, size, mtime, status, proxy FROM proxies").fetchall()
+        missing = []
+        for path, size, mtime, status, proxy in rows:
+            signature = (path, size, mtime)
+            if status != STATUS_READY:
+                self._done.add(signature)
+            elif proxy and os.path.exists(proxy):
+                self._ready[signature] = proxy
+            else:
+                missing.append(signature)
+        if missing:
+            self._conn.executemany("DELETE FROM proxies WHERE path = ? AND size = ? AND mtime = ?", missing)
+            self._conn.commit()
+
+    def _finished(self, signature, proxy_path, size):
+        # يُستدعى من خيط العامل
+        status = STATUS_READY if size is not None else STATUS_SKIPPED
+        with self._lock:
+            self._pending.discard(signature)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO proxies (path, size, mtime, status, proxy, bytes, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (*signature, status, proxy_path if size is not None else None, size or 0, time.time()))
+            self._conn.commit()
+            if size is None:
+                self._done.add(signature)
+                return
+            self._ready[signature] = proxy_path
+            self._enforce_budget(keep=signature)
+        self.proxyReady.emit(signature[0])
+
+    def _failed(self, signature, proxy_path, error):
+        print(f"Error creating proxy for {signature[0]}: {error}")
+        for path in (proxy_path, proxy_path + ".part"):
+            if os.path.exists(path):
+                os.remove(path)
+        with self._lock:
+            self._pending.discard(signature)
+            self._done.add(signature)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO proxies (path, size, mtime, status) VALUES (?, ?, ?, ?)",
+                (*signature, STATUS_FAILED))
+            self._conn.commit()
+
+    def _enforce_budget(self, keep):
+        """حذف البروكسي الأقدم استخداماً حتى يعود المجموع تحت الحد (يُستدعى مع القفل)"""
+        rows = self._conn.execute(
+            "SELECT path, size, mtime, proxy, bytes, last_used FROM proxies WHERE status = ?",
+            (STATUS_READY,)).fetchall()
+        total = sum(row[4] for row in rows)
+        rows.sort(key=lambda row: self._touched.get(row[:3], row[5]))
+        for path, size, mtime, proxy, used_bytes, _ in rows:
+            if total <= self.budget:
+                break
+            signature = (path, size, mtime)
+            if signature == keep:
+                continue
+            try:
+                if proxy and os.path.exists(proxy):
+                    os.remove(proxy)
+            except OSError:
+                # مفتوح حالياً للمعاينة: نتركه للمرة القادمة
+                continue
+            self._ready.pop(signature, None)
+            self._conn.execute("DELETE FROM proxies WHERE path = ? AND size = ? AND mtime = ?", signature)
+            total -= used_bytes
+        self._conn.commit()
+
+
+# إنشاء نسخة واحدة من ProxyManager
+proxy_manager = ProxyManager()
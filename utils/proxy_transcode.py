@@ -0,0 +1,69 @@
+import os
+
+import av
+
+# ارتفاع ملفات البروكسي بالبكسل
+PROXY_HEIGHT = 540
+# معدل البت التقريبي لفيديو البروكسي (MJPEG كل إطار فيه مفتاحي)
+PROXY_BIT_RATE = 12_000_000
+# عدد الحزم التي نقرأها لمعرفة هل الأصل طويل GOP
+GOP_SCAN_PACKETS = 120
+
+
+def lower_priority(niceness=10):
+    """تهيئة عملية التحويل بأولوية منخفضة حتى لا تنافس الواجهة والتشغيل"""
+    if hasattr(os, 'nice'):
+        try:
+            os.nice(niceness)
+        except OSError:
+            pass
+
+
+def needs_proxy(container, stream, height=PROXY_HEIGHT):
+    """البروكسي مفيد فقط للأصل الأكبر من ارتفاع البروكسي أو الذي ليست كل إطاراته مفتاحية"""
+    if stream.codec_context.height > height:
+        return True
+    for i, packet in enumerate(container.demux(stream)):
+        if i >= GOP_SCAN_PACKETS:
+            break
+        if packet.pts is not None and not packet.is_keyframe:
+            return True
+    return False
+
+
+def transcode_proxy(source_path, proxy_path, height=PROXY_HEIGHT):
+    """تحويل مسار الفيديو الأول إلى بروكسي MJPEG صغير؛ يُرجع حجم الملف الناتج أو None إذا لم يلزم
+
+    يُنفذ في عملية منفصلة. الإطارات تحتفظ بنفس pts وtime_base الأصلية فيبقى رقم وزمن
+    كل إطار في البروكسي مطابقاً للأصل، والكتابة في ملف مؤقت ثم استبداله دفعة واحدة.
+    """
+    partial = proxy_path + ".part"
+    with av.open(source_path) as source:
+        if not source.streams.video:
+            return None
+        stream = source.streams.video[0]
+        if not needs_proxy(source, stream, height):
+            return None
+        source.seek(0, stream=stream, backward=True, any_frame=False)
+        height = min(height, stream.codec_context.height) // 2 * 2
+        width = max(2, int(round(height * stream.codec_context.width / stream.codec_context.height / 2)) * 2)
+        with av.open(partial, 'w', format='mov') as proxy:
+            out = proxy.add_stream('mjpeg', rate=stream.average_rate or stream.guessed_rate or 25)
+            out.width = width
+            out.height = height
+            out.pix_fmt = 'yuvj420p'
+            out.bit_rate = PROXY_BIT_RATE
+            out.time_base = stream.time_base
+            out.codec_context.time_base = stream.time_base
+            for frame in source.decode(stream):
+                if frame.pts is None:
+                    continue
+                small = frame.reformat(width=width, height=height, format='yuvj420p', interpolation='AREA')
+                small.pts = frame.pts
+                small.time_base = frame.time_base
+                for packet in out.encode(small):
+                    proxy.mux(packet)
+            for packet in out.encode():
+                proxy.mux(packet)
+    os.replace(partial, proxy_path)
+    return os.path.getsize(proxy_path)
@@ -0,0 +1,18 @@
+"""عملية تحويل بروكسي واحدة: python -m utils.proxy_worker <الأصل> <البروكسي>
+
+نقطة دخول مستقلة حتى لا تستورد عمليات التحويل Qt أو الواجهة أو أي نسخة مشتركة؛
+تطبع حجم البروكسي الناتج، أو سطراً فارغاً إذا لم يحتج الأصل إلى بروكسي.
+"""
+import sys
+
+from utils.proxy_transcode import lower_priority, transcode_proxy
+
+
+def main(argv):
+    lower_priority()
+    size = transcode_proxy(argv[1], argv[2])
+    print("" if size is None else size)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,156 @@
+import heapq
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.clip_store import CHANGE_CLIPS, CHANGE_TRACKS
+from utils.media_probe import media_probe
+from utils.playback_engine import open_video
+
+# عدد المقاطع التالية التي تُفتح ويُفك أول إطار منها مسبقاً أثناء تشغيل المقطع الحالي
+PREROLL_CLIPS = 3
+# سماحية مقارنة الأزمنة (ثوانٍ)
+TIME_EPSILON = 1e-6
+
+
+def plan_segments(store):
+    """خطة التشغيل من نموذج المقاطع: قائمة (بداية، نهاية، المسار، الإزاحة) مرتبة بالزمن
+
+    في كل لحظة يظهر مقطع الفيديو في المسار الأعلى (الأصغر رقماً) الذي يغطيها، وزمن
+    المصدر = زمن الخط الزمني + الإزاحة. المقاطع المتجاورة من نفس الملف والمتصلة في زمن
+    المصدر (مثل ناتج القص) تُدمج في جزء واحد فيستمر الفك بدون إعادة فتح.
+    """
+    store.flush()
+    clips = store.clips
+    ids = store.alive_ids().tolist()
+    has_video = {}
+    for source in {int(clips['source'][clip]) for clip in ids}:
+        info = media_probe.probe(store.source_path(source)) or {}
+        has_video[source] = info.get('has_video', False)
+    ids = [clip for clip in ids if has_video[int(clips['source'][clip])]]
+    if not ids:
+        return []
+
+    ids.sort(key=lambda clip: clips['start'][clip])
+    bounds = sorted({float(clips['start'][clip]) for clip in ids}
+                    | {float(clips['start'][clip] + clips['duration'][clip]) for clip in ids})
+    active = []  # (المسار، رقم المقطع، النهاية): أعلى مسار في القمة
+    pending = 0
+    pieces = []
+    for a, b in zip(bounds, bounds[1:]):
+        while pending < len(ids) and clips['start'][ids[pending]] <= a + TIME_EPSILON:
+            clip = ids[pending]
+            heapq.heappush(active, (int(clips['track'][clip]), clip,
+                                    float(clips['start'][clip] + clips['duration'][clip])))
+            pending += 1
+        # إزالة المقاطع المنتهية المؤجلة عند وصولها للقمة فقط
+        while active and active[0][2] <= a + TIME_EPSILON:
+            heapq.heappop(active)
+        if not active:
+            continue
+        clip = active[0][1]
+        path = store.source_path(int(clips['source'][clip]))
+        offset = float(clips['src_in'][clip] - clips['start'][clip])
+        last = pieces[-1] if pieces else None
+        if (last is not None and last[2] == path and abs(last[1] - a) < TIME_EPSILON
+                and abs(last[3] - offset) < TIME_EPSILON):
+            pieces[-1] = (last[0], b, path, offset)
+        else:
+            pieces.append((a, b, path, offset))
+    return pieces
+
+
+class SequenceSource:
+    """مصدر تشغيل للخط الزمني كاملاً: يمشي على خطة المقاطع ويعطي (الزمن، إطار av أو None للفراغ)
+
+    أثناء تشغيل كل جزء تُفتح الأجزاء التالية في خيوط جانبية ويُفك ما قبل أول إطار منها
+    (من الإطار المفتاحي حتى نقطة الدخول)، فيبدأ الجزء التالي فوراً بدون توقف حتى مع
+    مئات القطعات القصيرة.
+    """
+
+    def __init__(self, store, frame_rate=30.0):
+        self.store = store
+        self.frame_duration = 1 / (frame_rate or 30.0)
+        self.segments = []
+        self.duration = 0.0
+        self.dirty = True
+        store.add_listener(self.on_store_changed)
+
+    def on_store_changed(self, kinds, clips):
+        if CHANGE_CLIPS in kinds or CHANGE_TRACKS in kinds:
+            self.dirty = True
+
+    def prepare(self):
+        """إعادة بناء الخطة في خيط الواجهة إذا تغير النموذج (الخيط الخلفي يقرأ نسخة ثابتة)"""
+        if self.dirty:
+            self.segments = plan_segments(self.store)
+            self.duration = self.store.end
+            self.dirty = False
+
+    def close(self):
+        self.store.remove_listener(self.on_store_changed)
+
+    def frames(self, start, is_stale, quality=1):
+        segments = self.segments
+        i = bisect_right([segment[1] for segment in segments], start + TIME_EPSILON)
+        time = start
+        prerolls = {}
+        pool = ThreadPoolExecutor(max_workers=PREROLL_CLIPS, thread_name_prefix="Preroll")
+        try:
+            while i < len(segments):
+                seg_start, seg_end, _, offset = segments[i]
+                for j in range(i + 1, min(i + 1 + PREROLL_CLIPS, len(segments))):
+                    if j not in prerolls:
+                        prerolls[j] = pool.submit(self._preroll, segments[j], segments[j][0], quality)
+                # الفراغ قبل الجزء: إطارات فارغة على شبكة الإطارات
+                while time < seg_start - TIME_EPSILON:
+                    if is_stale():
+                        return
+                    yield time, None
+                    time += self.frame_duration
+                future = prerolls.pop(i, None)
+                opened = (future.result() if future is not None
+                          else self._preroll(segments[i], max(seg_start, start), quality))
+                if opened is not None:
+                    container, first, decoded, origin = opened
+                    with container:
+                        for frame in _chain(first, decoded):
+                            if is_stale():
+                                return
+                            if frame.pts is None or frame.time is None:
+                                continue
+                            frame_time = frame.time - origin - offset
+                            if frame_time >= seg_end - TIME_EPSILON:
+                                break
+                            yield frame_time, frame
+                time = seg_end
+                i += 1
+        finally:
+            for future in prerolls.values():
+                future.cancel()
+            pool.shutdown(wait=True)
+            for future in prerolls.values():
+                if not future.cancelled() and future.exception() is None and future.result() is not None:
+                    future.result()[0].close()
+
+    def _preroll(self, segment, at, quality=1):
+        """فتح الملف والقفز وفك الإطارات حتى نقطة الدخول: (الحاوية، أول إطار، مولد الباقي، البداية)"""
+        seg_start, _, path, offset = segment
+        try:
+            opened = open_video(path, at + offset, quality)
+        except Exception as e:
+            print(f"Error opening {path} for playback: {e}")
+            return None
+        if opened is None:
+            return None
+        container, _, decoded, origin = opened
+        target = at + offset - self.frame_duration / 2
+        for frame in decoded:
+            if frame.pts is not None and frame.time is not None and frame.time - origin >= target:
+                return container, frame, decoded, origin
+        container.close()
+        return None
+
+
+def _chain(first, rest):
+    yield first
+    yield from rest
@@ -0,0 +1,108 @@
+from bisect import bisect_left, insort
+
+# سماحية مقارنة الأزمنة عند حذف حافة
+EDGE_EPSILON = 1e-6
+# مسافة الالتقاط الافتراضية بالبكسل على الشاشة
+DEFAULT_SNAP_PIXELS = 10
+
+
+class EdgeIndex:
+    """قائمة مرتبة لأزمنة الحواف (مع التكرار) للبحث عن أقرب حافة بـ bisect"""
+
+    def __init__(self, values=()):
+        self.values = sorted(values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def clear(self):
+        self.values.clear()
+
+    def add(self, time):
+        insort(self.values, time)
+
+    def remove(self, time):
+        i = bisect_left(self.values, time - EDGE_EPSILON)
+        if i < len(self.values) and abs(self.values[i] - time) <= EDGE_EPSILON:
+            del self.values[i]
+
+    def nearest(self, time, tolerance, exclude=()):
+        """أقرب حافة إلى time ضمن tolerance أو None؛ exclude حواف تُتجاهل (مرة لكل قيمة)"""
+        values = self.values
+        skip = list(exclude)
+        best = None
+        best_distance = tolerance
+        i = bisect_left(values, time)
+
+        # البحث للأمام ثم للخلف حتى تتجاوز المسافة السماحية
+        for step, index in ((1, i), (-1, i - 1)):
+            while 0 <= index < len(values):
+                value = values[index]
+                distance = abs(value - time)
+                if distance > best_distance:
+                    break
+                excluded = next((e for e in skip if abs(e - value) <= EDGE_EPSILON), None)
+                if excluded is not None:
+                    skip.remove(excluded)
+                else:
+                    if best is None or distance < best_distance:
+                        best, best_distance = value, distance
+                    break
+                index += step
+        return best
+
+
+class SnapEngine:
+    """الالتقاط المغناطيسي لحواف المقاطع والعلامات ومؤشر التشغيل"""
+
+    def __init__(self, tolerance_pixels=DEFAULT_SNAP_PIXELS):
+        self.enabled = True
+        self.tolerance_pixels = tolerance_pixels
+        self.track_indexes = []  # TrackIndex لكل مسار (حواف المقاطع تُقرأ من شجرته مباشرة)
+        self.markers = EdgeIndex()
+        self.playhead = None
+
+    def set_tracks(self, track_indexes):
+        self.track_indexes = list(track_indexes)
+
+    def set_playhead(self, time):
+        self.playhead = time
+
+    def add_marker(self, time):
+        self.markers.add(time)
+
+    def remove_marker(self, time):
+        self.markers.remove(time)
+
+    def nearest(self, time, tolerance, exclude=()):
+        """أقرب نقطة التقاط إلى time ضمن tolerance أو None"""
+        candidates = [index.nearest_edge(time, tolerance, exclude) for index in self.track_indexes]
+        candidates.append(self.markers.nearest(time, tolerance))
+        if self.playhead is not None and abs(self.playhead - time) <= tolerance:
+            candidates.append(self.playhead)
+        candidates = [c for c in candidates if c is not None]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda c: abs(c - time))
+
+    def snap(self, time, tolerance, exclude=()):
+        if not self.enabled:
+            return time
+        target = self.nearest(time, tolerance, exclude)
+        return time if target is None else target
+
+    def snap_clip(self, start, duration, tolerance, exclude=()):
+        """بداية جديدة للمقطع بحيث تلتقط بدايته أو نهايته أقرب حافة"""
+        if not self.enabled:
+            return start
+        end = start + duration
+        snapped_start = self.nearest(start, tolerance, exclude)
+        snapped_end = self.nearest(end, tolerance, exclude)
+        options = []
+        if snapped_start is not None:
+            options.append((abs(snapped_start - start), snapped_start))
+        if snapped_end is not None:
+            options.append((abs(snapped_end - end), snapped_end - duration))
+        if not options:
+            return start
+        return max(0.0, min(options)[1])
@@ -1,29 +1,138 @@
-from PyQt5.QtCore import QThread, QObject, pyqtSignal
+from PyQt5.QtCore import QThread, QObject, QRunnable, QThreadPool, pyqtSignal
+import os
+import threading
 import weakref
 
+# أولويات المهام (الأعلى يُنفذ أولاً)
+PRIORITY_LOW = 0
+PRIORITY_NORMAL = 5
+PRIORITY_VISIBLE = 10
+
+
+class JobSignals(QObject):
+    """إشارات المهمة (تصل إلى خيط الواجهة عبر اتصال مؤجل)"""
+    finished = pyqtSignal(object, object)  # المفتاح، النتيجة
+    failed = pyqtSignal(object, str)       # المفتاح، رسالة الخطأ
+    progress = pyqtSignal(object, object)  # المفتاح، نتيجة جزئية
+    done = pyqtSignal(object)              # المهمة نفسها (للتنظيف الداخلي)
+
+
+class Job(QRunnable):
+    """مهمة قابلة للإلغاء التعاوني: الدالة تستقبل المهمة وتتحقق من is_cancelled() بين الخطوات"""
+
+    def __init__(self, key, func, args=(), priority=PRIORITY_NORMAL):
+        super().__init__()
+        # Python هو من يملك المهمة وليس QThreadPool
+        self.setAutoDelete(False)
+        self.key = key
+        self.func = func
+        self.args = args
+        self.priority = priority
+        self.signals = JobSignals()
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        """طلب إيقاف المهمة (لا نستخدم terminate حتى لا نفسد حالة المفكك)"""
+        self._cancelled.set()
+
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    def report(self, value):
+        """إرسال نتيجة جزئية إلى الواجهة قبل انتهاء المهمة"""
+        if not self.is_cancelled():
+            self.signals.progress.emit(self.key, value)
+
+    def run(self):
+        try:
+            if self.is_cancelled():
+                return
+            try:
+                result = self.func(self, *self.args)
+            except Exception as e:
+                if not self.is_cancelled():
+                    self.signals.failed.emit(self.key, str(e))
+                return
+            if not self.is_cancelled():
+                self.signals.finished.emit(self.key, result)
+        finally:
+            self.signals.done.emit(self)
+
+
 class ThreadManager(QObject):
     def __init__(self):
         super().__init__()
         self.threads = weakref.WeakSet()
-    
+
+        # مجمع خيوط مشترك بعدد أنوية المعالج
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(os.cpu_count() or 2)
+        self.jobs = {}  # المفتاح -> المهمة
+        self.cancelled_jobs = set()  # مهام أُلغيت أثناء تنفيذها (نحتفظ بها حتى تنتهي)
+
     def add_thread(self, thread):
         """إضافة خيط للمتابعة"""
         self.threads.add(thread)
         thread.finished.connect(lambda: self.remove_thread(thread))
-    
+
     def remove_thread(self, thread):
         """إزالة خيط من المتابعة"""
         if thread in self.threads:
             self.threads.discard(thread)
-    
+
+    def submit(self, key, func, *args, priority=PRIORITY_NORMAL,
+               on_finished=None, on_failed=None, on_progress=None):
+        """جدولة مهمة في المجمع المشترك؛ المهمة السابقة بنفس المفتاح تُلغى"""
+        self.cancel(key)
+        job = Job(key, func, args, priority)
+        # الربط قبل البدء حتى لا تضيع نتيجة مهمة تنتهي بسرعة
+        if on_finished is not None:
+            job.signals.finished.connect(on_finished)
+        if on_failed is not None:
+            job.signals.failed.connect(on_failed)
+        if on_progress is not None:
+            job.signals.progress.connect(on_progress)
+        job.signals.done.connect(self._job_done)
+        self.jobs[key] = job
+        self.pool.start(job, priority)
+        return job
+
+    def cancel(self, key):
+        """إلغاء مهمة: تُحذف من الطابور إن لم تبدأ، وإلا تتوقف عند أول نقطة تحقق"""
+        job = self.jobs.pop(key, None)
+        if job is not None:
+            job.cancel()
+            if not self.pool.tryTake(job):
+                self.cancelled_jobs.add(job)
+
+    def set_priority(self, key, priority):
+        """تغيير أولوية مهمة ما زالت في الطابور"""
+        job = self.jobs.get(key)
+        if job is None or job.priority == priority:
+            return
+        job.priority = priority
+        # إعادة إدراج المهمة فقط إذا لم تبدأ بعد
+        if self.pool.tryTake(job):
+            self.pool.start(job, priority)
+
+    def _job_done(self, job):
+        self.cancelled_jobs.discard(job)
+        if self.jobs.get(job.key) is job:
+            del self.jobs[job.key]
+
     def cleanup_all(self):
         """تنظيف جميع الخيوط"""
+        for key in list(self.jobs):
+            self.cancel(key)
+        self.pool.clear()
+        self.pool.waitForDone(2000)
+
         for thread in list(self.threads):
             if thread.isRunning():
                 thread.quit()
                 thread.wait(1000)
-        
+
         self.threads.clear()
 
 # إنشاء نسخة واحدة من ThreadManager
-thread_manager = ThreadManager()
\ No newline at end of file
+thread_manager = ThreadManager()
@@ -0,0 +1,150 @@
+import os
+import time
+import sqlite3
+import threading
+
+from PyQt5.QtCore import QSettings
+
+from utils.cache_utils import get_cache_dir, file_signature, content_fingerprint
+
+# الحجم الافتراضي المسموح به للكاش على القرص (بالميغابايت)
+DEFAULT_BUDGET_MB = 256
+# عند تجاوز الحد نحذف حتى نصل إلى هذه النسبة منه لتفادي الحذف المتكرر
+EVICT_TARGET = 0.9
+# عدد مرات الوصول التي نجمعها في الذاكرة قبل كتابتها إلى القاعدة
+TOUCH_FLUSH_COUNT = 64
+
+
+class ThumbnailCache:
+    """مخزن دائم للصور المصغرة مفهرس ببصمة المحتوى، محدود الحجم مع حذف الأقدم استخداماً (LRU)
+
+    يخزن أيضاً أهرام قمم الصوت (utils/peak_pyramid.py) فيشترك الاثنان في نفس الحد.
+    """
+
+    def __init__(self, db_path=None, max_bytes=None):
+        if db_path is None:
+            db_path = os.path.join(get_cache_dir(), "thumbnails.sqlite")
+        if max_bytes is None:
+            budget_mb = QSettings("PyVideoEditor", "App").value(
+                "thumbnail_cache_mb", DEFAULT_BUDGET_MB, type=int)
+            max_bytes = budget_mb * 1024 * 1024
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._pending_touches = {}
+
+        # كل الصور تُحفظ داخل ملف قاعدة بيانات واحد بدلاً من آلاف الملفات الصغيرة
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS thumbnails ("
+            " key TEXT PRIMARY KEY,"
+            " data BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS thumbnails_last_used ON thumbnails (last_used)")
+        # تخزين البصمات حتى لا نعيد قراءة الملف عند كل تشغيل
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime INTEGER NOT NULL,"
+            " fingerprint TEXT NOT NULL)"
+        )
+        self._conn.commit()
+        self.total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM thumbnails").fetchone()[0]
+
+    def make_key(self, file_path, width, height, kind="icon"):
+        """مفتاح الصورة المصغرة: بصمة المحتوى + أبعاد ونوع الصورة"""
+        return f"{self.fingerprint(file_path)}:{kind}:{width}x{height}"
+
+    def fingerprint(self, file_path):
+        """بصمة الملف من الكاش إن لم يتغير الحجم أو وقت التعديل"""
+        path, size, mtime = file_signature(file_path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fingerprint FROM fingerprints WHERE path = ? AND size = ? AND mtime = ?",
+                (path, size, mtime)
+            ).fetchone()
+        if row:
+            return row[0]
+
+        fingerprint = content_fingerprint(path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO fingerprints (path, size, mtime, fingerprint) VALUES (?, ?, ?, ?)",
+                (path, size, mtime, fingerprint)
+            )
+            self._conn.commit()
+        return fingerprint
+
+    def get(self, key):
+        """إرجاع بيانات الصورة (bytes) أو None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM thumbnails WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._pending_touches[key] = time.time()
+            if len(self._pending_touches) >= TOUCH_FLUSH_COUNT:
+                self._flush_touches()
+        return bytes(row[0])
+
+    def put(self, key, data):
+        """حفظ بيانات الصورة ثم حذف الأقدم استخداماً إذا تجاوزنا الحد"""
+        with self._lock:
+            old = self._conn.execute(
+                "SELECT size FROM thumbnails WHERE key = ?", (key,)).fetchone()
+            if old:
+                self.total_bytes -= old[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO thumbnails (key, data, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, sqlite3.Binary(data), len(data), time.time())
+            )
+            self.total_bytes += len(data)
+            self._flush_touches()
+            if self.total_bytes > self.max_bytes:
+                self._evict(int(self.max_bytes * EVICT_TARGET))
+            self._conn.commit()
+
+    def flush(self):
+        """كتابة أوقات الاستخدام المؤجلة إلى القاعدة"""
+        with self._lock:
+            self._flush_touches()
+            self._conn.commit()
+
+    def clear(self):
+        """حذف كل الصور المصغرة"""
+        with self._lock:
+            self._pending_touches.clear()
+            self._conn.execute("DELETE FROM thumbnails")
+            self._conn.commit()
+            self._conn.execute("VACUUM")
+            self.total_bytes = 0
+
+    def _flush_touches(self):
+        if self._pending_touches:
+            self._conn.executemany(
+                "UPDATE thumbnails SET last_used = ? WHERE key = ?",
+                [(t, k) for k, t in self._pending_touches.items()]
+            )
+            self._pending_touches.clear()
+
+    def _evict(self, target_bytes):
+        """حذف الصور الأقدم استخداماً حتى يصبح الحجم أقل من target_bytes"""
+        rows = self._conn.execute(
+            "SELECT key, size FROM thumbnails ORDER BY last_used ASC")
+        removed = []
+        for key, size in rows:
+            if self.total_bytes <= target_bytes:
+                break
+            removed.append((key,))
+            self.total_bytes -= size
+        self._conn.executemany("DELETE FROM thumbnails WHERE key = ?", removed)
+
+
+# إنشاء نسخة واحدة من ThumbnailCache
+thumbnail_cache = ThumbnailCache()
@@ -0,0 +1,364 @@
+import random
+
+# سماحية مقارنة الأزمنة (أخطاء التقريب في جمع الأعداد العشرية)
+EPSILON = 1e-6
+
+
+class _Node:
+    __slots__ = ('start', 'end', 'item', 'priority', 'left', 'right', 'parent',
+                 'min_start', 'max_end', 'max_gap', 'count', 'shift')
+
+    def __init__(self, start, end, item):
+        self.start = start
+        self.end = end
+        self.item = item
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+        self.parent = None
+        self.min_start = start
+        self.max_end = end
+        self.max_gap = 0.0
+        self.count = 1
+        # إزاحة مؤجلة لم تُطبق بعد على الأبناء
+        self.shift = 0.0
+
+
+def _apply(node, delta):
+    """إزاحة شجرة فرعية كاملة: تُطبق على الجذر فوراً وتؤجل للأبناء"""
+    node.start += delta
+    node.end += delta
+    node.min_start += delta
+    node.max_end += delta
+    node.shift += delta
+
+
+def _push(node):
+    """تمرير الإزاحة المؤجلة إلى الأبناء قبل قراءتهم أو تعديلهم"""
+    if node.shift:
+        if node.left is not None:
+            _apply(node.left, node.shift)
+        if node.right is not None:
+            _apply(node.right, node.shift)
+        node.shift = 0.0
+
+
+def _update(node):
+    """إعادة حساب معلومات الشجرة الفرعية من الأبناء"""
+    left, right = node.left, node.right
+    max_end = node.end
+    max_gap = 0.0
+    count = 1
+    node.min_start = node.start
+    if left is not None:
+        left.parent = node
+        node.min_start = left.min_start
+        max_gap = max(left.max_gap, node.start - left.max_end)
+        max_end = max(max_end, left.max_end)
+        count += left.count
+    if right is not None:
+        right.parent = node
+        max_gap = max(max_gap, right.max_gap, right.min_start - max_end)
+        max_end = max(max_end, right.max_end)
+        count += right.count
+    node.max_end = max_end
+    node.max_gap = max_gap
+    node.count = count
+
+
+def _merge(a, b):
+    """دمج شجرتين كل مفاتيح a فيها قبل مفاتيح b"""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if a.priority > b.priority:
+        _push(a)
+        a.right = _merge(a.right, b)
+        _update(a)
+        return a
+    _push(b)
+    b.left = _merge(a, b.left)
+    _update(b)
+    return b
+
+
+def _split(node, start):
+    """تقسيم الشجرة إلى (بدايات < start، بدايات >= start)"""
+    if node is None:
+        return None, None
+    _push(node)
+    if node.start < start:
+        node.right, right = _split(node.right, start)
+        _update(node)
+        if right is not None:
+            right.parent = None
+        return node, right
+    left, node.left = _split(node.left, start)
+    _update(node)
+    if left is not None:
+        left.parent = None
+    return left, node
+
+
+class TrackIndex:
+    """فهرس مقاطع مسار واحد مرتب بالبداية (treap) مع أكبر فراغ في كل شجرة فرعية
+
+    كل العمليات O(log n): إيجاد أول فراغ يتسع لمدة معينة، المقاطع المتقاطعة مع مدى،
+    والمقطع عند زمن معين. الأزمنة بالثواني. حواف المقاطع للالتقاط تُقرأ من نفس الشجرة
+    (nearest_edge) فلا يوجد فهرس حواف منفصل يُحدّث أو يُعاد بناؤه.
+
+    عمليات الـ ripple تزيح كل المقاطع بعد نقطة معينة بإزاحة مؤجلة على جذر الشجرة
+    الفرعية بدلاً من تعديل كل مقطع، فتبقى O(log n) مهما طال المسار.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.nodes = {}  # المقطع -> العقدة (أي قيمة قابلة للتجزئة، مثل رقم المقطع)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __iter__(self):
+        """المقاطع بترتيب البداية"""
+        stack = []
+        node = self.root
+        while stack or node is not None:
+            while node is not None:
+                _push(node)
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.item
+            node = node.right
+
+    def spans(self):
+        """(المقطع، البداية، النهاية) بترتيب البداية مع تطبيق الإزاحات المؤجلة"""
+        for node in self._iter_nodes():
+            yield node.item, node.start, node.end
+
+    def _iter_nodes(self):
+        stack = []
+        node = self.root
+        while stack or node is not None:
+            while node is not None:
+                _push(node)
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node
+            node = node.right
+
+    def __contains__(self, item):
+        return item in self.nodes
+
+    @property
+    def end(self):
+        """نهاية آخر مقطع في المسار"""
+        return self.root.max_end if self.root is not None else 0.0
+
+    def clear(self):
+        self.root = None
+        self.nodes.clear()
+
+    def insert(self, item, start, duration):
+        if item in self.nodes:
+            self.remove(item)
+        node = _Node(start, start + duration, item)
+        self.nodes[item] = node
+        self._insert_node(node)
+
+    def _insert_node(self, node):
+        left, right = _split(self.root, node.start)
+        self.root = _merge(_merge(left, node), right)
+        self.root.parent = None
+
+    def remove(self, item):
+        node = self.nodes.pop(item, None)
+        if node is None:
+            return
+        # تطبيق الإزاحات المؤجلة على المسار من الجذر حتى العقدة
+        path = []
+        ancestor = node
+        while ancestor is not None:
+            path.append(ancestor)
+            ancestor = ancestor.parent
+        for ancestor in reversed(path):
+            _push(ancestor)
+        # استبدال العقدة بدمج ابنيها ثم تحديث المسار حتى الجذر فقط
+        replacement = _merge(node.left, node.right)
+        parent = node.parent
+        if replacement is not None:
+            replacement.parent = parent
+        if parent is None:
+            self.root = replacement
+        else:
+            if parent.left is node:
+                parent.left = replacement
+            else:
+                parent.right = replacement
+            while parent is not None:
+                _update(parent)
+                parent = parent.parent
+        node.left = node.right = node.parent = None
+
+    def move(self, item, start):
+        """تغيير بداية مقطع مع الاحتفاظ بمدته"""
+        current = self.start_of(item)
+        if current is None or abs(current - start) <= EPSILON:
+            return
+        duration = self.end_of(item) - current
+        self.remove(item)
+        self.insert(item, start, duration)
+
+    def _pending_shift(self, node):
+        """مجموع الإزاحات المؤجلة عند أسلاف العقدة"""
+        shift = 0.0
+        ancestor = node.parent
+        while ancestor is not None:
+            shift += ancestor.shift
+            ancestor = ancestor.parent
+        return shift
+
+    def start_of(self, item):
+        node = self.nodes.get(item)
+        return node.start + self._pending_shift(node) if node is not None else None
+
+    def end_of(self, item):
+        node = self.nodes.get(item)
+        return node.end + self._pending_shift(node) if node is not None else None
+
+    def shift_from(self, time, delta):
+        """إزاحة كل المقاطع التي تبدأ عند time أو بعده بمقدار delta"""
+        if not delta or self.root is None:
+            return
+        left, right = _split(self.root, time - EPSILON)
+        if right is None:
+            return
+        _apply(right, delta)
+        middle = None
+        if delta < 0:
+            # المقاطع المتداخلة التي تبدأ بين time + delta و time ستسبقها المقاطع المزاحة؛
+            # نعيد إدراجها منفردة حتى يبقى الترتيب صحيحاً (في مسار بدون تداخل تكون فارغة)
+            left, middle = _split(left, time + delta - EPSILON)
+        self.root = _merge(left, right)
+        self.root.parent = None
+        if middle is not None:
+            stack = [middle]
+            nodes = []
+            while stack:
+                node = stack.pop()
+                _push(node)
+                stack.extend(child for child in (node.left, node.right) if child is not None)
+                nodes.append(node)
+            for node in nodes:
+                node.left = node.right = node.parent = None
+                _update(node)
+                self._insert_node(node)
+
+    def ripple_insert(self, item, start, duration):
+        """إدراج مقطع وإزاحة كل ما بعده بمدته"""
+        self.shift_from(start, duration)
+        self.insert(item, start, duration)
+
+    def ripple_delete(self, item):
+        """حذف مقطع وسحب كل ما بعده لملء مكانه"""
+        start, end = self.start_of(item), self.end_of(item)
+        if start is None:
+            return
+        self.remove(item)
+        self.shift_from(end, start - end)
+
+    def ripple_trim(self, item, duration):
+        """تغيير مدة مقطع من نهايته مع إزاحة ما بعده بنفس الفرق"""
+        start, end = self.start_of(item), self.end_of(item)
+        if start is None:
+            return
+        self.remove(item)
+        self.shift_from(end, start + duration - end)
+        self.insert(item, start, duration)
+
+    def find_gap(self, duration, after=0.0):
+        """أول بداية >= after يتسع بعدها فراغ بطول duration (أو نهاية المسار)"""
+        position = self._find_gap(self.root, after, duration - EPSILON, after)
+        if position is None:
+            return max(after, self.end)
+        return position
+
+    def _find_gap(self, node, prev_end, duration, after):
+        if node is None:
+            return None
+        _push(node)
+        left = node.left
+        if left is not None and left.max_end > after:
+            if left.min_start - prev_end >= duration:
+                return prev_end
+            if left.max_gap >= duration:
+                found = self._find_gap(left, prev_end, duration, after)
+                if found is not None:
+                    return found
+            prev_end = max(prev_end, left.max_end)
+        if node.end > after:
+            if node.start - prev_end >= duration:
+                return prev_end
+            prev_end = max(prev_end, node.end)
+        right = node.right
+        if right is not None:
+            if right.min_start - prev_end >= duration:
+                return prev_end
+            if right.max_gap >= duration:
+                return self._find_gap(right, prev_end, duration, after)
+        return None
+
+    def overlapping(self, start, end):
+        """المقاطع التي تتقاطع مع [start, end) بترتيب البداية"""
+        nodes = []
+        self._collect(self.root, start, end, nodes)
+        return [node.item for node in nodes]
+
+    def nearest_edge(self, time, tolerance, exclude=()):
+        """أقرب بداية أو نهاية مقطع إلى time ضمن tolerance أو None؛ exclude حواف تُتجاهل (مرة لكل قيمة)
+
+        كل حافة ضمن السماحية لمقطع يتقاطع مع النافذة حول time، فالبحث O(log n + k)
+        ويقرأ الإزاحات المؤجلة أثناء النزول بدون إعادة بناء شيء بعد الـ ripple.
+        """
+        nodes = []
+        self._collect(self.root, time - tolerance - EPSILON, time + tolerance + EPSILON, nodes)
+        skip = list(exclude)
+        for distance, value in sorted((abs(v - time), v) for node in nodes for v in (node.start, node.end)):
+            if distance > tolerance:
+                break
+            excluded = next((e for e in skip if abs(e - value) <= EPSILON), None)
+            if excluded is None:
+                return value
+            skip.remove(excluded)
+        return None
+
+    def _collect(self, node, start, end, result):
+        # تجاهل الشجرة الفرعية كاملة إذا كانت خارج المدى
+        if node is None or node.min_start >= end or node.max_end <= start:
+            return
+        _push(node)
+        self._collect(node.left, start, end, result)
+        if node.start < end and node.end > start:
+            result.append(node)
+        if node.start < end:
+            self._collect(node.right, start, end, result)
+
+    def at(self, time):
+        """المقطع الذي يغطي الزمن time أو None"""
+        node = self.root
+        found = None
+        # آخر مقطع يبدأ قبل time أو عنده
+        while node is not None:
+            _push(node)
+            if node.start <= time:
+                found = node
+                node = node.right
+            else:
+                node = node.left
+        if found is not None and found.end > time:
+            return found.item
+        # في حال تداخل المقاطع قد يغطي الزمن مقطع أسبق
+        items = self.overlapping(time, time + 1e-9)
+        return items[-1] if items else None